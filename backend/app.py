@@ -1,6 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import json
 import os
+import re
+import shutil
+import tempfile
 
 app = Flask(__name__)
 CORS(app, origins=["*"])
@@ -8,76 +12,352 @@ CORS(app, origins=["*"])
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-from parsers.slx_parser import parse_slx
-from parsers.mdl_parser import parse_mdl
-from parsers.pdf_parser import parse_pdf
-from parsers.image_parser import parse_image
-from converter.c_code_generator import generate_c_code
+# Uploads are parsed from memory; larger ones are streamed to a temp file
+SPILL_BYTES = int(os.environ.get('SIMTOC_SPILL_BYTES', 32 * 1024 * 1024))
+SPILL_CHUNK = 1024 * 1024
+
+from pipeline import (PARSERS, VERSION, convert_file, convert_incremental, diff_snapshots,
+                      parse_model, diagram_summary, schedule_summary)
+from converter.c_code_generator import iter_c_code
+from converter.targets import target_for
+from parsers.source import sniff
+from cache import cache_from_env
+from jobs import runner_from_env
+from batch import iter_batch
+from bench import ENABLED as BENCH_ENABLED, check_bench_args, submit_bench
+import metrics
+from metrics import stage
+
+cache = cache_from_env(VERSION)
+jobs  = runner_from_env(UPLOAD_FOLDER, cache)
+
+# Incremental conversions keep a codegen snapshot next to the cached result,
+# streamed ones the diagram half of the result
+CACHE_ID        = re.compile(r'^[0-9a-f]{64}$')
+SNAPSHOT_SUFFIX = '.ir'
+DIAGRAM_SUFFIX  = '.diagram'
+SUMMARY_KEYS    = ('diagram', 'block_count', 'connection_count')
+
+# generate_c_code() flags accepted as query/form fields (`batch=1`)
+CODEGEN_FLAGS = ('batch', 'openmp', 'optimize')
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'running', 'message': 'SimToC backend is live!'})
 
-@app.route('/convert', methods=['POST'])
-def convert():
+def _spill(file):
+    # The upload's bytes when the request is at most SPILL_BYTES, otherwise
+    # the path of a temp file it is copied to in chunks, freshly named so
+    # concurrent uploads never share it and removed when the request ends;
+    # parsers, the cache and batches take either
+    size = request.content_length
+    if size is not None and size <= SPILL_BYTES:
+        return file.read()
+    with stage('save'):
+        fd, path = tempfile.mkstemp(dir=UPLOAD_FOLDER)
+        g.setdefault('spilled', []).append(path)
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(file.stream, f, SPILL_CHUNK)
+    return path
+
+def _read_upload():
+    # -> (upload, filename, ext, None) or (None, None, None, error response)
     if 'file' not in request.files:
-        return jsonify({'error': 'No file uploaded'}), 400
+        return None, None, None, (jsonify({'error': 'No file uploaded'}), 400)
 
     file = request.files['file']
     filename = file.filename
 
     if not filename:
-        return jsonify({'error': 'Empty filename'}), 400
+        return None, None, None, (jsonify({'error': 'Empty filename'}), 400)
+
+    upload = _spill(file)
+
+    # The contents decide the type; the extension only for what has no
+    # recognizable signature
+    ext = sniff(upload) or filename.rsplit('.', 1)[-1].lower()
+    if ext not in PARSERS:
+        return None, None, None, (jsonify({'error': f'Unsupported file type: .{ext}'}), 400)
+    if not isinstance(upload, bytes):
+        # Named for its type, which some readers (fitz) go by
+        named = f'{upload}.{ext}'
+        os.replace(upload, named)
+        g.spilled[-1] = upload = named
+
+    return upload, filename, ext, None
+
+@app.teardown_request
+def _remove_spilled(exc):
+    for path in g.pop('spilled', ()):
+        try:
+            os.remove(path)
+        except OSError:
+            pass        # moved into a job, or already gone
 
-    ext = filename.rsplit('.', 1)[-1].lower()
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
+@app.route('/convert', methods=['POST'])
+def convert():
+    timings, token = metrics.begin()
+    try:
+        with stage('upload'):
+            data, _, ext, err = _read_upload()
+        if err:
+            return err
+
+        options = _codegen_options()
+        if options.get('openmp') and not options.get('batch'):
+            return jsonify({'error': 'openmp=1 requires batch=1'}), 400
+        if 'target' in options:
+            try:
+                target_for(options['target'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        try:
+            bench = _bench_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if bench and not BENCH_ENABLED:
+            return jsonify({'error': 'bench=1 is disabled on this server'}), 403
+
+        if request.args.get('stream') == '1':
+            if bench:
+                return jsonify({'error': 'bench=1 is not supported with stream=1'}), 400
+            return _convert_stream(data, ext, cache.key_for(data, ext, options),
+                                   timings, options)
+
+        previous = request.values.get('previous')
+        if previous is not None or request.values.get('incremental') == '1':
+            if 'target' in options:
+                return jsonify({'error': f"Incremental conversion does not support "
+                                         f"target={options['target']}"}), 400
+            if options:
+                return jsonify({'error': f"Incremental conversion does not support "
+                                         f"{next(iter(options))}=1"}), 400
+            return _convert_incremental(data, ext, cache.key_for(data, ext),
+                                        previous, timings, bench)
 
+        with stage('cache'):
+            key = cache.key_for(data, ext, options)
+            cached = cache.get(key)
+        if cached is not None:
+            cached = _with_bench(cached, bench)
+            with stage('serialize'):
+                resp = jsonify(cached)
+            resp.headers['X-Cache'] = 'HIT'
+            return _timed(resp, ext, timings, 'cache_hit', cached.get('block_count'))
+
+        try:
+            result = convert_file(data, ext, options=options)
+        except Exception as e:
+            metrics.observe(ext, timings, 'error')
+            return jsonify({'error': str(e)}), 500
+
+        cache.put(key, result)
+        result = _with_bench(result, bench)
+        with stage('serialize'):
+            resp = jsonify(result)
+        resp.headers['X-Cache'] = 'MISS'
+        return _timed(resp, ext, timings, 'ok', result['block_count'])
+    finally:
+        metrics.end(token)
+
+def _codegen_options():
+    options = {flag: True for flag in CODEGEN_FLAGS if request.values.get(flag) == '1'}
+    target = request.values.get('target', 'double')
+    if target != 'double':
+        options['target'] = target
+    return options
+
+def _bench_options():
+    # -> (opt, iterations) when bench=1, else None; ValueError for bad values
+    if request.values.get('bench') != '1':
+        return None
     try:
-        if ext == 'slx':
-            blocks, connections = parse_slx(filepath)
-        elif ext == 'mdl':
-            blocks, connections = parse_mdl(filepath)
-        elif ext == 'pdf':
-            blocks, connections = parse_pdf(filepath)
-        elif ext in ['png', 'jpg', 'jpeg', 'bmp']:
-            blocks, connections = parse_image(filepath)
-        else:
-            return jsonify({'error': f'Unsupported file type: .{ext}'}), 400
-
-        c_code = generate_c_code(blocks, connections)
-
-        diagram_data = {
-            'blocks': [
-                {
-                    'id': str(b['id']),
-                    'type': b['type'],
-                    'name': b['name'],
-                    'x': float(b.get('x', 0)),
-                    'y': float(b.get('y', 0))
-                }
-                for b in blocks
-            ],
-            'connections': [
-                {'from': str(c.get('from', '')), 'to': str(c.get('to', ''))}
-                for c in connections
-            ]
-        }
-
-        return jsonify({
-            'success': True,
-            'c_code': c_code,
-            'diagram': diagram_data,
-            'block_count': len(blocks),
-            'connection_count': len(connections)
-        })
+        iterations = int(request.values.get('iterations', 100000))
+    except ValueError:
+        raise ValueError('iterations must be an integer')
+    return check_bench_args(request.values.get('opt', '2'), iterations), iterations
+
+def _with_bench(result, bench):
+    # A copy of result with the compile-and-run figures under 'bench'; these
+    # depend on the host, so they are never cached
+    if not bench:
+        return result
+    result = dict(result)
+    with stage('bench'):
+        future = submit_bench(result['c_code'], *bench)
+        if future is None:
+            result['bench'] = {'error': 'Too many pending benchmarks, retry later'}
+            return result
+        try:
+            result['bench'] = future.result()
+        except (RuntimeError, ValueError) as e:
+            result['bench'] = {'error': str(e)}
+    return result
 
+def _convert_incremental(data, ext, key, previous, timings, bench=None):
+    # Regenerates against the snapshot kept for `previous` (the cache_id of
+    # an earlier incremental conversion) and stores this conversion's own
+    # snapshot so it can serve as the next baseline.
+    if previous is not None and not CACHE_ID.match(previous):
+        return jsonify({'error': 'Invalid previous cache_id'}), 400
+
+    with stage('cache'):
+        base     = cache.get(previous + SNAPSHOT_SUFFIX) if previous else None
+        cached   = cache.get(key)
+        snapshot = cache.get(key + SNAPSHOT_SUFFIX)
+
+    if cached is not None and snapshot is not None:
+        result, outcome = dict(cached), 'cache_hit'
+        if base is not None:
+            with stage('diff'):
+                result['diff'] = diff_snapshots(base, snapshot)
+    else:
+        try:
+            result, snapshot = convert_incremental(data, ext, base)
+        except Exception as e:
+            metrics.observe(ext, timings, 'error')
+            return jsonify({'error': str(e)}), 500
+        cache.put(key, {k: v for k, v in result.items() if k != 'diff'})
+        cache.put(key + SNAPSHOT_SUFFIX, snapshot)
+        outcome = 'ok'
+
+    result['cache_id'] = key
+    if previous is not None and base is None:
+        result['diff'] = None       # unknown or evicted baseline: full regeneration
+    result = _with_bench(result, bench)
+    with stage('serialize'):
+        resp = jsonify(result)
+    resp.headers['X-Cache'] = 'HIT' if outcome == 'cache_hit' else 'MISS'
+    return _timed(resp, ext, timings, outcome, result['block_count'])
+
+def _convert_stream(data, ext, key, timings, options):
+    # The C source is sent as it is generated; diagram and counts are kept
+    # in the cache for GET /convert/<cache_id>/diagram. Parsing happens before
+    # the response starts so parse errors still get a JSON 500.
+    with stage('cache'):
+        cached = cache.get(key)
+
+    if cached is not None:
+        chunks  = [cached['c_code']]
+        summary = {k: cached[k] for k in SUMMARY_KEYS}
+        outcome = 'cache_hit'
+    else:
+        try:
+            model = parse_model(data, ext)
+            summary = diagram_summary(model)
+        except Exception as e:
+            metrics.observe(ext, timings, 'error')
+            return jsonify({'error': str(e)}), 500
+        cache.put(key + DIAGRAM_SUFFIX, summary)
+        chunks  = iter_c_code(model, **options)
+        outcome = 'stream'
+
+    resp = Response(stream_with_context(chunks), mimetype='text/x-csrc')
+    resp.headers['X-Cache']       = 'HIT' if outcome == 'cache_hit' else 'MISS'
+    resp.headers['X-Cache-Id']    = key
+    resp.headers['X-Block-Count'] = str(summary['block_count'])
+    resp.headers['Link']          = f'</convert/{key}/diagram>; rel="related"'
+    return _timed(resp, ext, timings, outcome, summary['block_count'])
+
+@app.route('/convert/<cache_id>/diagram', methods=['GET'])
+def convert_diagram(cache_id):
+    if not CACHE_ID.match(cache_id):
+        return jsonify({'error': 'Invalid cache_id'}), 400
+    summary = cache.get(cache_id + DIAGRAM_SUFFIX)
+    if summary is None:
+        result = cache.get(cache_id)
+        if result is not None:
+            summary = {k: result[k] for k in SUMMARY_KEYS}
+    if summary is None:
+        return jsonify({'error': 'Unknown or expired conversion'}), 404
+    return jsonify(summary)
+
+@app.route('/schedule', methods=['POST'])
+def model_schedule():
+    # The block order generated code evaluates in, for tools that want to
+    # follow the same schedule
+    data, _, ext, err = _read_upload()
+    if err:
+        return err
+    try:
+        result = schedule_summary(parse_model(data, ext))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    return jsonify(result)
 
-    finally:
-        if os.path.exists(filepath):
-            os.remove(filepath)
+def _timed(resp, ext, timings, outcome, block_count):
+    if timings is not None:
+        resp.headers['Server-Timing'] = metrics.server_timing(timings)
+        metrics.observe(ext, timings, outcome, block_count)
+    return resp
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        results = iter_batch(_spill(request.files['file']), cache)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def stream():
+        for line in results:
+            yield json.dumps(line) + '\n'
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data, filename, ext, err = _read_upload()
+    if err:
+        return err
+
+    job = jobs.submit(data, filename, ext)
+    if job is None:
+        return jsonify({'error': 'Too many pending jobs, retry later'}), 503
+
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': f"/jobs/{job['id']}",
+        'result_url': f"/jobs/{job['id']}/result"
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job.get('error') or 'Conversion failed'}), 500
+    if job['status'] != 'done':
+        return jsonify({'error': 'Job not finished', 'status': job['status'],
+                        'progress': job['progress']}), 409
+    return jsonify(jobs.store.get_result(job_id))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    stats = cache.stats()
+    extra = ['# HELP simtoc_cache_lookups_total Conversion cache lookups by result.',
+             '# TYPE simtoc_cache_lookups_total counter']
+    for result in ('memory_hits', 'disk_hits', 'misses'):
+        extra.append(f'simtoc_cache_lookups_total{{result="{result}"}} {stats[result]}')
+    extra += ['# HELP simtoc_cache_entries Conversions held in the in-memory cache.',
+              '# TYPE simtoc_cache_entries gauge',
+              f'simtoc_cache_entries {stats["memory_entries"]}']
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(cache.stats())
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from pipeline import PARSERS, convert_file
+from parsers.source import SNIFF_BYTES, as_binary, sniff
+
+MAX_FILES = int(os.environ.get('SIMTOC_BATCH_MAX_FILES', 1000))
+# Uncompressed sizes, as declared in the archive; zipfile never inflates a
+# member past its declared size, so these bound what is actually read
+MAX_MEMBER_BYTES = int(os.environ.get('SIMTOC_BATCH_MAX_MEMBER_BYTES', 64 * 1024 * 1024))
+MAX_TOTAL_BYTES  = int(os.environ.get('SIMTOC_BATCH_MAX_BYTES', 1024 * 1024 * 1024))
+# Models submitted per pool worker before waiting for results
+IN_FLIGHT = 2
+
+
+def _convert_member(filepath, ext):
+    # Runs in a pool process; never raises so one bad model can't sink the batch
+    try:
+        return convert_file(filepath, ext), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _line(name, result=None, error=None, cached=False):
+    if result is None:
+        return {'file': name, 'success': False, 'error': error or 'Conversion failed'}
+    line = {'file': name, 'error': None, 'cached': cached}
+    line.update(result)
+    return line
+
+
+def iter_batch(zip_source, cache=None, workers=None):
+    # zip_source: the archive's bytes, a path or a seekable binary stream.
+    # Validates the archive up front (raising ValueError), then returns a
+    # generator yielding one dict per model as it finishes and a summary.
+    try:
+        archive = zipfile.ZipFile(as_binary(zip_source))
+    except zipfile.BadZipFile:
+        raise ValueError("Invalid .zip file — file may be corrupted.")
+
+    members, oversized = [], []
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or not base or base.startswith('.') or name.startswith('__MACOSX/'):
+            continue
+        # As for uploads the contents decide; a nested SLX is only its
+        # leading bytes here, so the extension names it
+        try:
+            with archive.open(info) as f:
+                head = f.read(SNIFF_BYTES)
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError):
+            head = b''          # unreadable; its conversion reports why
+        ext = sniff(head) or base.rsplit('.', 1)[-1].lower()
+        if ext not in PARSERS:
+            continue
+        if info.file_size > MAX_MEMBER_BYTES:
+            oversized.append(info)
+        else:
+            members.append((info, ext))
+    count = len(members) + len(oversized)
+    if count > MAX_FILES:
+        raise ValueError(f"Batch has {count} models, limit is {MAX_FILES}.")
+    if not count:
+        raise ValueError("No supported model files found in the archive.")
+    size = sum(info.file_size for info, _ in members)
+    if size > MAX_TOTAL_BYTES:
+        raise ValueError(f"Batch uncompresses to {size} bytes, limit is {MAX_TOTAL_BYTES}.")
+
+    return _run_batch(archive, members, oversized, cache, workers)
+
+
+def _run_batch(archive, members, oversized, cache, workers):
+    # Members are extracted and submitted as results come back, at most
+    # IN_FLIGHT per worker at a time, so lines stream from the start and
+    # only that many extracted models wait on disk
+    workers = workers or os.cpu_count() or 1
+    tmpdir = tempfile.mkdtemp(prefix='simtoc-batch-')
+    pool = ProcessPoolExecutor(max_workers=workers)
+    total, failed = len(members) + len(oversized), len(oversized)
+    todo = iter(enumerate(members))
+    running = {}            # future -> (name, filepath, ext, key)
+    suspects = deque()      # in flight when a worker died; rerun one by one
+    try:
+        for info in oversized:
+            yield _line(info.filename, error=f'Model uncompresses to {info.file_size} bytes, '
+                                             f'limit is {MAX_MEMBER_BYTES}.')
+
+        while True:
+            if suspects:
+                if not running:
+                    job = suspects.popleft()
+                    running[pool.submit(_convert_member, *job[1:3])] = job
+            else:
+                while len(running) < IN_FLIGHT * workers:
+                    item = next(todo, None)
+                    if item is None:
+                        break
+                    i, (info, ext) = item
+                    data = archive.read(info)
+                    key = cache.key_for(data, ext) if cache else None
+                    cached = cache.get(key) if key else None
+                    if cached is not None:
+                        yield _line(info.filename, cached, cached=True)
+                        continue
+
+                    # Index-based names: archive paths never touch the filesystem
+                    filepath = os.path.join(tmpdir, f'{i}.{ext}')
+                    with open(filepath, 'wb') as f:
+                        f.write(data)
+                    job = (info.filename, filepath, ext, key)
+                    running[pool.submit(_convert_member, filepath, ext)] = job
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(fut.exception(), BrokenProcessPool) for fut in done):
+                # A worker died and took the pool with it: every future
+                # still running fails too, so settle them all
+                done = set(running)
+                wait(done)
+            broken = []
+            for fut in done:
+                job = running.pop(fut)
+                try:
+                    result, error = fut.result()
+                except BrokenProcessPool:
+                    broken.append(job)
+                    continue
+                except Exception as e:
+                    result, error = None, f'Worker crashed: {e}'
+                os.remove(job[1])
+                if result is None:
+                    failed += 1
+                elif cache and job[3]:
+                    cache.put(job[3], result)
+                yield _line(job[0], result, error)
+
+            if broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers)
+                if len(broken) == 1:
+                    # Alone in the pool: this model is what crashed it
+                    failed += 1
+                    os.remove(broken[0][1])
+                    yield _line(broken[0][0], error='Worker crashed while converting this model')
+                else:
+                    suspects.extend(broken)
+
+        yield {'done': True, 'total': total, 'succeeded': total - failed, 'failed': failed}
+
+    finally:
+        # Also reached when the client disconnects mid-stream
+        pool.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,297 @@
+import math
+import os
+import re
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ================================================================
+# Compile-and-run benchmark for generated C: bench_c_code(c_code).
+#
+# The generated file is compiled with the local compiler at the chosen -O
+# level, together with a harness main(); the example main() is renamed out
+# of the way since its per-step printf would dominate any timing. The
+# harness calls model_init() and then model_step() — or model_step_batch()
+# for the batched layout — in a tight loop timed with CLOCK_MONOTONIC,
+# feeding 1.0 to every input and folding every output into a volatile sink
+# so the work is not optimized away. Printing blocks inside the model
+# (Scope, Display) are part of its step and stay in; their output goes to
+# /dev/null.
+#
+# Compiling and running code built from an upload is off unless
+# SIMTOC_ENABLE_BENCH=1. Requests hand it to one bench thread per web
+# worker through submit_bench(), which turns requests away once
+# MAX_PENDING are waiting, and both steps run in a throwaway directory with
+# an empty environment under CPU, memory and file-size limits; the model
+# binary may not start processes either.
+# ================================================================
+
+ENABLED        = os.environ.get('SIMTOC_ENABLE_BENCH') == '1'
+CC             = os.environ.get('SIMTOC_BENCH_CC', 'gcc')
+MAX_ITERATIONS = int(os.environ.get('SIMTOC_BENCH_MAX_ITERATIONS', 10_000_000))
+TIMEOUT        = int(os.environ.get('SIMTOC_BENCH_TIMEOUT', 30))    # seconds per compile / run
+MAX_PENDING    = int(os.environ.get('SIMTOC_BENCH_QUEUE', 1))       # per web worker
+MEMORY_BYTES   = int(os.environ.get('SIMTOC_BENCH_MEMORY', 1024 * 1024 * 1024))
+FILE_BYTES     = 64 * 1024 * 1024      # largest file the compiler may write
+NOBODY         = 65534                 # uid/gid the model runs as under root
+
+OPT_LEVELS = ('0', '1', '2', '3', 's', 'g', 'fast')
+
+# Instances per model_step_batch() call for the batched layout
+BATCH_INSTANCES = 64
+
+_STEP  = re.compile(r'\bvoid model_step\(([^)]*)\)\s*\{')
+_BATCH = re.compile(r'\bvoid model_step_batch\(([^)]*)\)\s*\{')
+_NAME  = re.compile(r'(\w+)\s*$')
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='simtoc-bench')
+_pending  = 0
+_lock     = threading.Lock()
+
+
+def submit_bench(c_code, opt='2', iterations=100000):
+    # -> Future of bench_c_code() on the bench thread, or None when
+    # MAX_PENDING benchmarks are already queued or running
+    global _pending
+    with _lock:
+        if _pending >= MAX_PENDING:
+            return None
+        _pending += 1
+    future = _executor.submit(bench_c_code, c_code, opt, iterations)
+    future.add_done_callback(_finished)
+    return future
+
+
+def _finished(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def bench_c_code(c_code, opt='2', iterations=100000, instances=BATCH_INSTANCES):
+    # -> {'compiler', 'opt_level', 'iterations', 'compile_ms', 'binary_bytes',
+    # 'ns_per_step'} (+ 'instances', 'ns_per_call' for the batched layout).
+    # Raises ValueError for bad arguments or code without a model_step(),
+    # RuntimeError when compiling or running fails.
+    opt = check_bench_args(opt, iterations)
+    batch = _BATCH.search(c_code)
+    if batch:
+        harness = _batch_harness(_params(batch[1])[2:])
+    else:
+        step = _STEP.search(c_code)
+        if not step:
+            raise ValueError("No model_step() function found in the C code")
+        harness = _step_harness(_params(step[1]))
+
+    cc = shutil.which(CC)
+    if cc is None:
+        raise RuntimeError(f"Compiler '{CC}' not found")
+    flags = ['-fopenmp'] if '#pragma omp' in c_code else []
+
+    tmpdir = tempfile.mkdtemp(prefix='simtoc-bench-')
+    try:
+        src = os.path.join(tmpdir, 'model.c')
+        exe = os.path.join(tmpdir, 'model')
+        with open(src, 'w') as f:
+            f.write(c_code)
+            f.write('\n')
+            f.write('\n'.join(harness))
+
+        t0 = time.perf_counter()
+        built = _run([cc, f'-O{opt}', '-Dmain=simtoc_example_main', *flags,
+                      '-o', exe, src, '-lm'], 'Compilation', tmpdir, _compile_limits)
+        compile_ms = (time.perf_counter() - t0) * 1000
+        if built.returncode != 0:
+            raise RuntimeError(f"Compilation failed:\n{built.stderr[-2000:]}")
+        size = os.path.getsize(exe)
+        os.chmod(tmpdir, 0o711)         # reachable for NOBODY
+
+        args = [exe, str(iterations)] + ([str(instances)] if batch else [])
+        ran = _run(args, 'Benchmark run', tmpdir, _run_limits)
+        if ran.returncode != 0:
+            raise RuntimeError(f"Benchmark run failed (exit {ran.returncode}):\n{ran.stderr[-2000:]}")
+        ns_per_call = _timing(ran.stderr)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    result = {
+        'compiler': os.path.basename(cc),
+        'opt_level': f'-O{opt}',
+        'iterations': iterations,
+        'compile_ms': round(compile_ms, 1),
+        'binary_bytes': size,
+        'ns_per_step': round(ns_per_call / instances if batch else ns_per_call, 3),
+    }
+    if batch:
+        result.update(instances=instances, ns_per_call=round(ns_per_call, 3))
+    return result
+
+
+def check_bench_args(opt, iterations):
+    # -> opt as a string; ValueError for an unknown level or iteration count
+    opt = str(opt)
+    if opt not in OPT_LEVELS:
+        raise ValueError(f"Unknown optimization level -O{opt} (use one of "
+                         f"{', '.join(OPT_LEVELS)})")
+    if not 1 <= iterations <= MAX_ITERATIONS:
+        raise ValueError(f"iterations must be between 1 and {MAX_ITERATIONS}")
+    return opt
+
+
+# ---- Helpers ----
+
+def _timing(stderr):
+    # The harness prints ns per call as the last line of stderr; model code
+    # may have written before it, or closed stderr so it never came
+    lines = stderr.strip().splitlines()
+    try:
+        ns = float(lines[-1])
+    except (IndexError, ValueError):
+        ns = math.nan
+    if not math.isfinite(ns) or ns < 0:
+        raise RuntimeError("Benchmark run produced no timing")
+    return ns
+
+
+def _run(args, what, cwd, limits):
+    # The compiler still needs PATH to find its own tools
+    env = {'PATH': os.environ.get('PATH', '/usr/bin:/bin'), 'LC_ALL': 'C'}
+    try:
+        return subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, text=True, timeout=TIMEOUT,
+                              cwd=cwd, env=env, preexec_fn=limits, start_new_session=True)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"{what} timed out after {TIMEOUT}s")
+
+
+def _compile_limits():
+    # Runs in the child before exec
+    resource.setrlimit(resource.RLIMIT_CPU, (TIMEOUT, TIMEOUT))
+    resource.setrlimit(resource.RLIMIT_AS, (MEMORY_BYTES, MEMORY_BYTES))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (FILE_BYTES, FILE_BYTES))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _run_limits():
+    # The model binary writes no files and starts no processes; root is
+    # exempt from RLIMIT_NPROC, so it runs as NOBODY there
+    _compile_limits()
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    if os.getuid() == 0:
+        os.setgroups([])
+        os.setgid(NOBODY)
+        os.setuid(NOBODY)
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+
+def _params(text):
+    # model_step parameter list -> [(is_output, name)]; outputs are the
+    # non-const pointers
+    params = []
+    for p in text.split(','):
+        p = p.strip()
+        if p and p != 'void':
+            params.append(('*' in p and not p.startswith('const'), _NAME.search(p)[1]))
+    return params
+
+
+_PREAMBLE = [
+    "/* ================================================",
+    "   Benchmark harness (replaces the example main)",
+    "   ================================================ */",
+    "#undef main",
+    "#include <time.h>",
+    "",
+    "#ifdef Q_ONE",
+    "#define BENCH_ONE Q_ONE",
+    "#else",
+    "#define BENCH_ONE 1",
+    "#endif",
+    "",
+    "static double bench_elapsed_ns(struct timespec *t0, struct timespec *t1) {",
+    "    return (t1->tv_sec - t0->tv_sec) * 1e9 + (t1->tv_nsec - t0->tv_nsec);",
+    "}",
+    "",
+]
+
+
+def _step_harness(params):
+    ins  = [name for out, name in params if not out]
+    outs = [name for out, name in params if out]
+    call = f"model_step({', '.join(ins + [f'&{o}' for o in outs])});"
+    lines = _PREAMBLE + [
+        "int main(int argc, char **argv) {",
+        "    long n = argc > 1 ? atol(argv[1]) : 1;",
+        "    long k;",
+        "    struct timespec t0, t1;",
+        "    volatile Signal source = BENCH_ONE;",
+        "    volatile double sink = 0.0;",
+    ]
+    lines += [f"    Signal {name} = source;" for name in ins]
+    lines += [f"    Signal {name} = 0;" for name in outs]
+    lines += [
+        "",
+        "    model_init();",
+        "    for (k = 0; k < n / 10 + 1; k++)  /* Warm-up */",
+        f"        {call}",
+        "    clock_gettime(CLOCK_MONOTONIC, &t0);",
+        "    for (k = 0; k < n; k++) {",
+    ]
+    lines += [f"        {name} = source;" for name in ins]
+    lines.append(f"        {call}")
+    lines += [f"        sink += (double){name};" for name in outs]
+    lines += [
+        "    }",
+        "    clock_gettime(CLOCK_MONOTONIC, &t1);",
+        '    fprintf(stderr, "%.3f\\n", bench_elapsed_ns(&t0, &t1) / n);',
+        "    return 0;",
+        "}",
+    ]
+    return lines
+
+
+def _batch_harness(params):
+    ins  = [name for out, name in params if not out]
+    outs = [name for out, name in params if out]
+    call = f"model_step_batch({', '.join(['b', '&m'] + ins + outs)});"
+    lines = _PREAMBLE + [
+        "int main(int argc, char **argv) {",
+        "    long n = argc > 1 ? atol(argv[1]) : 1;",
+        "    int  b = argc > 2 ? atoi(argv[2]) : 1;",
+        "    long k;",
+        "    int  i;",
+        "    struct timespec t0, t1;",
+        "    static ModelBatch m;",
+        "    volatile double sink = 0.0;",
+    ]
+    lines += [f"    Signal *{name} = calloc((size_t)b, sizeof *{name});" for name in ins + outs]
+    lines += [
+        "",
+        "    if (model_batch_alloc(&m, b) != 0)",
+        "        return 1;",
+        "    for (i = 0; i < b; i++) {",
+    ]
+    lines += [f"        {name}[i] = BENCH_ONE;" for name in ins]
+    lines += [
+        "    }",
+        "    for (k = 0; k < n / 10 + 1; k++)  /* Warm-up */",
+        f"        {call}",
+        "    clock_gettime(CLOCK_MONOTONIC, &t0);",
+        "    for (k = 0; k < n; k++) {",
+        f"        {call}",
+    ]
+    lines += [f"        sink += (double){name}[0];" for name in outs]
+    lines += [
+        "    }",
+        "    clock_gettime(CLOCK_MONOTONIC, &t1);",
+        '    fprintf(stderr, "%.3f\\n", bench_elapsed_ns(&t0, &t1) / n);',
+        "    model_batch_free(&m);",
+        "    return 0;",
+        "}",
+    ]
+    return lines
@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import (MIXES, synth_model, count_blocks, write_mdl,
+                                  write_slx, write_image, write_pdf)
+
+# ================================================================
+# Per-stage benchmark suite.
+#
+#   cd backend
+#   python -m benchmarks.run --sizes 100,1000,10000 --formats mdl,slx \
+#       --out bench.json [--compare previous.json]
+#
+# Stages: parse (file -> Model), normalize (IR/adjacency build), topo
+# (block scheduling), emit (generate_c_code), serialize (JSON response).
+# Each stage is timed over --repeat runs (median reported) and then run
+# once more under tracemalloc for its peak memory above the start level.
+# ================================================================
+
+WRITERS = {'mdl': write_mdl, 'slx': write_slx, 'png': write_image, 'pdf': write_pdf}
+
+
+def _stages(path, fmt):
+    from pipeline import PARSERS
+    from ir import Model
+    from converter.c_code_generator import generate_c_code
+    from converter.schedule import schedule
+
+    state = {}
+
+    def parse():
+        state['model'] = PARSERS[fmt](path)
+
+    def normalize():
+        m = state['model']
+        Model(m.blocks, m.connections)
+
+    def topo():
+        schedule(state['model'])
+
+    def emit():
+        state['code'] = generate_c_code(state['model'])
+
+    def serialize():
+        m = state['model']
+        json.dumps({'success': True, 'c_code': state['code'], 'diagram': m.to_diagram(),
+                    'block_count': len(m.blocks), 'connection_count': len(m.connections)})
+
+    return state, [('parse', parse), ('normalize', normalize), ('topo', topo),
+                   ('emit', emit), ('serialize', serialize)]
+
+
+def run_case(path, fmt, repeat):
+    times = {}
+    for _ in range(repeat):
+        state, stages = _stages(path, fmt)
+        for name, fn in stages:
+            t0 = time.perf_counter()
+            fn()
+            times.setdefault(name, []).append(time.perf_counter() - t0)
+
+    peaks = {}
+    state, stages = _stages(path, fmt)
+    tracemalloc.start()
+    for name, fn in stages:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        peaks[name] = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    model = state['model']
+    return {
+        'parsed_blocks': len(model.blocks),
+        'parsed_connections': len(model.connections),
+        'stages': {
+            name: {
+                'median_s': statistics.median(times[name]),
+                'min_s': min(times[name]),
+                'peak_bytes': peaks[name],
+            }
+            for name, _ in stages
+        },
+    }
+
+
+def run(args):
+    results = []
+    tmp = tempfile.mkdtemp(prefix='simtoc-bench-')
+    for fmt in args.formats:
+        for size in args.sizes:
+            spec = synth_model(size, depth=args.depth, fanout=args.fanout,
+                               mix=args.mix, seed=args.seed)
+            path = os.path.join(tmp, f'model_{size}.{fmt}')
+            try:
+                WRITERS[fmt](spec, path)
+            except ImportError as e:
+                print(f'skip {fmt}: {e}', file=sys.stderr)
+                break
+            case = {
+                'format': fmt, 'size': size, 'depth': args.depth, 'fanout': args.fanout,
+                'mix': args.mix, 'seed': args.seed, 'spec_blocks': count_blocks(spec),
+                'file_bytes': os.path.getsize(path),
+            }
+            case.update(run_case(path, fmt, args.repeat))
+            os.remove(path)
+            results.append(case)
+            _print_case(case)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def _print_case(case):
+    st = case['stages']
+    cols = '  '.join(f"{k}={v['median_s']*1000:8.1f}ms/{v['peak_bytes']/1e6:6.1f}MB"
+                     for k, v in st.items())
+    print(f"{case['format']:>4} {case['size']:>7}  {cols}")
+
+
+def compare(current, baseline):
+    def key(c):
+        return (c['format'], c['size'], c['depth'], c['fanout'], c['mix'], c['seed'])
+    old = {key(c): c for c in baseline['results']}
+    print('\nratio vs baseline (time, peak memory); > 1.00 is slower / larger')
+    for c in current['results']:
+        b = old.get(key(c))
+        if not b:
+            continue
+        parts = []
+        for stage, v in c['stages'].items():
+            bv = b['stages'].get(stage)
+            if bv and bv['median_s'] > 0:
+                mem = v['peak_bytes'] / bv['peak_bytes'] if bv['peak_bytes'] > 0 else float('nan')
+                parts.append(f"{stage}={v['median_s'] / bv['median_s']:.2f}/{mem:.2f}")
+        print(f"{c['format']:>4} {c['size']:>7}  " + '  '.join(parts))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='SimToC per-stage benchmarks')
+    ap.add_argument('--sizes', default='100,1000,10000',
+                    type=lambda s: [int(x) for x in s.split(',')])
+    ap.add_argument('--formats', default='mdl,slx', type=lambda s: s.split(','))
+    ap.add_argument('--depth', type=int, default=1)
+    ap.add_argument('--fanout', type=int, default=1)
+    ap.add_argument('--mix', default='default', choices=sorted(MIXES))
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--out', help='write results as JSON to this path')
+    ap.add_argument('--compare', help='baseline JSON from an earlier --out')
+    args = ap.parse_args(argv)
+
+    results = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
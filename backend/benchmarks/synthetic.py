@@ -0,0 +1,227 @@
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+# ================================================================
+# Deterministic synthetic Simulink models for benchmarking.
+#
+# synth_model() builds an in-memory spec; write_mdl / write_slx /
+# write_image / write_pdf render that same spec in each input format.
+# The same arguments and seed always produce byte-identical files.
+# ================================================================
+
+MIXES = {
+    'default': {
+        'Gain': 30, 'Sum': 15, 'Product': 8, 'Constant': 8, 'Integrator': 8,
+        'UnitDelay': 8, 'Saturation': 6, 'Switch': 4, 'Trigonometry': 3,
+        'PIDController': 3, 'Scope': 2, 'Terminator': 2, 'Goto': 1.5, 'From': 1.5,
+    },
+    'linear':   {'Gain': 1},
+    'stateful': {'Integrator': 3, 'UnitDelay': 3, 'PIDController': 2, 'TransferFcn': 1, 'Gain': 3},
+    'routing':  {'Mux': 2, 'Demux': 2, 'Goto': 2, 'From': 2, 'Gain': 4, 'Sum': 2},
+}
+
+_PARAMS = {
+    'Gain':          lambda r: {'Gain': f'{r.uniform(0.1, 5):.3f}'},
+    'Sum':           lambda r: {'Inputs': r.choice(['++', '+-', '-+'])},
+    'Constant':      lambda r: {'Value': f'{r.uniform(-10, 10):.3f}'},
+    'Integrator':    lambda r: {'InitialCondition': '0'},
+    'UnitDelay':     lambda r: {'InitialCondition': '0'},
+    'Saturation':    lambda r: {'UpperLimit': '1', 'LowerLimit': '-1'},
+    'Switch':        lambda r: {'Threshold': '0.5'},
+    'Trigonometry':  lambda r: {'Operator': r.choice(['sin', 'cos', 'tanh'])},
+    'PIDController': lambda r: {'P': '1.2', 'I': '0.3', 'D': '0.01'},
+    'TransferFcn':   lambda r: {'Numerator': '[1]', 'Denominator': '[1 2]'},
+    'Goto':          lambda r: {'GotoTag': f'tag{r.randrange(16)}'},
+    'From':          lambda r: {'GotoTag': f'tag{r.randrange(16)}'},
+}
+
+
+class SynthSystem:
+    __slots__ = ('name', 'blocks', 'lines', 'children')
+
+    def __init__(self, name):
+        self.name     = name
+        self.blocks   = []     # (type, name, params)
+        self.lines    = []     # (src name, [dst names])
+        self.children = {}     # SubSystem block name -> SynthSystem
+
+
+def synth_model(n_blocks, depth=1, fanout=1, mix='default', subsystems=2, seed=0):
+    # n_blocks regular blocks spread over a tree of nested subsystems:
+    # every system above the deepest level holds `subsystems` SubSystem
+    # blocks. Each line has up to `fanout` destinations (drawn as Branches).
+    rnd = random.Random(seed)
+    weights = MIXES[mix] if isinstance(mix, str) else mix
+    types, cum = list(weights), []
+    total = 0.0
+    for t in types:
+        total += weights[t]
+        cum.append(total)
+
+    n_systems = sum(subsystems ** k for k in range(depth))
+    per_system = max(n_blocks // n_systems, 1)
+    counter = [0]
+
+    def build(name, level):
+        sysm = SynthSystem(name)
+        chain = [('Inport', 'In1', {})]
+        for _ in range(per_system):
+            counter[0] += 1
+            t = rnd.choices(types, cum_weights=cum)[0]
+            params = _PARAMS[t](rnd) if t in _PARAMS else {}
+            chain.append((t, f'{t}_{counter[0]}', params))
+        if level + 1 < depth:
+            for k in range(subsystems):
+                counter[0] += 1
+                sub = f'Sub_{counter[0]}'
+                sysm.children[sub] = build(sub, level + 1)
+                chain.insert(rnd.randrange(1, len(chain) + 1), ('SubSystem', sub, {}))
+        chain.append(('Outport', 'Out1', {}))
+        sysm.blocks = chain
+
+        for j in range(len(chain) - 1):
+            dsts = [chain[j + 1][1]]
+            for _ in range(fanout - 1):
+                k = rnd.randrange(j + 1, min(j + 1 + 4 * fanout, len(chain)))
+                if chain[k][1] not in dsts:
+                    dsts.append(chain[k][1])
+            sysm.lines.append((chain[j][1], dsts))
+        return sysm
+
+    return build('root', 0)
+
+
+def _walk(sysm):
+    yield sysm
+    for child in sysm.children.values():
+        yield from _walk(child)
+
+
+def count_blocks(spec):
+    return sum(len(s.blocks) for s in _walk(spec))
+
+
+# ---- MDL ----
+
+def write_mdl(spec, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('Model {\n  Name "synthetic"\n')
+        _mdl_system(f, spec, 1)
+        f.write('}\n')
+
+
+def _mdl_system(f, sysm, level):
+    ind = '  ' * level
+    f.write(f'{ind}System {{\n{ind}  Name "{sysm.name}"\n')
+    for i, (t, name, params) in enumerate(sysm.blocks):
+        x = 40 + 90 * i
+        f.write(f'{ind}  Block {{\n'
+                f'{ind}    BlockType {t}\n'
+                f'{ind}    Name "{name}"\n'
+                f'{ind}    Position [{x}, 40, {x + 50}, 80]\n')
+        for k, v in params.items():
+            f.write(f'{ind}    {k} "{v}"\n')
+        if name in sysm.children:
+            _mdl_system(f, sysm.children[name], level + 2)
+        f.write(f'{ind}  }}\n')
+    for src, dsts in sysm.lines:
+        f.write(f'{ind}  Line {{\n{ind}    SrcBlock "{src}"\n{ind}    SrcPort 1\n')
+        if len(dsts) == 1:
+            f.write(f'{ind}    DstBlock "{dsts[0]}"\n{ind}    DstPort 1\n')
+        else:
+            for d in dsts:
+                f.write(f'{ind}    Branch {{\n{ind}      DstBlock "{d}"\n'
+                        f'{ind}      DstPort 1\n{ind}    }}\n')
+        f.write(f'{ind}  }}\n')
+    f.write(f'{ind}}}\n')
+
+
+# ---- SLX (R2019b+ layout: one systems/*.xml part per System) ----
+
+def write_slx(spec, path):
+    sid = [0]
+    parts = {}
+
+    def render(sysm, part):
+        sids = {}
+        out = ['<?xml version="1.0" encoding="utf-8"?>\n<System>\n']
+        for i, (t, name, params) in enumerate(sysm.blocks):
+            sid[0] += 1
+            sids[name] = sid[0]
+            x = 40 + 90 * i
+            out.append(f'  <Block BlockType="{t}" Name="{escape(name)}" SID="{sid[0]}">\n'
+                       f'    <P Name="Position">[{x}, 40, {x + 50}, 80]</P>\n')
+            for k, v in params.items():
+                out.append(f'    <P Name="{k}">{escape(v)}</P>\n')
+            if name in sysm.children:
+                child = f'system_{sid[0]}'
+                render(sysm.children[name], child)
+                out.append(f'    <System Ref="{child}"/>\n')
+            out.append('  </Block>\n')
+        for src, dsts in sysm.lines:
+            out.append(f'  <Line>\n    <P Name="Src">{sids[src]}#out:1</P>\n')
+            for d in dsts:
+                out.append(f'    <Branch>\n      <P Name="Dst">{sids[d]}#in:1</P>\n    </Branch>\n')
+            out.append('  </Line>\n')
+        out.append('</System>\n')
+        parts[f'simulink/systems/{part}.xml'] = ''.join(out)
+
+    render(spec, 'system_root')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('metadata/coreProperties.xml', '<coreProperties/>')
+        z.writestr('simulink/blockdiagram.xml',
+                   '<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<ModelInformation><Model Name="synthetic"/></ModelInformation>\n')
+        for name in sorted(parts):
+            z.writestr(name, parts[name])
+
+
+# ---- Raster image / PDF (root system only, laid out on a grid) ----
+
+def _grid(spec, cols, cell_w, cell_h, margin):
+    for i, (t, name, _) in enumerate(spec.blocks):
+        x = margin + (i % cols) * cell_w
+        y = margin + (i // cols) * cell_h
+        yield i, t, x, y
+
+
+def write_image(spec, path, cols=10, box=(120, 60), gap=(60, 60)):
+    import cv2
+    import numpy as np
+
+    n = len(spec.blocks)
+    rows = (n + cols - 1) // cols
+    cw, ch = box[0] + gap[0], box[1] + gap[1]
+    img = np.full((rows * ch + 80, min(n, cols) * cw + 80, 3), 255, np.uint8)
+    centers = {}
+    for i, t, x, y in _grid(spec, cols, cw, ch, 40):
+        cv2.rectangle(img, (x, y), (x + box[0], y + box[1]), (0, 0, 0), 2)
+        cv2.putText(img, t[:10].lower(), (x + 8, y + box[1] // 2 + 6),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 0, 0), 1, cv2.LINE_AA)
+        centers[spec.blocks[i][1]] = (x, y)
+    for src, dsts in spec.lines:
+        sx, sy = centers[src]
+        for d in dsts:
+            dx, dy = centers[d]
+            cv2.arrowedLine(img, (sx + box[0], sy + box[1] // 2), (dx, dy + box[1] // 2),
+                            (0, 0, 0), 1, tipLength=0.05)
+    cv2.imwrite(path, img)
+
+
+def write_pdf(spec, path, cols=6, per_page=48):
+    import fitz
+
+    doc = fitz.open()
+    blocks = spec.blocks
+    for start in range(0, len(blocks), per_page):
+        page = doc.new_page(width=842, height=595)
+        for j, (t, name, _) in enumerate(blocks[start:start + per_page]):
+            x = 40 + (j % cols) * 130
+            y = 40 + (j // cols) * 65
+            page.draw_rect(fitz.Rect(x, y, x + 90, y + 40), color=(0, 0, 0), width=1)
+            page.insert_text((x + 6, y + 24), t, fontsize=9)
+            if j:
+                page.draw_line((x - 40, y + 20), (x, y + 20), color=(0, 0, 0), width=0.8)
+    doc.save(path)
+    doc.close()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+# Uploads spilled to disk are hashed in chunks of this size
+HASH_CHUNK = 1024 * 1024
+
+# Disk eviction trims the directory to this fraction of its budget, so a
+# full cache is not rescanned on every store
+DISK_LOW_WATER = 0.9
+
+
+class ConversionCache:
+    # Two tiers: a bounded in-process LRU, and an optional directory of JSON
+    # files shared by every gunicorn worker and kept across restarts. Both
+    # are bounded in bytes (an entry's size is its JSON encoding), the LRU
+    # by entry count as well; the disk tier drops its least recently used
+    # files once over budget.
+
+    def __init__(self, version, max_entries=128, disk_dir=None,
+                 max_bytes=256 * 1024 * 1024, disk_max_bytes=1024 * 1024 * 1024):
+        self.version        = version
+        self.max_entries    = max_entries
+        self.max_bytes      = max_bytes
+        self.disk_dir       = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._mem  = OrderedDict()      # key -> (result, size)
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0,
+                       'evictions': 0, 'disk_evictions': 0}
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def key_for(self, data, ext, options=None):
+        # data: the upload's bytes, or the path of the file holding it;
+        # options: codegen options that change the output; none (the
+        # default layout) keeps the key of a plain conversion
+        h = hashlib.sha256()
+        h.update(f'{self.version}:{ext}:'.encode())
+        if options:
+            h.update(json.dumps(options, sort_keys=True).encode())
+        if isinstance(data, (str, os.PathLike)):
+            with open(data, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                    h.update(chunk)
+        else:
+            h.update(data)
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._mem[key][0]
+
+        result, size = self._disk_get(key)
+        with self._lock:
+            if result is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['disk_hits'] += 1
+                self._remember(key, result, size)
+        return result
+
+    def put(self, key, result):
+        blob = json.dumps(result)
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember(key, result, len(blob))
+        self._disk_put(key, blob)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['memory_entries'] = len(self._mem)
+            s['memory_bytes']   = self._mem_bytes
+            s['disk_bytes']     = self._disk_bytes
+        s['max_entries'] = self.max_entries
+        s['max_bytes'] = self.max_bytes
+        s['disk_enabled'] = bool(self.disk_dir)
+        s['disk_max_bytes'] = self.disk_max_bytes
+        s['version'] = self.version
+        lookups = s['memory_hits'] + s['disk_hits'] + s['misses']
+        s['hit_rate'] = (s['memory_hits'] + s['disk_hits']) / lookups if lookups else 0.0
+        return s
+
+    # ---- internals ----
+
+    def _remember(self, key, result, size):
+        if key in self._mem:
+            self._mem_bytes -= self._mem.pop(key)[1]
+        if size > self.max_bytes:
+            return      # would evict everything else; served from disk only
+        self._mem[key] = (result, size)
+        self._mem_bytes += size
+        while len(self._mem) > self.max_entries or self._mem_bytes > self.max_bytes:
+            self._mem_bytes -= self._mem.popitem(last=False)[1][1]
+            self._stats['evictions'] += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def _disk_get(self, key):
+        # -> (result, size) or (None, 0)
+        if not self.disk_dir:
+            return None, 0
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                size = os.fstat(f.fileno()).st_size
+                result = json.load(f)
+            os.utime(path)      # the mtime orders eviction: mark it used
+            return result, size
+        except FileNotFoundError:
+            return None, 0
+        except (OSError, ValueError):
+            # Truncated or corrupt entry — drop it and regenerate
+            try: os.remove(path)
+            except OSError: pass
+            return None, 0
+
+    def _disk_put(self, key, blob):
+        if not self.disk_dir or len(blob) > self.disk_max_bytes:
+            return
+        # Write-then-rename so concurrent workers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(blob)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self._disk_bytes += len(blob)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._disk_evict()
+
+    def _disk_entries(self):
+        # -> [(mtime, size, path)] for every entry on disk
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for e in it:
+                if not e.name.endswith('.json'):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue        # removed by another worker
+                entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def _disk_evict(self):
+        # Other workers write to the same directory, so the running total is
+        # only a trigger: rescan, then drop least recently used files
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * DISK_LOW_WATER
+        dropped = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                dropped += 1
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+            self._stats['disk_evictions'] += dropped
+
+
+def cache_from_env(version):
+    return ConversionCache(
+        version,
+        max_entries=int(os.environ.get('SIMTOC_CACHE_SIZE', 128)),
+        disk_dir=os.environ.get('SIMTOC_CACHE_DIR') or None,
+        max_bytes=int(os.environ.get('SIMTOC_CACHE_BYTES', 256 * 1024 * 1024)),
+        disk_max_bytes=int(os.environ.get('SIMTOC_CACHE_DISK_BYTES', 1024 * 1024 * 1024)),
+    )
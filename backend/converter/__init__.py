@@ -0,0 +1,2 @@
+# Bump whenever a generator change alters the emitted C code.
+GENERATOR_VERSION = '6'
@@ -0,0 +1,253 @@
+from converter.c_code_generator import (HEADER, SECTIONS, _definitions, _fragment, _inputs,
+                                        _loop_note, _root_names, _update)
+from converter.emitters import Emitter, OutputPhase, emitter_for, _sc
+from converter.schedule import schedule
+from converter.subsystems import MEMBER_SECTIONS, analyze, parse_static, rewriter
+from converter.targets import DOUBLE
+from metrics import stage
+
+# ================================================================
+# Reentrant, batched layout: generate_c_code(model, batch=True).
+#
+# Everything the static layout keeps in file-level variables (block state,
+# Mux arrays, Goto buses, subsystem instances) becomes a member of one
+# ModelBatch struct in structure-of-arrays form — one array over instances
+# per variable — and dt is a member instead of a constant:
+#
+#   int  model_batch_alloc(ModelBatch *m, int n);
+#   void model_batch_free(ModelBatch *m);
+#   void model_init_batch(ModelBatch *m);
+#   void model_step_batch(int n, ModelBatch *m, const Signal *<in>_in..., Signal *<out>_out...);
+#
+# model_step_batch() is a single loop over instances whose body is the
+# ordinary step code with every member access rewritten to m-><var>[i], so
+# consecutive iterations touch consecutive memory and the loop can be
+# auto-vectorized; openmp=True makes it `#pragma omp parallel for simd`.
+# ================================================================
+
+# Sinks print from the step function; per instance that is noise, and a
+# call inside the loop stops it vectorizing
+SINK_TYPES = ('Scope', 'Display', 'ToWorkspace')
+
+
+class _BatchSink(Emitter):
+
+    def step(self, c):
+        return [f"(void){c.in0};  /* {_sc(c.bt)}: not printed in batch mode */"]
+
+BATCH_SINK = _BatchSink()
+
+
+def generate_batch(model, openmp=False, target=DOUBLE):
+    names = _root_names(model)
+    defs, inst = analyze(model)
+    with stage('topo'):
+        sched = schedule(model)
+    ems = {}
+    for b in model.blocks:
+        em = BATCH_SINK if b.type in SINK_TYPES else inst.get(b.id) or emitter_for(b.type)
+        em = target.emitter(b, em)
+        if b.id in sched.split:
+            em = OutputPhase(em)
+        if em is not emitter_for(b.type):
+            ems[b.id] = em
+
+    order = sched.order
+    definitions = _definitions(model, sched, defs, inst, ems)
+    root  = [b for b in model.blocks if b.parent is None]
+    frags = {b.id: _fragment(b, names[b.id], _inputs(model, inst, b.id, names), em=ems.get(b.id))
+             for b in root}
+    inports  = [b for b in root if b.type in ('Inport', 'In')]
+    outports = [b for b in root if b.type in ('Outport', 'Out')]
+
+    # Goto buses written inside subsystem definitions are plain globals
+    # there, so they can only stay shared
+    shared_goto = any(key == 'goto' for decls, _, _, _ in definitions for key, _ in decls)
+
+    # ---- Split declarations into struct members and globals ----
+    sections = {key: [] for key, _ in SECTIONS}
+    members  = []                    # (C type, identifier, array dims)
+    for b in root:
+        for key, text in frags[b.id][0]:
+            if key in MEMBER_SECTIONS or (key == 'goto' and not shared_goto):
+                members += [parse_static(line) or _unparsed(line) for line in text.split('\n')]
+            else:
+                sections[key].append(text)
+    for decls, _, _, _ in definitions:
+        for key, text in decls:
+            sections[key].append(text)
+    sections['goto'] = sorted(set(sections['goto']))
+    seen, unique = set(), []
+    for m in members:                # Goto/From of one tag share a bus
+        if m[1] not in seen:
+            seen.add(m[1])
+            unique.append(m)
+    members = [m for m in unique if m[0] is not None]
+
+    mapping = {ident: f"m->{ident}[i]" for _, ident, _ in members}
+    mapping.update((f"{names[b.id]}_in", f"{names[b.id]}_in[i]") for b in inports)
+    through = rewriter(mapping)
+
+    lines = list(target.header(HEADER))
+    if definitions:
+        lines += ["/* --- Subsystem State --- */"] + [types for _, types, _, _ in definitions]
+    for key, header in SECTIONS:
+        if sections[key]:
+            lines += header + sections[key] + [""]
+    lines += [code for _, _, code, _ in definitions]
+
+    # ---- Model struct ----
+    lines += [
+        "/* ================================================",
+        "   ModelBatch — per-instance data, one array per variable",
+        "   ================================================ */",
+        "typedef struct {",
+        "    int    n;   /* Instances */",
+        "    double dt;  /* Sample time (seconds) */",
+    ]
+    for ctype, ident, dims in members:
+        lines.append(f"    {ctype} (*{ident}){dims};" if dims else f"    {ctype} *{ident};")
+    lines += ["} ModelBatch;", ""]
+
+    # ---- Allocation ----
+    lines += [
+        "void model_init_batch(ModelBatch *m);",
+        "void model_batch_free(ModelBatch *m);",
+        "",
+        "int model_batch_alloc(ModelBatch *m, int n) {",
+        "    memset(m, 0, sizeof *m);",
+        "    m->n  = n;",
+        "    m->dt = 0.001;",
+    ]
+    for _, ident, _ in members:
+        lines.append(f"    if (!(m->{ident} = calloc((size_t)n, sizeof *m->{ident}))) goto fail;")
+    lines += [
+        "    model_init_batch(m);",
+        "    return 0;",
+    ]
+    if members:
+        lines += ["fail:", "    model_batch_free(m);", "    return -1;"]
+    lines += ["}", "", "void model_batch_free(ModelBatch *m) {"]
+    lines += [f"    free(m->{ident});" for _, ident, _ in members]
+    lines += ["    memset(m, 0, sizeof *m);", "}", ""]
+
+    # ---- Init ----
+    lines += [
+        "/* ================================================",
+        "   model_init_batch() — reset every instance",
+        "   ================================================ */",
+        "void model_init_batch(ModelBatch *m) {",
+        "    int i;",
+        "    for (i = 0; i < m->n; i++) {",
+    ]
+    lines += [_indent(through(frags[b.id][3])) for b in root if frags[b.id][3]]
+    lines += ["    }", "}", ""]
+
+    # ---- Step ----
+    params = ["int n", "ModelBatch *m"] + \
+             [f"const Signal *restrict {names[b.id]}_in" for b in inports] + \
+             [f"Signal *restrict {names[b.id]}_out" for b in outports]
+    lines += [
+        "/* ================================================",
+        "   model_step_batch() — advance instances 0..n-1 one step",
+        "   ================================================ */",
+        f"void model_step_batch({', '.join(params)}) {{",
+        "    const double dt = m->dt;",
+        "    int i;",
+        "    (void)dt;",
+    ]
+    # Instances never share data, so the loop carries no dependences; say
+    # so, or the compiler gives up on the alias checks between the arrays
+    if openmp:
+        lines.append("    #pragma omp parallel for simd schedule(static)")
+    else:
+        lines += [
+            "#if defined(__clang__)",
+            "    #pragma clang loop vectorize(assume_safety)",
+            "#elif defined(__GNUC__)",
+            "    #pragma GCC ivdep",
+            "#endif",
+        ]
+    lines.append("    for (i = 0; i < n; i++) {")
+    lines += [_indent(frags[b.id][1]) for b in root if frags[b.id][1]]
+    updates = []
+    for b in order:
+        if b.parent is None:
+            lines.append("")
+            if sched.loop_at(b.id):
+                lines.append(_indent(_loop_note(sched.loop_at(b.id), model)))
+            lines.append(_indent(through(frags[b.id][2])))
+            if b.id in sched.split:
+                srcs = _inputs(model, inst, b.id, names)
+                updates += ["", _indent(through(_update(ems[b.id], b, names[b.id], srcs)))]
+    lines += updates
+    lines.append("")
+    for op in outports:
+        srcs = _inputs(model, inst, op.id, names)
+        src  = f"sig_{srcs[0]}" if srcs else f"sig_{names[op.id]}"
+        lines.append(f"        {names[op.id]}_out[i] = {src};")
+    lines += ["    }", "}", ""]
+
+    stubs = [frags[b.id][4] for b in root if frags[b.id][4]]
+    stubs += [stub for _, _, _, def_stubs in definitions for stub in def_stubs]
+    if stubs:
+        lines += [
+            "/* ================================================",
+            "   S-Function Stubs",
+            "   Replace these with your actual S-Function logic",
+            "   ================================================ */",
+        ] + stubs
+
+    lines += _main(names, inports, outports, target)
+    return '\n'.join(lines)
+
+
+def _main(names, inports, outports, target):
+    ins  = [f"{names[b.id]}_val" for b in inports]
+    outs = [f"{names[b.id]}_result" for b in outports]
+    lines = [
+        "/* ================================================",
+        "   main() — example usage: MODEL_BATCH_N instances",
+        "   Compile: gcc -O3 model_output.c -lm -o model && ./model",
+        "   (-DMODEL_BATCH_N=<n> sets the instance count)",
+        "   (add -fopenmp when generated with OpenMP)",
+        "   ================================================ */",
+        "#ifndef MODEL_BATCH_N",
+        "#define MODEL_BATCH_N 1024",
+        "#endif",
+        "",
+        "int main(void) {",
+        "    static ModelBatch m;",
+    ]
+    lines += [f"    static Signal {v}[MODEL_BATCH_N];" for v in ins + outs]
+    lines += [
+        "    const double T = 10.0;",
+        "    double t = 0.0;",
+        "    int k;",
+        "",
+        "    if (model_batch_alloc(&m, MODEL_BATCH_N) != 0)",
+        "        return 1;",
+        "    for (k = 0; k < MODEL_BATCH_N; k++) {",
+    ]
+    lines += [f"        {v}[k] = {target.literal('1.0')};  /* TODO: set input per instance */"
+              for v in ins]
+    lines += [
+        "    }",
+        "    while (t < T) {",
+        f"        model_step_batch({', '.join(['MODEL_BATCH_N', '&m'] + ins + outs)});",
+        "        t += m.dt;",
+        "    }",
+    ]
+    for v, b in zip(outs, outports):
+        lines.append(f'    printf("t=%.4f  {names[b.id]}[0]=%.6f\\n", t, {target.to_double(f"{v}[0]")});')
+    lines += ["    model_batch_free(&m);", "    return 0;", "}"]
+    return lines
+
+
+def _indent(text):
+    return '\n'.join('    ' + line if line else line for line in text.split('\n'))
+
+
+def _unparsed(line):
+    # Declarations that are not a plain static variable keep no member
+    return (None, line, '')
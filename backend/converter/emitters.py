@@ -0,0 +1,797 @@
+import re
+
+# ================================================================
+# Block emitters
+#
+# Every block type maps to one emitter object in EMITTERS, so dispatch is a
+# single dict lookup. An emitter declares everything a block contributes to
+# the generated file:
+#   declare(b, n) -> [(section, line)]  file-level declarations
+#   wires(b, n)   -> signal wire declarations inside model_step()
+#   step(ctx)     -> code executed every step
+#   init(b, n)    -> code for model_init()
+#   stub(b, n)    -> out-of-line function bodies (S-Functions)
+# where b is the ir.Block and n its C identifier. register_emitter() adds
+# or replaces emitters, e.g. for in-house library blocks.
+# ================================================================
+
+_NUMS  = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')    # C-safe numbers only
+_IDENT = re.compile(r'[^a-zA-Z0-9_]')
+_CTRL  = re.compile(r'[\x00-\x1f\x7f\u2028\u2029]+')
+
+EMITTERS = {}
+
+
+def register_emitter(emitter):
+    for t in emitter.types:
+        EMITTERS[t] = emitter
+    return emitter
+
+
+def emitter_for(block_type):
+    return EMITTERS.get(block_type, FALLBACK)
+
+
+class StepContext:
+    __slots__ = ('block', 'bt', 'bn', 'out', 'in0', 'ins', 'params')
+
+    def __init__(self, block, bn, ins):
+        self.block  = block
+        self.bt     = block.type
+        self.bn     = bn
+        self.out    = f"sig_{bn}"
+        self.ins    = ins
+        self.in0    = ins[0] if ins else "0.0"
+        self.params = block.params
+
+
+class Emitter:
+    types = ()
+
+    def declare(self, b, n):
+        return []
+
+    def wires(self, b, n):
+        return [f"Signal sig_{n} = 0.0;"]
+
+    def step(self, ctx):
+        return [
+            f"/* Unimplemented block type: '{_sc(ctx.bt)}' */",
+            f"{ctx.out} = {ctx.in0};  /* Pass-through */"
+        ]
+
+    def init(self, b, n):
+        return []
+
+    def stub(self, b, n):
+        return []
+
+    # Blocks whose output depends only on their state can be split to
+    # break a feedback loop (see converter/schedule.py): output() computes
+    # the output without reading any input, update() advances the state.
+    def output(self, ctx):
+        return None
+
+    def update(self, ctx):
+        return []
+
+
+class OutputPhase(Emitter):
+    # A split state block: its step is the output half; the generator emits
+    # the update half after every block's output
+
+    def __init__(self, em):
+        self.em    = em
+        self.types = em.types
+
+    def declare(self, b, n):
+        return self.em.declare(b, n)
+
+    def wires(self, b, n):
+        return self.em.wires(b, n)
+
+    def step(self, ctx):
+        return self.em.output(ctx)
+
+    def update(self, ctx):
+        return self.em.update(ctx)
+
+    def init(self, b, n):
+        return self.em.init(b, n)
+
+    def stub(self, b, n):
+        return self.em.stub(b, n)
+
+
+class _StepOnly(Emitter):
+    # Stateless block whose only contribution is its step code
+
+    def __init__(self, types, fn):
+        self.types = types
+        self._fn   = fn
+
+    def step(self, ctx):
+        return self._fn(ctx)
+
+
+def step_emitter(*types):
+    def wrap(fn):
+        register_emitter(_StepOnly(types, fn))
+        return fn
+    return wrap
+
+
+FALLBACK = Emitter()
+
+
+# ---- Basic source blocks ----
+
+@step_emitter('Inport', 'In')
+def _inport(c):
+    return [f"{c.out} = {c.bn}_in;"]
+
+@step_emitter('Outport', 'Out')
+def _outport(c):
+    return ["/* output assigned after step */"]
+
+
+class ConstantEmitter(Emitter):
+    types = ('Constant',)
+
+    def declare(self, b, n):
+        v = _sf(b.params.get('Value', '1.0'), '1.0')
+        # Handle vector/matrix constants
+        if '[' in v or ';' in v:
+            nums = _NUMS.findall(v)
+            if nums:
+                return [('const', f"static const Signal CONST_{n.upper()}[{len(nums)}] = {{{', '.join(nums)}}};")]
+            return [('const', f"/* Constant {_sc(b.name)}: complex value = {v} */")]
+        return [('const', f"#define CONST_{n.upper()} ({v})")]
+
+    def step(self, c):
+        nums = _NUMS.findall(c.params.get('Value', '1.0'))
+        if nums and len(nums) == 1:
+            return [f"{c.out} = {nums[0]};"]
+        elif nums:
+            return [f"{c.out} = {nums[0]};  /* vector constant — using first element */"]
+        return [f"{c.out} = 1.0;  /* TODO: set constant value */"]
+
+register_emitter(ConstantEmitter())
+
+
+@step_emitter('Ground')
+def _ground(c):
+    return [f"{c.out} = 0.0;"]
+
+
+# ---- Math blocks ----
+
+class GainEmitter(Emitter):
+    types = ('Gain',)
+
+    def declare(self, b, n):
+        v = _sf(b.params.get('Gain', '1.0'), '1.0')
+        if '[' in v or ';' in v:
+            nums = _NUMS.findall(v)
+            if nums:
+                return [('gain', f"static const Signal GAIN_{n.upper()}[{len(nums)}] = {{{', '.join(nums)}}};")]
+            return [('gain', f"/* Gain {_sc(b.name)}: matrix gain = {v} */"),
+                    ('gain', f"static const Signal GAIN_{n.upper()} = 1.0; /* TODO: implement matrix gain */")]
+        return [('gain', f"static const Signal GAIN_{n.upper()} = {v};")]
+
+    def step(self, c):
+        nums = _NUMS.findall(c.params.get('Gain', '1.0'))
+        if nums and len(nums) == 1:
+            return [f"{c.out} = GAIN_{c.bn.upper()} * {c.in0};"]
+        return [f"{c.out} = GAIN_{c.bn.upper()} * {c.in0};  /* TODO: check matrix gain */"]
+
+register_emitter(GainEmitter())
+
+
+@step_emitter('Sum')
+def _sum(c):
+    signs = str(c.params.get('Inputs', c.params.get('Signs', '++')))
+    signs = ''.join(ch for ch in signs if ch in '+-')
+    if not signs:
+        signs = '+' * max(len(c.ins), 1)
+    terms = []
+    for i, sig in enumerate(c.ins):
+        sign = signs[i] if i < len(signs) else '+'
+        terms.append(f"-{sig}" if sign == '-' else sig)
+    expr = ' + '.join(terms).replace('+ -', '- ') if terms else c.in0
+    return [f"{c.out} = {expr};"]
+
+@step_emitter('Product')
+def _product(c):
+    op = c.params.get('Inputs', c.params.get('Multiplication', '**'))
+    ins, in0, out = c.ins, c.in0, c.out
+    if '/' in op:
+        # Division
+        if len(ins) >= 2:
+            return [f"{out} = ({ins[1]} != 0.0) ? {ins[0]} / {ins[1]} : 0.0;"]
+        return [f"{out} = ({in0} != 0.0) ? 1.0 / {in0} : 0.0;"]
+    expr = ' * '.join(ins) if len(ins) >= 2 else f"{in0} * {in0}"
+    return [f"{out} = {expr};"]
+
+@step_emitter('Abs')
+def _abs(c):
+    return [f"{c.out} = fabs({c.in0});"]
+
+@step_emitter('Sqrt')
+def _sqrt(c):
+    return [f"{c.out} = sqrt(fabs({c.in0}));"]
+
+@step_emitter('MathFunction')
+def _math(c):
+    op = c.params.get('Operator', c.params.get('Function', 'exp')).lower()
+    in0, ins = c.in0, c.ins
+    in1 = ins[1] if len(ins) > 1 else None
+    math_map = {
+        'exp':   lambda: f"exp({in0})",
+        'log':   lambda: f"log(fabs({in0}) + 1e-10)",
+        'log10': lambda: f"log10(fabs({in0}) + 1e-10)",
+        'square':lambda: f"({in0} * {in0})",
+        'sqrt':  lambda: f"sqrt(fabs({in0}))",
+        'pow':   lambda: f"pow({in0}, {in1 or '2.0'})",
+        'floor': lambda: f"floor({in0})",
+        'ceil':  lambda: f"ceil({in0})",
+        'round': lambda: f"round({in0})",
+        'mod':   lambda: f"fmod({in0}, {in1 or '1.0'})",
+        'rem':   lambda: f"remainder({in0}, {in1 or '1.0'})",
+        'sign':  lambda: f"(({in0} > 0.0) ? 1.0 : (({in0} < 0.0) ? -1.0 : 0.0))",
+        '10^u':  lambda: f"pow(10.0, {in0})",
+    }
+    expr = math_map[op]() if op in math_map else f"/* unknown math op: {_sc(op)} */ {in0}"
+    return [f"{c.out} = {expr};"]
+
+_TRIG_UNARY = ('sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'sinh', 'cosh', 'tanh')
+
+@step_emitter('Trigonometry')
+def _trig(c):
+    op = c.params.get('Operator', 'sin').lower()
+    if op in _TRIG_UNARY:
+        expr = f"{op}({c.in0})"
+    elif op == 'atan2':
+        expr = f"atan2({c.in0}, {c.ins[1] if len(c.ins)>1 else '1.0'})"
+    else:
+        expr = f"sin({c.in0})"
+    return [f"{c.out} = {expr};"]
+
+@step_emitter('DotProduct')
+def _dot(c):
+    if len(c.ins) >= 2:
+        return [f"{c.out} = {c.ins[0]} * {c.ins[1]};  /* DotProduct */"]
+    return [f"{c.out} = {c.in0} * {c.in0};"]
+
+
+# ---- Signal routing ----
+
+class MuxEmitter(Emitter):
+    types = ('Mux',)
+
+    def _ports(self, b):
+        return int(_sf(b.params.get('Inputs', '2'), '2'))
+
+    def declare(self, b, n):
+        return [('mux', f"static Signal mux_{n}[{self._ports(b)}];")]
+
+    def step(self, c):
+        n_inputs = int(_sf(c.params.get('Inputs', str(max(len(c.ins), 2))), '2'))
+        code = []
+        for i, sig in enumerate(c.ins[:n_inputs]):
+            code.append(f"mux_{c.bn}[{i}] = {sig};")
+        code.append(f"{c.out} = mux_{c.bn}[0];  /* Mux: array mux_{c.bn}[] holds all {n_inputs} signals */")
+        return code
+
+register_emitter(MuxEmitter())
+
+
+@step_emitter('Demux')
+def _demux(c):
+    n_outputs = int(_sf(c.params.get('Outputs', '2'), '2'))
+    code = [f"/* Demux: splits {c.in0} into {n_outputs} signals */"]
+    code.append(f"{c.out} = {c.in0};")
+    for i in range(n_outputs):
+        code.append(f"/* demux_{c.bn}_out{i+1} = component {i} of {c.in0} */")
+    return code
+
+@step_emitter('Concatenate')
+def _concat(c):
+    code = [f"/* Concatenate: joins {len(c.ins)} signals */"]
+    code.append(f"{c.out} = {c.in0};  /* Using first input — extend for vector signals */")
+    return code
+
+@step_emitter('Selector')
+def _selector(c):
+    idx = c.params.get('Indices', c.params.get('Index', '1'))
+    return [
+        f"/* Selector: selecting index {_sc(idx)} from {c.in0} */",
+        f"{c.out} = {c.in0};  /* TODO: implement indexing */"
+    ]
+
+@step_emitter('Reshape')
+def _reshape(c):
+    return [f"{c.out} = {c.in0};  /* Reshape: dimensions change but data preserved */"]
+
+@step_emitter('BusCreator')
+def _bus_creator(c):
+    code = [f"/* BusCreator: combines {len(c.ins)} signals into bus */"]
+    code.append(f"{c.out} = {c.in0};  /* Using first signal */")
+    return code
+
+@step_emitter('BusSelector')
+def _bus_selector(c):
+    code = [f"/* BusSelector: extracts signals from bus */"]
+    code.append(f"{c.out} = {c.in0};")
+    return code
+
+
+class GotoFromEmitter(Emitter):
+    types = ('Goto', 'From')
+
+    def declare(self, b, n):
+        tag = _sn(b.params.get('GotoTag', b.params.get('Tag', b.name)))
+        return [('goto', f"static Signal gotobus_{tag} = 0.0;")]
+
+    def step(self, c):
+        tag = _sn(c.params.get('GotoTag', c.params.get('Tag', c.bn)))
+        if c.bt == 'Goto':
+            return [f"gotobus_{tag} = {c.in0};  /* Goto tag: {tag} */"]
+        return [f"{c.out} = gotobus_{tag};  /* From tag: {tag} */"]
+
+register_emitter(GotoFromEmitter())
+
+
+@step_emitter('Merge')
+def _merge(c):
+    return [f"{c.out} = {c.in0};  /* Merge: using first active input */"]
+
+
+# ---- Dynamic/State blocks ----
+
+class IntegratorEmitter(Emitter):
+    types = ('Integrator',)
+
+    def declare(self, b, n):
+        return [('state', f"static Signal state_{n} = 0.0;")]
+
+    def step(self, c):
+        method = _sc(c.params.get('IntegratorMethod', 'Forward Euler'))
+        return [
+            f"state_{c.bn} += {c.in0} * dt;  /* {method} integration */",
+            f"{c.out} = state_{c.bn};"
+        ]
+
+    def output(self, c):
+        return [f"{c.out} = state_{c.bn};"]
+
+    def update(self, c):
+        method = _sc(c.params.get('IntegratorMethod', 'Forward Euler'))
+        return [f"state_{c.bn} += {c.in0} * dt;  /* {method} integration */"]
+
+    def init(self, b, n):
+        ic = _sf(b.params.get('InitialCondition', '0.0'), '0.0')
+        return [f"state_{n} = {ic};"]
+
+register_emitter(IntegratorEmitter())
+
+
+class DerivativeEmitter(Emitter):
+    types = ('Derivative',)
+
+    def declare(self, b, n):
+        return [('state', f"static Signal prev_{n} = 0.0;")]
+
+    def step(self, c):
+        return [
+            f"{c.out} = ({c.in0} - prev_{c.bn}) / dt;",
+            f"prev_{c.bn} = {c.in0};"
+        ]
+
+    def init(self, b, n):
+        return [f"prev_{n} = 0.0;"]
+
+register_emitter(DerivativeEmitter())
+
+
+class DelayEmitter(Emitter):
+    types = ('UnitDelay', 'ZeroOrderHold', 'Memory')
+
+    def declare(self, b, n):
+        return [('state', f"static Signal delay_{n} = 0.0;")]
+
+    def step(self, c):
+        if c.bt == 'ZeroOrderHold':
+            return [
+                f"delay_{c.bn} = {c.in0};",
+                f"{c.out} = delay_{c.bn};"
+            ]
+        note = "  /* Memory block */" if c.bt == 'Memory' else ""
+        return [
+            f"{c.out} = delay_{c.bn};{note}",
+            f"delay_{c.bn} = {c.in0};"
+        ]
+
+    def output(self, c):
+        if c.bt == 'ZeroOrderHold':
+            return None
+        note = "  /* Memory block */" if c.bt == 'Memory' else ""
+        return [f"{c.out} = delay_{c.bn};{note}"]
+
+    def update(self, c):
+        return [f"delay_{c.bn} = {c.in0};"]
+
+    def init(self, b, n):
+        ic = _sf(b.params.get('InitialCondition', b.params.get('X0', '0.0')), '0.0')
+        return [f"delay_{n} = {ic};"]
+
+register_emitter(DelayEmitter())
+
+
+class TransferFcnEmitter(Emitter):
+    types = ('TransferFcn', 'DiscreteTransferFcn')
+    order = 4
+
+    def declare(self, b, n):
+        return [('state', f"static Signal tf_x_{n}[{self.order}] = {{0}};"),
+                ('state', f"static Signal tf_y_{n}[{self.order}] = {{0}};")]
+
+    def step(self, c):
+        num = c.params.get('Numerator', '[1]')
+        den = c.params.get('Denominator', '[1 1]')
+        num_coeffs = _NUMS.findall(num)
+        den_coeffs = _NUMS.findall(den)
+        code = [
+            f"/* Transfer Function */",
+            f"/* Numerator:   {_sc(num)} */",
+            f"/* Denominator: {_sc(den)} */",
+        ]
+        if len(den_coeffs) >= 2:
+            a1 = den_coeffs[1]
+            a0 = den_coeffs[0]
+            b0 = num_coeffs[0] if num_coeffs else '1.0'
+            code += [
+                f"tf_x_{c.bn}[0] += ({c.in0} - ({a1}/{a0})*tf_x_{c.bn}[0]) * dt;",
+                f"{c.out} = ({b0}/{a0}) * tf_x_{c.bn}[0];"
+            ]
+        else:
+            code.append(f"{c.out} = {c.in0};")
+        return code
+
+    def init(self, b, n):
+        return [f"memset(tf_x_{n}, 0, sizeof(tf_x_{n}));",
+                f"memset(tf_y_{n}, 0, sizeof(tf_y_{n}));"]
+
+register_emitter(TransferFcnEmitter())
+
+
+class DiscreteFilterEmitter(Emitter):
+    types = ('DiscreteFilter',)
+
+    def declare(self, b, n):
+        return [('state', f"static Signal filt_x_{n}[8] = {{0}};"),
+                ('state', f"static Signal filt_y_{n}[8] = {{0}};")]
+
+    def step(self, c):
+        num = c.params.get('Numerator', '[1]')
+        den = c.params.get('Denominator', '[1]')
+        return [
+            f"/* DiscreteFilter Num:{_sc(num)} Den:{_sc(den)} */",
+            f"filt_x_{c.bn}[0] = {c.in0};",
+            f"{c.out} = filt_x_{c.bn}[0];  /* TODO: implement full filter difference equation */",
+            f"/* Shift state: memmove(&filt_x_{c.bn}[1], &filt_x_{c.bn}[0], 7*sizeof(Signal)); */"
+        ]
+
+    def init(self, b, n):
+        return [f"memset(filt_x_{n}, 0, sizeof(filt_x_{n}));",
+                f"memset(filt_y_{n}, 0, sizeof(filt_y_{n}));"]
+
+register_emitter(DiscreteFilterEmitter())
+
+
+@step_emitter('Quantizer')
+def _quantizer(c):
+    interval = _sf(c.params.get('QuantizationInterval', '1.0'), '1.0')
+    return [f"{c.out} = round({c.in0} / {interval}) * {interval};  /* Quantizer */"]
+
+
+# ---- Control blocks ----
+
+@step_emitter('Saturation')
+def _saturation(c):
+    hi = _sf(c.params.get('UpperLimit', c.params.get('Upper', '1.0')),  '1.0')
+    lo = _sf(c.params.get('LowerLimit', c.params.get('Lower', '-1.0')), '-1.0')
+    return [
+        f"{c.out} = {c.in0};",
+        f"if ({c.out} > {hi}) {c.out} = {hi};",
+        f"if ({c.out} < {lo}) {c.out} = {lo};"
+    ]
+
+@step_emitter('Switch')
+def _switch(c):
+    thr  = _sf(c.params.get('Threshold', '0.5'), '0.5')
+    ctrl = c.ins[1] if len(c.ins) > 1 else c.in0
+    in2  = c.ins[2] if len(c.ins) > 2 else '0.0'
+    crit = c.params.get('Criteria', 'u2 >= Threshold')
+    op   = '>=' if '>=' in crit else ('>' if '>' in crit else '!=')
+    return [f"{c.out} = ({ctrl} {op} {thr}) ? {c.in0} : {in2};"]
+
+@step_emitter('MultiPortSwitch')
+def _multiport_switch(c):
+    ins, out = c.ins, c.out
+    n = max(len(ins) - 1, 2)
+    ctrl = ins[0] if ins else '0'
+    code = [f"/* MultiPortSwitch: {n} inputs */"]
+    code.append(f"switch ((int){ctrl}) {{")
+    for i in range(n):
+        sig = ins[i+1] if i+1 < len(ins) else '0.0'
+        code.append(f"    case {i}: {out} = {sig}; break;")
+    code.append(f"    default: {out} = {ins[1] if len(ins)>1 else '0.0'}; break;")
+    code.append("}")
+    return code
+
+
+class PIDEmitter(Emitter):
+    types = ('PIDController',)
+
+    def declare(self, b, n):
+        return [('state', f"static Signal pid_int_{n}  = 0.0;"),
+                ('state', f"static Signal pid_prev_{n} = 0.0;")]
+
+    def step(self, c):
+        kp = _sf(c.params.get('P',  c.params.get('Kp', '1.0')),  '1.0')
+        ki = _sf(c.params.get('I',  c.params.get('Ki', '0.1')),  '0.1')
+        kd = _sf(c.params.get('D',  c.params.get('Kd', '0.01')), '0.01')
+        bn, in0 = c.bn, c.in0
+        return [
+            f"pid_int_{bn}  += {in0} * dt;",
+            f"Signal pid_d_{bn} = ({in0} - pid_prev_{bn}) / dt;",
+            f"{c.out} = {kp}*{in0} + {ki}*pid_int_{bn} + {kd}*pid_d_{bn};",
+            f"pid_prev_{bn}  = {in0};"
+        ]
+
+    def init(self, b, n):
+        return [f"pid_int_{n}  = 0.0;", f"pid_prev_{n} = 0.0;"]
+
+register_emitter(PIDEmitter())
+
+
+_REL_OPS = {
+    '==': '==', '!=': '!=', '<': '<', '>': '>',
+    '<=': '<=', '>=': '>=',
+    'isnan': 'isnan', 'isinf': 'isinf'
+}
+
+@step_emitter('RelationalOperator')
+def _relational(c):
+    op_str = c.params.get('Operator', c.params.get('RelOp', '=='))
+    cop    = _REL_OPS.get(op_str, '==')
+    in1    = c.ins[1] if len(c.ins) > 1 else '0.0'
+    if cop in ('isnan', 'isinf'):
+        return [f"{c.out} = (Signal){cop}({c.in0});"]
+    return [f"{c.out} = (Signal)({c.in0} {cop} {in1});"]
+
+_LOGIC_OPS = {
+    'AND':  ' && ', 'OR':   ' || ',
+    'NAND': ' && ', 'NOR':  ' || ',
+    'XOR':  ' != ', 'NOT':  ''
+}
+
+@step_emitter('LogicOperator')
+def _logic(c):
+    op_str = c.params.get('Operator', 'AND').upper()
+    lop = _LOGIC_OPS.get(op_str, ' && ')
+    if op_str == 'NOT':
+        return [f"{c.out} = (Signal)(!{c.in0});"]
+    expr = lop.join(f"(int){s}" for s in c.ins) if c.ins else f"(int){c.in0}"
+    if op_str in ('NAND', 'NOR'):
+        return [f"{c.out} = (Signal)!({expr});"]
+    return [f"{c.out} = (Signal)({expr});"]
+
+
+# ---- Signal sources ----
+
+class TimedSourceEmitter(Emitter):
+    types = ('SineWave', 'Step', 'DiscretePulseGenerator')
+
+    def declare(self, b, n):
+        return [('state', f"static double time_{n} = 0.0;")]
+
+    def step(self, c):
+        p, bn, out = c.params, c.bn, c.out
+        if c.bt == 'SineWave':
+            amp  = _sf(p.get('Amplitude', '1.0'), '1.0')
+            freq = _sf(p.get('Frequency', '1.0'), '1.0')
+            bias = _sf(p.get('Bias',      '0.0'), '0.0')
+            phase= _sf(p.get('Phase',     '0.0'), '0.0')
+            return [
+                f"{out} = {bias} + {amp} * sin(2.0*3.14159265358979*{freq}*time_{bn} + {phase});",
+                f"time_{bn} += dt;"
+            ]
+        if c.bt == 'Step':
+            st  = _sf(p.get('Time',   '1.0'), '1.0')
+            bef = _sf(p.get('Before', '0.0'), '0.0')
+            aft = _sf(p.get('After',  '1.0'), '1.0')
+            return [
+                f"{out} = (time_{bn} >= {st}) ? {aft} : {bef};",
+                f"time_{bn} += dt;"
+            ]
+        amp    = _sf(p.get('Amplitude', '1.0'), '1.0')
+        period = _sf(p.get('Period',    '1.0'), '1.0')
+        duty   = _sf(p.get('PulseWidth', '50'), '50')
+        return [
+            f"/* DiscretePulseGenerator: period={period}, duty={duty}% */",
+            f"{{",
+            f"    double _phase = fmod(time_{bn}, {period});",
+            f"    {out} = (_phase < ({period} * {duty} / 100.0)) ? {amp} : 0.0;",
+            f"    time_{bn} += dt;",
+            f"}}"
+        ]
+
+    def init(self, b, n):
+        return [f"time_{n} = 0.0;"]
+
+register_emitter(TimedSourceEmitter())
+
+
+# ---- Complex signal blocks ----
+
+class ComplexToRealImagEmitter(Emitter):
+    types = ('ComplexToRealImag',)
+
+    def wires(self, b, n):
+        return [f"Signal sig_{n} = 0.0;",
+                f"Signal sig_{n}_re = 0.0;", f"Signal sig_{n}_im = 0.0;"]
+
+    def step(self, c):
+        return [
+            f"/* ComplexToRealImag: splits complex signal */",
+            f"sig_{c.bn}_re = creal((double complex){c.in0});  /* Real part */",
+            f"sig_{c.bn}_im = cimag((double complex){c.in0});  /* Imaginary part */",
+            f"{c.out} = sig_{c.bn}_re;"
+        ]
+
+register_emitter(ComplexToRealImagEmitter())
+
+
+@step_emitter('RealImagToComplex')
+def _real_imag_to_complex(c):
+    in1 = c.ins[1] if len(c.ins) > 1 else '0.0'
+    return [
+        f"/* RealImagToComplex: combines real + imaginary */",
+        f"{c.out} = {c.in0};  /* Real part stored — complex arithmetic needs <complex.h> */",
+        f"/* Full: CREAL={c.in0}, CIMAG={in1} */"
+    ]
+
+
+# ---- S-Function ----
+
+class SFunctionEmitter(Emitter):
+    types = ('SFunction',)
+
+    def _fname(self, params, n):
+        return _sn(params.get('FunctionName', params.get('Name', n)))
+
+    def declare(self, b, n):
+        return [('sfunc', f"/* S-Function: {_sc(b.name)} → {self._fname(b.params, n)} */"),
+                ('sfunc', f"Signal sfunc_{n}(Signal* inputs, int n_inputs, Signal* state, int n_state);")]
+
+    def step(self, c):
+        n_ins = max(len(c.ins), 1)
+        return [
+            f"/* S-Function: {self._fname(c.params, c.bn)} */",
+            f"{{",
+            f"    Signal _sfunc_inputs[{n_ins}] = {{{', '.join(c.ins) if c.ins else '0.0'}}};",
+            f"    Signal _sfunc_state[4] = {{0}};",
+            f"    {c.out} = sfunc_{c.bn}(_sfunc_inputs, {n_ins}, _sfunc_state, 4);",
+            f"}}"
+        ]
+
+    def stub(self, b, n):
+        params_str = b.params.get('Parameters', '')
+        code = [
+            f"Signal sfunc_{n}(Signal* inputs, int n_inputs, Signal* state, int n_state) {{",
+            f"    /* S-Function: {_sc(b.name)} */",
+            f"    /* Original function: {self._fname(b.params, n)} */",
+        ]
+        if params_str:
+            code.append(f"    /* Parameters: {_sc(params_str)} */")
+        return code + [
+            f"    /* TODO: Implement your S-Function logic here */",
+            f"    return (n_inputs > 0) ? inputs[0] : 0.0;",
+            f"}}",
+            "",
+        ]
+
+register_emitter(SFunctionEmitter())
+
+
+# ---- Reference blocks ----
+
+@step_emitter('Reference')
+def _reference(c):
+    ref  = c.params.get('SourceBlock', c.params.get('Name', c.bn))
+    src  = c.params.get('SourceType', 'Unknown')
+    return [
+        f"/* Reference block: {_sc(ref)} (type: {_sc(src)}) */",
+        f"/* This references an external library block */",
+        f"{c.out} = {c.in0};  /* Pass-through — implement {_sn(ref)}() manually */"
+    ]
+
+
+# ---- Data type blocks ----
+
+@step_emitter('DataTypeConversion')
+def _dtc(c):
+    dtype = c.params.get('OutDataTypeStr', c.params.get('OutputDataType', 'double'))
+    return [f"{c.out} = (Signal)({c.in0});  /* DataTypeConversion to {_sc(dtype)} */"]
+
+
+# ---- Sink blocks ----
+
+@step_emitter('Scope')
+def _scope(c):
+    return [f'printf("SCOPE {c.bn}: %f\\n", (double){c.in0});']
+
+@step_emitter('Display')
+def _display(c):
+    return [f'printf("DISPLAY {c.bn}: %f\\n", (double){c.in0});']
+
+@step_emitter('ToWorkspace')
+def _to_workspace(c):
+    var = c.params.get('VariableName', c.bn)
+    return [
+        f"/* ToWorkspace: saving to variable '{_sc(var)}' */",
+        f"/* In C: log to file or array */",
+        f"printf(\"WORKSPACE {_sq(var)}: %f\\n\", (double){c.in0});"
+    ]
+
+@step_emitter('Terminator')
+def _terminator(c):
+    return [f"(void){c.in0};  /* Terminator: signal discarded */"]
+
+@step_emitter('EnablePort')
+def _enable_port(c):
+    return [f"{c.out} = {c.in0};  /* EnablePort */"]
+
+
+# ---- SubSystem ----
+
+@step_emitter('SubSystem', 'Subsystem')
+def _subsystem(c):
+    return [
+        f"/* SubSystem: {c.bn} */",
+        f"/* This subsystem contains nested blocks */",
+        f"/* Expand subsystem or implement {c.bn}_step() */",
+        f"{c.out} = {c.in0};  /* Pass-through placeholder */"
+    ]
+
+
+# ================================================================
+# Helpers
+# ================================================================
+
+def _sn(name):
+    name = _IDENT.sub('_', str(name))
+    if name and name[0].isdigit():
+        name = 'b_' + name
+    return name or 'unnamed'
+
+def _sc(text):
+    # Upload text made safe inside a one-line /* */ comment: it can neither
+    # close the comment nor break the line
+    return _CTRL.sub(' ', str(text)).replace('*/', '* /')
+
+def _sq(text):
+    # Upload text made safe inside a printf format string literal
+    text = _CTRL.sub(' ', str(text))
+    for ch, esc in (('\\', '\\\\'), ('"', '\\"'), ('?', '\\?'), ('%', '%%')):
+        text = text.replace(ch, esc)
+    return text
+
+def _sf(val, fallback):
+    try:
+        float(str(val).strip())
+        return str(val).strip()
+    except:
+        return fallback
@@ -0,0 +1,224 @@
+from converter import GENERATOR_VERSION
+from converter.c_code_generator import (DOUBLE, PARTS, _assemble, _emitters, _fragment, _inputs,
+                                        _root_names)
+from converter.schedule import STATE_TYPES, schedule
+from converter.subsystems import SUBSYSTEM_TYPES, analyze
+
+# ================================================================
+# Incremental regeneration.
+#
+# A snapshot keeps what the previous file was generated from and the
+# pieces it was assembled out of, all as plain lists/dicts so it survives
+# a JSON round-trip through the cache:
+#
+#   names, types, params   per block, in model order
+#   parents                enclosing SubSystem block id per block
+#   in_start, in, in_port  the Model's predecessor CSR arrays
+#   cnames                 C identifier per root-level block
+#   split                  ids of state blocks split by the schedule
+#   frags                  per-block fragments (see _fragment), None
+#                          inside subsystems
+#   lines, slots           the assembled pieces, and per block the index
+#                          of each of its pieces in `lines`
+#
+# Emitters see nothing beyond a block and the C names of its inputs, so a
+# fragment only needs regenerating when the block itself changed or its
+# inputs were rewired. When the graph is structurally identical (same
+# blocks, same wiring) the new fragments are spliced straight into the
+# previous pieces; otherwise unchanged fragments are reused by C name and
+# the file is re-assembled around them. Subsystem definitions are always
+# regenerated, and any edit inside one takes the re-assembly path.
+# ================================================================
+
+# Blocks that appear in the model_step() signature and main()
+PORT_TYPES = ('Inport', 'In', 'Outport', 'Out')
+
+
+def generate_incremental(model, previous=None):
+    # -> (c_code, snapshot). previous is a snapshot from an earlier call; a
+    # missing one or one from another generator version regenerates all.
+    if previous is not None and previous.get('generator') != GENERATOR_VERSION:
+        previous = None
+
+    blocks   = model.blocks
+    snapshot = {
+        'generator': GENERATOR_VERSION,
+        'names':     [b.name for b in blocks],
+        'types':     [b.type for b in blocks],
+        'params':    [b.params for b in blocks],
+        'parents':   [b.parent for b in blocks],
+        'in_start':  model._in_start.tolist(),
+        'in':        model._in.tolist(),
+        'in_port':   model._in_port.tolist(),
+    }
+
+    if previous is not None and _same_structure(previous, snapshot):
+        spliced = _splice(model, previous, snapshot)
+        if spliced is not None:
+            return spliced
+
+    names = snapshot['cnames'] = _root_names(model)
+    defs, inst = analyze(model)
+    sched = schedule(model)
+    ems   = _emitters(model, inst, DOUBLE, sched.split)
+    snapshot['split'] = sorted(sched.split)
+    index, was_split = {}, set()
+    if previous is not None:
+        index = {n: i for i, n in enumerate(previous['cnames']) if n is not None}
+        was_split = set(previous['split'])
+    frags = []
+    for b in blocks:
+        if b.parent is not None:
+            frags.append(None)
+            continue
+        n    = names[b.id]
+        j    = index.get(n)
+        if (j is not None and b.id not in inst and (j in was_split) == (b.id in sched.split) and
+                previous['params'][j] == b.params and
+                previous['types'][j] == b.type and previous['names'][j] == b.name and
+                _wired(previous, j) == [(names[s], p) for s, p in
+                                        zip(model.predecessors(b.id), model.source_ports(b.id))]):
+            frags.append(previous['frags'][j])
+        else:
+            frags.append(_fragment(b, n, _inputs(model, inst, b.id, names), em=ems.get(b.id)))
+
+    slots = [{} for _ in blocks]
+    lines = _assemble(model, names, frags, (defs, inst), slots, ems=ems, sched=sched)
+    snapshot.update(frags=frags, lines=lines, slots=slots)
+    return '\n'.join(lines), snapshot
+
+
+def diff_snapshots(old, new):
+    # Structural diff between two snapshots, by block C name (Subsystem/Block
+    # paths for blocks inside subsystems)
+    if _same_structure(old, new):
+        paths   = _paths(new)
+        changed = [paths[i] for i in _changed(old, new)]
+        return _diff_result([], [], changed, [], [], [], len(new['names']))
+
+    old_paths, new_paths = _paths(old), _paths(new)
+    a = {n: i for i, n in enumerate(old_paths)}
+    b = {n: i for i, n in enumerate(new_paths)}
+    added   = [n for n in b if n not in a]
+    removed = [n for n in a if n not in b]
+    changed, rewired = [], []
+    conn_added, conn_removed = [], []
+    for n, j in b.items():
+        i = a.get(n)
+        if i is None:
+            conn_added += [(s, n) for s in _srcs(new, j, new_paths)]
+            continue
+        if (old['types'][i], old['names'][i], old['params'][i]) != \
+                (new['types'][j], new['names'][j], new['params'][j]):
+            changed.append(n)
+        before, after = _srcs(old, i, old_paths), _srcs(new, j, new_paths)
+        if before != after:
+            rewired.append(n)
+            conn_added   += [(s, n) for s in after if s not in before]
+            conn_removed += [(s, n) for s in before if s not in after]
+    for n in removed:
+        conn_removed += [(s, n) for s in _srcs(old, a[n], old_paths)]
+    return _diff_result(added, removed, changed, rewired, conn_added, conn_removed,
+                        len(new['names']))
+
+
+# ---- Helpers ----
+
+def _same_structure(old, new):
+    # Same blocks in the same order and nesting, wired the same way: block
+    # ids, C names and the schedule all carry over and only types/parameters
+    # can differ.
+    return (old['names'] == new['names'] and old['parents'] == new['parents'] and
+            old['in_start'] == new['in_start'] and old['in'] == new['in'] and
+            old['in_port'] == new['in_port'])
+
+
+def _changed(old, new):
+    po, pn, to, tn = old['params'], new['params'], old['types'], new['types']
+    if po == pn and to == tn:
+        return []
+    return [i for i in range(len(pn)) if po[i] != pn[i] or to[i] != tn[i]]
+
+
+def _splice(model, previous, snapshot):
+    # Replace the pieces of blocks whose type or parameters changed. Gives
+    # up (None) when that shifts the file layout: a port block changed (the
+    # model_step signature), a part appeared or disappeared, a shared Goto
+    # declaration moved, the edit touches a subsystem definition, or a
+    # block involved is split by the schedule (which a type change can
+    # also alter).
+    names = previous['cnames']
+    split = set(previous['split'])
+    inst  = analyze(model)[1]
+    frags = list(previous['frags'])
+    lines = list(previous['lines'])
+    slots = previous['slots']
+    for i in _changed(previous, snapshot):
+        b    = model.blocks[i]
+        if b.type in PORT_TYPES or previous['types'][i] in PORT_TYPES:
+            return None
+        if (b.parent is not None or b.type in SUBSYSTEM_TYPES or
+                previous['types'][i] in SUBSYSTEM_TYPES):
+            return None
+        if i in split or b.type in STATE_TYPES or previous['types'][i] in STATE_TYPES:
+            return None
+        old  = frags[i]
+        new  = _fragment(b, names[i], _inputs(model, inst, i, names))
+        if [k for k, _ in old[0]] != [k for k, _ in new[0]]:
+            return None
+        for (key, text), (_, was) in zip(new[0], old[0]):
+            if key == 'goto':
+                if text != was:
+                    return None
+            else:
+                lines[slots[i][key]] = text
+        for part, text, was in zip(PARTS, new[1:], old[1:]):
+            if bool(text) != bool(was):
+                return None
+            if text:
+                lines[slots[i][part]] = text
+        frags[i] = new
+
+    snapshot.update(cnames=names, split=previous['split'], frags=frags, lines=lines, slots=slots)
+    return '\n'.join(lines), snapshot
+
+
+def _srcs(snap, i, names):
+    order, start = snap['in'], snap['in_start']
+    return [names[s] for s in order[start[i]:start[i + 1]]]
+
+
+def _wired(snap, i):
+    # (source C name, source port) per input of root-level block i
+    lo, hi = snap['in_start'][i], snap['in_start'][i + 1]
+    return [(snap['cnames'][s], p) for s, p in zip(snap['in'][lo:hi], snap['in_port'][lo:hi])]
+
+
+def _paths(snap):
+    # C name for root-level blocks, Subsystem/Block below; parents may come
+    # after their children in block order (SLX)
+    names, parents, cnames = snap['names'], snap['parents'], snap['cnames']
+    paths = list(cnames)
+
+    def path(i):
+        if paths[i] is None:
+            paths[i] = f"{path(parents[i])}/{names[i]}"
+        return paths[i]
+
+    for i in range(len(paths)):
+        path(i)
+    return paths
+
+
+def _diff_result(added, removed, changed, rewired, conn_added, conn_removed, total):
+    regenerated = len(set(added).union(changed, rewired))
+    return {
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'rewired': rewired,
+        'connections_added': conn_added,
+        'connections_removed': conn_removed,
+        'regenerated': regenerated,
+        'reused': total - regenerated,
+    }
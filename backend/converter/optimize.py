@@ -0,0 +1,215 @@
+import math
+from collections import deque
+
+from ir import ModelBuilder
+from converter.emitters import _sc, _sn
+
+# ================================================================
+# Graph optimization: generate_c_code(model, optimize=True), or
+# optimize_model(model) for the Model and report alone.
+#
+# Runs on the Model before emission and returns a smaller one:
+#
+#   folded     Gain of a constant and Sum of constants become Constants,
+#              so Constant -> Gain -> Sum chains collapse to one literal
+#   bypassed   unit Gains and single-input Sums left after dropping zero
+#              terms are removed, their readers wired to their source
+#   removed    blocks whose output reaches no Outport: sinks (Scope,
+#              Display, ToWorkspace, Terminator), whatever only feeds
+#              them, and Goto blocks whose tag no live From reads
+#
+# Root-level Inports/Outports and S-Functions are always kept, and a kept
+# subsystem keeps all of its ports, so model_step() and every subsystem
+# step function keep their signatures.
+# ================================================================
+
+PORT_TYPES = ('Inport', 'In', 'Outport', 'Out', 'EnablePort')
+
+# Always live at their level (S-Functions are opaque user code)
+KEEP_TYPES = PORT_TYPES + ('SFunction',)
+
+# Names listed per category in the generated comment
+REPORT_LIMIT = 20
+
+
+def optimize_model(model):
+    # -> (optimized Model, report); the report lists block paths per
+    # category plus the block counts before and after.
+    blocks = model.blocks
+    n      = len(blocks)
+    types  = [b.type for b in blocks]
+    params = [b.params for b in blocks]
+    ins    = [list(zip(model.predecessors(i), model.source_ports(i))) for i in range(n)]
+    users  = [set(model.successors(i)) for i in range(n)]
+    folded, bypassed = [], []
+
+    # Scalar value of every constant block, by id
+    value = {}
+    for i in range(n):
+        if types[i] == 'Constant':
+            v = _scalar(params[i].get('Value', '1.0'))
+            if v is not None:
+                value[i] = v
+        elif types[i] == 'Ground':
+            value[i] = 0.0
+
+    def const(src):
+        s, p = src
+        return value.get(s) if p == 1 else None
+
+    def fold(i, v):
+        for s, _ in ins[i]:
+            users[s].discard(i)
+        ins[i]    = []
+        types[i]  = 'Constant'
+        params[i] = {'Value': repr(v)}
+        value[i]  = v
+        folded.append(i)
+        queue.extend(users[i])
+
+    def bypass(i, src):
+        s = src[0]
+        users[s].discard(i)
+        for u in users[i]:
+            ins[u] = [src if e == (i, 1) else e for e in ins[u]]
+            users[s].add(u)
+        queue.extend(users[i])
+        users[i] = set()
+        ins[i]   = []
+        bypassed.append(i)
+
+    # ---- Folding and bypassing, to a fixed point ----
+    queue = deque(b.id for b in model.of_type('Gain', 'Sum'))
+    while queue:
+        i = queue.popleft()
+        if types[i] == 'Gain' and len(ins[i]) == 1:
+            g = _scalar(params[i].get('Gain', '1.0'))
+            if g is None:
+                continue
+            c = const(ins[i][0])
+            if c is not None:
+                fold(i, c * g)
+            elif g == 1.0:
+                bypass(i, ins[i][0])
+        elif types[i] == 'Sum' and ins[i]:
+            signs = _signs(params[i], len(ins[i]))
+            terms = [(src, sign) for src, sign in zip(ins[i], signs)]
+            values = [const(src) for src, _ in terms]
+            if all(v is not None for v in values):
+                fold(i, sum(-v if sign == '-' else v for v, (_, sign) in zip(values, terms)))
+                continue
+            keep = [t for t, v in zip(terms, values) if v != 0.0]
+            if len(keep) == len(terms):
+                continue
+            for (s, _), _ in terms:
+                users[s].discard(i)
+            if len(keep) == 1 and keep[0][1] == '+':
+                users[keep[0][0][0]].add(i)
+                bypass(i, keep[0][0])
+                continue
+            ins[i]    = [src for src, _ in keep]
+            params[i] = dict(params[i], Inputs=''.join(sign for _, sign in keep))
+            for s, _ in ins[i]:
+                users[s].add(i)
+            queue.extend(users[i])
+
+    # ---- Liveness, backwards from the kept blocks ----
+    children = {}
+    for b in blocks:
+        if b.parent is not None:
+            children.setdefault(b.parent, []).append(b.id)
+    gotos = {}
+    for b in model.of_type('Goto'):
+        gotos.setdefault(_tag(b), []).append(b.id)
+
+    live  = [False] * n
+    stack = [b.id for b in blocks if b.parent is None and types[b.id] in KEEP_TYPES]
+    for i in stack:
+        live[i] = True
+    while stack:
+        i = stack.pop()
+        found = [s for s, _ in ins[i]]
+        if i in children:
+            found += [m for m in children[i] if types[m] in KEEP_TYPES]
+        if types[i] == 'From':
+            found += gotos.get(_tag(blocks[i]), ())
+        for s in found:
+            if not live[s]:
+                live[s] = True
+                stack.append(s)
+
+    # ---- Rebuild ----
+    # A kept block's parent is kept too, but may come after it (SLX), so
+    # the new ids are assigned first
+    mb    = ModelBuilder()
+    remap = {i: k for k, i in enumerate(i for i in range(n) if live[i])}
+    for i in remap:
+        b = blocks[i]
+        mb.add_block(types[i], b.name, b.x, b.y, params[i], b.key,
+                     None if b.parent is None else remap[b.parent])
+    for i, j in remap.items():
+        for port, (s, p) in enumerate(ins[i], 1):
+            mb.connect(remap[s], j, p, port)
+
+    gone    = set(bypassed)
+    removed = [i for i in range(n) if not live[i] and i not in gone]
+    paths   = _paths(blocks)
+    report  = {
+        'folded':        [paths[i] for i in folded if live[i]],
+        'bypassed':      [paths[i] for i in bypassed],
+        'removed':       [paths[i] for i in removed],
+        'blocks_before': n,
+        'blocks_after':  len(mb.blocks),
+    }
+    return mb.build(), report
+
+
+def report_comment(report):
+    # The report as a C comment to put in front of the generated file
+    lines = [
+        "/*",
+        f" * Optimized: {report['blocks_before']} -> {report['blocks_after']} blocks",
+    ]
+    for key in ('folded', 'bypassed', 'removed'):
+        names = report[key]
+        if names:
+            shown = ', '.join(_sc(n) for n in names[:REPORT_LIMIT])
+            more  = f", ... ({len(names) - REPORT_LIMIT} more)" if len(names) > REPORT_LIMIT else ""
+            lines.append(f" *   {key} ({len(names)}): {shown}{more}")
+    return '\n'.join(lines + [" */", ""])
+
+
+# ---- Helpers ----
+
+def _scalar(text):
+    try:
+        v = float(str(text).strip())
+    except ValueError:
+        return None
+    return v if math.isfinite(v) else None
+
+
+def _signs(params, count):
+    # Per-input sign of a Sum, as the emitter reads them
+    signs = str(params.get('Inputs', params.get('Signs', '++')))
+    signs = ''.join(ch for ch in signs if ch in '+-')
+    return [signs[k] if k < len(signs) else '+' for k in range(count)]
+
+
+def _tag(b):
+    return _sn(b.params.get('GotoTag', b.params.get('Tag', b.name)))
+
+
+def _paths(blocks):
+    # Block name at root, Subsystem/Block below
+    paths = [None] * len(blocks)
+
+    def path(i):
+        if paths[i] is None:
+            b = blocks[i]
+            paths[i] = b.name if b.parent is None else f"{path(b.parent)}/{b.name}"
+        return paths[i]
+
+    for i in range(len(blocks)):
+        path(i)
+    return paths
@@ -0,0 +1,178 @@
+from collections import deque
+
+# ================================================================
+# Block scheduling.
+#
+# schedule(model) orders every block so that each one comes after the
+# blocks it reads. Feedback loops are handled by strongly connected
+# components (Tarjan), all in linear time:
+#
+#   - a cycle through a state block (STATE_TYPES) is broken at that
+#     block: its output only depends on its state, so it is "split" — the
+#     output half runs at its place in the order with no inputs, and the
+#     state update that reads its inputs runs after every block's output
+#   - a cycle with no state block in it is an algebraic loop: its blocks
+#     are kept together in model order and reported in Schedule.loops
+#
+# An acyclic model gets exactly the order of Kahn's algorithm.
+# ================================================================
+
+# Blocks whose output is a function of their state alone
+STATE_TYPES = frozenset(('UnitDelay', 'Memory', 'Integrator'))
+
+
+class Schedule:
+    # order: every Block once, in evaluation order
+    # split: ids of state blocks whose update runs after all outputs
+    # loops: algebraic loops, as lists of block ids in evaluation order
+    __slots__ = ('order', 'split', 'loops', '_heads')
+
+    def __init__(self, order, split=frozenset(), loops=()):
+        self.order  = order
+        self.split  = split
+        self.loops  = list(loops)
+        self._heads = {loop[0]: loop for loop in self.loops}
+
+    def loop_at(self, i):
+        # The algebraic loop starting at block i, or None
+        return self._heads.get(i)
+
+    def to_dict(self):
+        return {
+            'order': [str(b.id) for b in self.order],
+            'split': [str(i) for i in sorted(self.split)],
+            'algebraic_loops': [[str(i) for i in loop] for loop in self.loops],
+        }
+
+
+def schedule(model):
+    n     = len(model.blocks)
+    order = _kahn(n, model.successors, model.predecessors)
+    if len(order) == n:
+        return Schedule([model.blocks[i] for i in order])
+
+    # ---- Cut the inputs of state blocks on a cycle ----
+    start, targets = model._out_start, model._out
+    comp, _ = _components(n, start, targets)
+    split = set()
+    for v in range(n):
+        if model.blocks[v].type in STATE_TYPES:
+            c = comp[v]
+            if any(comp[u] == c for u in model.predecessors(v)):
+                split.add(v)
+    start, targets = _without_inputs(n, start, targets, split)
+
+    # ---- Order the components of what is left ----
+    comp, count = _components(n, start, targets)
+    members = [[] for _ in range(count)]
+    for i in range(n):
+        members[comp[i]].append(i)
+    in_deg = [0] * count
+    for u in range(n):
+        c = comp[u]
+        for k in range(start[u], start[u + 1]):
+            d = comp[targets[k]]
+            if d != c:
+                in_deg[d] += 1
+
+    queue  = deque()
+    queued = [False] * count
+    for i in range(n):
+        c = comp[i]
+        if in_deg[c] == 0 and not queued[c]:
+            queued[c] = True
+            queue.append(c)
+    order, loops = [], []
+    while queue:
+        c = queue.popleft()
+        order += members[c]
+        if len(members[c]) > 1:
+            loops.append(members[c])
+        for u in members[c]:
+            for k in range(start[u], start[u + 1]):
+                d = comp[targets[k]]
+                if d != c:
+                    in_deg[d] -= 1
+                    if in_deg[d] == 0:
+                        queue.append(d)
+    return Schedule([model.blocks[i] for i in order], frozenset(split), loops)
+
+
+# ---- Helpers ----
+
+def _kahn(n, succ, pred):
+    # Block ids in Kahn order; shorter than n when the graph has a cycle
+    in_deg = [len(pred(i)) for i in range(n)]
+    queue  = deque(i for i in range(n) if in_deg[i] == 0)
+    order  = []
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for nb in succ(node):
+            in_deg[nb] -= 1
+            if in_deg[nb] == 0:
+                queue.append(nb)
+    return order
+
+
+def _without_inputs(n, start, targets, cut):
+    # CSR successor arrays minus every edge into a node of cut
+    new_start, new_targets = [0] * (n + 1), []
+    for u in range(n):
+        new_targets += [v for v in targets[start[u]:start[u + 1]] if v not in cut]
+        new_start[u + 1] = len(new_targets)
+    return new_start, new_targets
+
+
+def _components(n, start, targets):
+    # Tarjan's strongly connected components over CSR successor arrays,
+    # iteratively. -> (component per node, component count); components
+    # are numbered sinks first.
+    index = [-1] * n
+    low   = [0] * n
+    on    = [False] * n
+    comp  = [-1] * n
+    pos   = list(start[:n])          # next edge to look at, per node
+    stack = []
+    count = found = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = count
+        count += 1
+        stack.append(root)
+        on[root] = True
+        work = [root]
+        while work:
+            v   = work[-1]
+            k   = pos[v]
+            end = start[v + 1]
+            while k < end:
+                w = targets[k]
+                k += 1
+                if index[w] == -1:
+                    index[w] = low[w] = count
+                    count += 1
+                    stack.append(w)
+                    on[w] = True
+                    work.append(w)
+                    break
+                if on[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            pos[v] = k
+            if work[-1] != v:
+                continue
+            work.pop()
+            if work:
+                u = work[-1]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on[w] = False
+                    comp[w] = found
+                    if w == v:
+                        break
+                found += 1
+    return comp, found
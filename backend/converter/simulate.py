@@ -0,0 +1,578 @@
+import math
+import re
+
+import numpy as np
+
+from converter.emitters import _NUMS, _sf, _sn
+from converter.optimize import _paths
+from converter.schedule import schedule
+from converter.subsystems import _ports
+
+# ================================================================
+# Reference simulator: simulate(model, steps, inputs=..., params=...).
+#
+# Runs a Model with the semantics of the C that generate_c_code() emits
+# for it (double target): same schedule, same split state blocks, same
+# dt, subsystems called at their place in the order, and each block doing
+# what its emitter writes. Every signal is a NumPy array with one entry
+# per scenario, so one pass over the blocks per time step advances all
+# scenarios at once; scenarios differ by their input traces and by
+# per-scenario block parameters.
+#
+#   inputs   {root Inport name: value}, where a value is a scalar, a
+#            (steps,) trace shared by all scenarios, an (S, 1) per-scenario
+#            constant or an (S, steps) trace; missing inputs are 0.0
+#   params   {block path: {parameter: scalar or (S,) array}}, replacing the
+#            numeric parameters the emitters read (Gain, Value, P/I/D,
+#            UpperLimit, InitialCondition, Amplitude, ...)
+#   signals  block paths whose output to record as well
+#
+# Block paths are the block name at root and Subsystem/Block below.
+# Returns {'time': (steps,), 'outputs': {Outport name: (S, steps)},
+# 'signals': {path: (S, steps)}, 'unsupported': [paths]}, the last
+# listing blocks without an emitter, simulated as the C does (pass-through).
+# ================================================================
+
+DT = 0.001      # model_step()'s sample time
+
+SIMULATORS = {}
+
+# Blocks the C passes their first input through (possibly with a comment
+# on what a full implementation would do)
+PASS_THROUGH = (
+    'Mux', 'Demux', 'Concatenate', 'Selector', 'Reshape', 'BusCreator', 'BusSelector',
+    'Merge', 'DataTypeConversion', 'EnablePort', 'ComplexToRealImag', 'RealImagToComplex',
+    'Reference', 'SFunction', 'DiscreteFilter', 'SubSystem', 'Subsystem',
+)
+
+# Blocks that set no wire (Outports are read after the step)
+SINK_TYPES = ('Outport', 'Out', 'Scope', 'Display', 'ToWorkspace', 'Terminator')
+
+_INT = re.compile(r'^[-+]?\d+$')
+
+
+def simulates(*types):
+    # Registers factory(p) -> step(ins, t) for block types; p is the
+    # block's _Params, ins its input arrays in port order
+    def wrap(factory):
+        for t in types:
+            SIMULATORS[t] = factory
+        return factory
+    return wrap
+
+
+def simulate(model, steps, inputs=None, params=None, scenarios=None, signals=()):
+    if steps < 1:
+        raise ValueError('steps must be at least 1')
+    blocks = model.blocks
+    paths  = _paths(blocks)
+    ids    = {p: i for i, p in enumerate(paths)}
+    inputs = dict(inputs or {})
+    params = dict(params or {})
+
+    inports  = {b.name: b for b in model.of_type('Inport', 'In') if b.parent is None}
+    outports = [b for b in model.of_type('Outport', 'Out') if b.parent is None]
+    for name in inputs:
+        if name not in inports:
+            raise ValueError(f"Unknown input '{name}'")
+    for path in list(params) + list(signals):
+        if path not in ids:
+            raise ValueError(f"Unknown block '{path}'")
+
+    # ---- Scenario count and per-scenario arrays ----
+    inputs = {k: np.asarray(v, dtype=float) for k, v in inputs.items()}
+    params = {ids[path]: {k: np.asarray(v, dtype=float) for k, v in over.items()}
+              for path, over in params.items()}
+    counts = {v.shape[0] for v in inputs.values() if v.ndim == 2}
+    counts |= {v.shape[0] for over in params.values() for v in over.values() if v.ndim == 1}
+    counts.discard(1)
+    if scenarios is None:
+        if len(counts) > 1:
+            raise ValueError(f"Inputs and parameters disagree on the scenario count: {sorted(counts)}")
+        scenarios = counts.pop() if counts else 1
+    S = scenarios
+    feeds = {}
+    for name, v in inputs.items():
+        try:
+            feeds[inports[name].id] = np.broadcast_to(v, (S, steps))
+        except ValueError:
+            raise ValueError(f"Input '{name}' of shape {v.shape} does not fit "
+                             f"{S} scenarios x {steps} steps")
+    for i, over in params.items():
+        for k, v in over.items():
+            if v.ndim > 1 or v.ndim == 1 and v.shape[0] not in (1, S):
+                raise ValueError(f"Parameter {k} of '{paths[i]}' must be a scalar "
+                                 f"or have one value per scenario ({S})")
+            over[k] = float(v.reshape(-1)[0]) if v.size == 1 else v
+
+    # ---- Wires: one row per block, plus outputs 2.. of subsystems ----
+    children = {}
+    for b in blocks:
+        if b.parent is not None:
+            children.setdefault(b.parent, []).append(b.id)
+    extra = {}
+    rows  = len(blocks)
+    sub_ports = {}
+    for sid, members in children.items():
+        ins  = _ports(blocks, members, ('Inport', 'In'))
+        outs = _ports(blocks, members, ('Outport', 'Out'))
+        sub_ports[sid] = (ins, outs)
+        for k in range(2, len(outs) + 1):
+            extra[sid, k] = rows
+            rows += 1
+
+    def wire(src, port):
+        return extra.get((src, port), src)
+
+    def sources(i):
+        return [wire(s, p) for s, p in zip(model.predecessors(i), model.source_ports(i))]
+
+    # Row views are taken once, so ops index nothing while running
+    w   = np.zeros((rows, S))
+    row = list(w)
+
+    def views(i):
+        return [row[j] for j in sources(i)]
+
+    # ---- Program: ops in execution order ----
+    sched = schedule(model)
+    by_parent = {}
+    for b in sched.order:
+        by_parent.setdefault(b.parent, []).append(b)
+    buses = {}
+    unsupported = []
+
+    def system(parent, prog):
+        updates = []
+        for b in by_parent.get(parent, ()):
+            i = b.id
+            if b.id in children:
+                sub_ins, sub_outs = sub_ports[i]
+                outer = sources(i)
+                for k, ip in enumerate(sub_ins):
+                    if k < len(outer):
+                        prog.append(_copy(row[ip.id], row[outer[k]]))
+                system(i, prog)
+                for k, op in enumerate(sub_outs, 1):
+                    src = sources(op.id)
+                    if src:
+                        prog.append(_copy(row[wire(i, k)], row[src[0]]))
+                continue
+            if b.type in ('Inport', 'In'):
+                if parent is None and i in feeds:
+                    prog.append(_feed(row[i], feeds[i]))
+                continue
+            if b.type in ('Goto', 'From'):
+                tag = _sn(b.params.get('GotoTag', b.params.get('Tag', b.name)))
+                bus = buses.setdefault(tag, np.zeros(S))
+                if b.type == 'Goto':
+                    prog.append(_copy(bus, row[sources(i)[0]]) if sources(i) else _fill(bus))
+                else:
+                    prog.append(_copy(row[i], bus))
+                continue
+            if b.type in SINK_TYPES:
+                continue
+            factory = SIMULATORS.get(b.type)
+            if factory is None:
+                if b.type not in PASS_THROUGH:
+                    unsupported.append(paths[i])
+                factory = _pass_through
+            sim = factory(_Params(b, params.get(i, {}), S))
+            if i in sched.split:
+                prog.append(_op(sim.output, row[i], []))
+                updates.append(_op(sim.update, None, views(i)))
+            else:
+                prog.append(_op(sim, row[i], views(i)))
+        prog += updates
+        return prog
+
+    program = system(None, [])
+
+    # ---- Run ----
+    time    = np.empty(steps)
+    results = {b.name: np.zeros((S, steps)) for b in outports}
+    taps    = [(b.name, (sources(b.id) or [None])[0]) for b in outports]
+    probes  = {path: np.zeros((S, steps)) for path in signals}
+    probe_rows = [(probes[path], ids[path]) for path in signals]
+    reset   = bool(sched.loops)     # loop inputs read wires not yet set this step
+    t = 0.0
+    with np.errstate(all='ignore'):
+        for k in range(steps):
+            if reset:
+                w.fill(0.0)
+            for run in program:
+                run(k, t)
+            for name, src in taps:
+                if src is not None:
+                    results[name][:, k] = w[src]
+            for out, row in probe_rows:
+                out[:, k] = w[row]
+            time[k] = t
+            t += DT
+    return {'time': time, 'outputs': results, 'signals': probes, 'unsupported': unsupported}
+
+
+class _Params:
+    # A block's parameters as its emitter reads them, with per-scenario
+    # overrides taking precedence
+    __slots__ = ('block', 'over', 'n')
+
+    def __init__(self, block, over, n):
+        self.block = block
+        self.over  = over
+        self.n     = n
+
+    def num(self, keys, default):
+        # First of keys the block sets, non-numeric text replaced by default
+        for k in keys:
+            if k in self.over:
+                return self.over[k]
+        for k in keys:
+            if k in self.block.params:
+                return float(_sf(self.block.params[k], default))
+        return float(default)
+
+    def text(self, key, default):
+        return str(self.block.params.get(key, default))
+
+    def state(self, value=0.0):
+        return np.full(self.n, value, dtype=float)
+
+
+# ---- Program ops: run(k, t), over wire row views ----
+
+def _op(step, out, ins):
+    if out is None:
+        def run(k, t):
+            step(ins, t)
+    else:
+        def run(k, t):
+            out[...] = step(ins, t)
+    return run
+
+def _copy(dst, src):
+    def run(k, t):
+        dst[...] = src
+    return run
+
+def _fill(dst):
+    def run(k, t):
+        dst[...] = 0.0
+    return run
+
+def _feed(dst, trace):
+    def run(k, t):
+        dst[...] = trace[:, k]
+    return run
+
+
+def _in0(ins):
+    return ins[0] if ins else 0.0
+
+def _pass_through(p):
+    return lambda ins, t: _in0(ins)
+
+
+# ---- Sources and math ----
+
+@simulates('Constant')
+def _constant(p):
+    value = p.over.get('Value')
+    if value is None:
+        nums  = _NUMS.findall(p.text('Value', '1.0'))
+        value = _float(nums[0], 1.0) if nums else 1.0
+    return lambda ins, t: value
+
+@simulates('Ground')
+def _ground(p):
+    return lambda ins, t: 0.0
+
+@simulates('Gain')
+def _gain(p):
+    gain = p.num(('Gain',), '1.0')
+    return lambda ins, t: gain * _in0(ins)
+
+@simulates('Sum')
+def _sum(p):
+    signs = ''.join(ch for ch in p.text('Inputs', p.text('Signs', '++')) if ch in '+-')
+
+    def step(ins, t):
+        if not ins:
+            return 0.0
+        acc = 0.0
+        for k, x in enumerate(ins):
+            acc = acc - x if k < len(signs) and signs[k] == '-' else acc + x
+        return acc
+    return step
+
+@simulates('Product')
+def _product(p):
+    if '/' in p.text('Inputs', p.text('Multiplication', '**')):
+        def step(ins, t):
+            if len(ins) >= 2:
+                return np.where(ins[1] != 0.0, ins[0] / ins[1], 0.0)
+            x = _in0(ins)
+            return np.where(x != 0.0, 1.0 / x, 0.0)
+        return step
+
+    def step(ins, t):
+        if len(ins) < 2:
+            return _in0(ins) * _in0(ins)
+        acc = ins[0] * ins[1]
+        for x in ins[2:]:
+            acc = acc * x
+        return acc
+    return step
+
+@simulates('DotProduct')
+def _dot(p):
+    return lambda ins, t: ins[0] * ins[1] if len(ins) >= 2 else _in0(ins) * _in0(ins)
+
+@simulates('Abs')
+def _abs(p):
+    return lambda ins, t: np.abs(_in0(ins))
+
+@simulates('Sqrt')
+def _sqrt(p):
+    return lambda ins, t: np.sqrt(np.abs(_in0(ins)))
+
+def _c_round(x):
+    # C round(): halves away from zero
+    return np.copysign(np.floor(np.abs(x) + 0.5), x)
+
+_MATH = {
+    'exp':   lambda x, y: np.exp(x),
+    'log':   lambda x, y: np.log(np.abs(x) + 1e-10),
+    'log10': lambda x, y: np.log10(np.abs(x) + 1e-10),
+    'square':lambda x, y: x * x,
+    'sqrt':  lambda x, y: np.sqrt(np.abs(x)),
+    'pow':   lambda x, y: np.power(x, 2.0 if y is None else y),
+    'floor': lambda x, y: np.floor(x),
+    'ceil':  lambda x, y: np.ceil(x),
+    'round': lambda x, y: _c_round(x),
+    'mod':   lambda x, y: np.fmod(x, 1.0 if y is None else y),
+    'rem':   lambda x, y: x - (1.0 if y is None else y) * np.rint(x / (1.0 if y is None else y)),
+    'sign':  lambda x, y: np.sign(x),
+    '10^u':  lambda x, y: np.power(10.0, x),
+}
+
+@simulates('MathFunction')
+def _math(p):
+    fn = _MATH.get(p.text('Operator', p.text('Function', 'exp')).lower())
+    if fn is None:
+        return _pass_through(p)
+    return lambda ins, t: fn(_in0(ins), ins[1] if len(ins) > 1 else None)
+
+_TRIG = {'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'asin': np.arcsin, 'acos': np.arccos,
+         'atan': np.arctan, 'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh}
+
+@simulates('Trigonometry')
+def _trig(p):
+    op = p.text('Operator', 'sin').lower()
+    if op == 'atan2':
+        return lambda ins, t: np.arctan2(_in0(ins), ins[1] if len(ins) > 1 else 1.0)
+    fn = _TRIG.get(op, np.sin)
+    return lambda ins, t: fn(_in0(ins))
+
+@simulates('Quantizer')
+def _quantizer(p):
+    q = p.num(('QuantizationInterval',), '1.0')
+    return lambda ins, t: _c_round(_in0(ins) / q) * q
+
+
+# ---- Dynamic/state blocks ----
+
+class _Integrator:
+    # Forward Euler; step() updates then outputs, as the unsplit C does
+    __slots__ = ('x',)
+
+    def __init__(self, p):
+        self.x = p.state(p.num(('InitialCondition',), '0.0'))
+
+    def __call__(self, ins, t):
+        self.x += _in0(ins) * DT
+        return self.x
+
+    def output(self, ins, t):
+        return self.x
+
+    def update(self, ins, t):
+        self.x += _in0(ins) * DT
+
+simulates('Integrator')(_Integrator)
+
+
+class _Delay:
+    __slots__ = ('x', 'hold')
+
+    def __init__(self, p):
+        self.x    = p.state(p.num(('InitialCondition', 'X0'), '0.0'))
+        self.hold = p.block.type == 'ZeroOrderHold'
+
+    def __call__(self, ins, t):
+        if self.hold:
+            self.x[:] = _in0(ins)
+            return self.x
+        y = self.x.copy()
+        self.x[:] = _in0(ins)
+        return y
+
+    def output(self, ins, t):
+        return self.x
+
+    def update(self, ins, t):
+        self.x[:] = _in0(ins)
+
+simulates('UnitDelay', 'ZeroOrderHold', 'Memory')(_Delay)
+
+
+@simulates('Derivative')
+def _derivative(p):
+    prev = p.state()
+
+    def step(ins, t):
+        x = _in0(ins)
+        y = (x - prev) / DT
+        prev[:] = x
+        return y
+    return step
+
+@simulates('TransferFcn', 'DiscreteTransferFcn')
+def _transfer_fcn(p):
+    num = _NUMS.findall(p.text('Numerator', '[1]'))
+    den = _NUMS.findall(p.text('Denominator', '[1 1]'))
+    if len(den) < 2:
+        return _pass_through(p)
+    # The emitter pastes the coefficients in as C literals, so 1/2 is an
+    # integer division there
+    a = _c_quotient(den[1], den[0])
+    g = _c_quotient(num[0] if num else '1.0', den[0])
+    x = p.state()
+
+    def step(ins, t):
+        x[:] += (_in0(ins) - a * x) * DT
+        return g * x
+    return step
+
+
+# ---- Control blocks ----
+
+@simulates('Saturation')
+def _saturation(p):
+    hi = p.num(('UpperLimit', 'Upper'), '1.0')
+    lo = p.num(('LowerLimit', 'Lower'), '-1.0')
+    return lambda ins, t: np.maximum(np.minimum(_in0(ins), hi), lo)
+
+@simulates('Switch')
+def _switch(p):
+    thr  = p.num(('Threshold',), '0.5')
+    crit = p.text('Criteria', 'u2 >= Threshold')
+    cmp  = np.greater_equal if '>=' in crit else (np.greater if '>' in crit else np.not_equal)
+
+    def step(ins, t):
+        ctrl = ins[1] if len(ins) > 1 else _in0(ins)
+        return np.where(cmp(ctrl, thr), _in0(ins), ins[2] if len(ins) > 2 else 0.0)
+    return step
+
+@simulates('MultiPortSwitch')
+def _multiport_switch(p):
+    def step(ins, t):
+        n    = max(len(ins) - 1, 2)
+        case = np.trunc(_in0(ins))
+        out  = ins[1] if len(ins) > 1 else 0.0
+        for k in range(n - 1, -1, -1):
+            out = np.where(case == k, ins[k + 1] if k + 1 < len(ins) else 0.0, out)
+        return out
+    return step
+
+@simulates('PIDController')
+def _pid(p):
+    kp = p.num(('P', 'Kp'), '1.0')
+    ki = p.num(('I', 'Ki'), '0.1')
+    kd = p.num(('D', 'Kd'), '0.01')
+    acc, prev = p.state(), p.state()
+
+    def step(ins, t):
+        x = _in0(ins)
+        acc[:] += x * DT
+        d = (x - prev) / DT
+        prev[:] = x
+        return kp * x + ki * acc + kd * d
+    return step
+
+_RELATIONAL = {'==': np.equal, '!=': np.not_equal, '<': np.less, '>': np.greater,
+               '<=': np.less_equal, '>=': np.greater_equal}
+
+@simulates('RelationalOperator')
+def _relational(p):
+    op = p.text('Operator', p.text('RelOp', '=='))
+    if op in ('isnan', 'isinf'):
+        fn = np.isnan if op == 'isnan' else np.isinf
+        return lambda ins, t: fn(_in0(ins)).astype(float)
+    cmp = _RELATIONAL.get(op, np.equal)
+    return lambda ins, t: cmp(_in0(ins), ins[1] if len(ins) > 1 else 0.0).astype(float)
+
+@simulates('LogicOperator')
+def _logic(p):
+    op = p.text('Operator', 'AND').upper()
+    if op == 'NOT':
+        return lambda ins, t: np.equal(_in0(ins), 0.0).astype(float)
+
+    def step(ins, t):
+        # Inputs are cast to int first, as in the C; a lone input is
+        # passed on as that int
+        vals = [np.trunc(x) for x in ins] or [np.trunc(0.0)]
+        if len(vals) == 1:
+            return np.equal(vals[0], 0.0).astype(float) if op in ('NAND', 'NOR') else vals[0]
+        if op == 'XOR':
+            acc = vals[0]
+            for v in vals[1:]:
+                acc = np.not_equal(acc, v).astype(float)
+            return acc
+        truth = [v != 0.0 for v in vals]
+        acc = np.logical_or.reduce(truth) if op in ('OR', 'NOR') else np.logical_and.reduce(truth)
+        return np.asarray(~acc if op in ('NAND', 'NOR') else acc, dtype=float)
+    return step
+
+
+# ---- Signal sources ----
+# Every source's time is the same count of dt steps, so one clock serves all
+
+@simulates('SineWave')
+def _sine(p):
+    amp   = p.num(('Amplitude',), '1.0')
+    freq  = p.num(('Frequency',), '1.0')
+    bias  = p.num(('Bias',), '0.0')
+    phase = p.num(('Phase',), '0.0')
+    return lambda ins, t: bias + amp * np.sin(2.0 * 3.14159265358979 * freq * t + phase)
+
+@simulates('Step')
+def _step(p):
+    at     = p.num(('Time',), '1.0')
+    before = p.num(('Before',), '0.0')
+    after  = p.num(('After',), '1.0')
+    return lambda ins, t: np.where(t >= at, after, before)
+
+@simulates('DiscretePulseGenerator')
+def _pulse(p):
+    amp    = p.num(('Amplitude',), '1.0')
+    period = p.num(('Period',), '1.0')
+    duty   = p.num(('PulseWidth',), '50')
+    return lambda ins, t: np.where(np.fmod(t, period) < period * duty / 100.0, amp, 0.0)
+
+
+# ---- Helpers ----
+
+def _float(text, fallback):
+    try:
+        v = float(text)
+    except ValueError:
+        return fallback
+    return v if math.isfinite(v) else fallback
+
+def _c_quotient(a, b):
+    # a/b as C evaluates the two literals
+    if _INT.match(a) and _INT.match(b) and int(b) != 0:
+        q = abs(int(a)) // abs(int(b))
+        return float(q if (int(a) < 0) == (int(b) < 0) else -q)
+    return _float(a, 1.0) / _float(b, 1.0) if _float(b, 1.0) != 0.0 else math.inf
@@ -0,0 +1,254 @@
+import hashlib
+import re
+
+from converter.emitters import Emitter, _sc, _sn
+
+# ================================================================
+# Hierarchical subsystems.
+#
+# Every SubSystem block whose System was parsed becomes a function pair
+#
+#   typedef struct { ...state of the blocks inside... } <name>_State;
+#   void <name>_step(<name>_State *s, double dt, Signal <in>_in..., Signal *<out>_out...);
+#   void <name>_init(<name>_State *s);
+#
+# and each instance keeps one <name>_State. Subsystems with the same
+# canonical hash (block names, types, non-layout parameters, wiring and,
+# recursively, nested subsystem hashes) share a single definition.
+#
+# Blocks inside a definition are emitted by the ordinary emitters. Their
+# 'state' and 'mux' declarations become struct members and references to
+# them in step/init code are rewritten to go through `s`.
+# ================================================================
+
+SUBSYSTEM_TYPES = ('SubSystem', 'Subsystem')
+
+# Declaration sections holding per-instance data
+MEMBER_SECTIONS = ('state', 'mux')
+
+# Parameters that only describe the drawing, ignored when hashing
+LAYOUT_PARAMS = frozenset((
+    'BlockType', 'Name', 'Position', 'SID', 'ZOrder', 'Ports', 'Orientation',
+    'BlockMirror', 'BlockRotation', 'NamePlacement', 'ShowName', 'HideAutomaticName',
+    'ForegroundColor', 'BackgroundColor', 'DropShadow', 'FontName', 'FontSize',
+    'FontWeight', 'FontAngle', 'LibraryVersion', 'ContentPreviewEnabled',
+))
+
+_STATIC = re.compile(r'^static\s+(.+?)\s+(\w+)\s*((?:\[[^\]]*\])*)\s*(?:=.*)?;\s*$')
+_IDENT  = re.compile(r'(?<![\w.])(?<!->)[A-Za-z_]\w*')
+
+
+class Subsystem:
+    # One emitted definition, shared by every instance with the same hash
+    __slots__ = ('hash', 'fn', 'rep', 'members', 'inports', 'outports', 'instances', 'emitter')
+
+    def __init__(self, hash, rep, members):
+        self.hash      = hash
+        self.fn        = None
+        self.rep       = rep          # SubSystem block the code is generated from
+        self.members   = members      # block ids directly inside rep's System
+        self.inports   = []
+        self.outports  = []
+        self.instances = []
+        self.emitter   = None
+
+
+class SubsystemInstance(Emitter):
+    # Emitter for a SubSystem block that has a definition
+
+    def __init__(self, sub):
+        self.sub = sub
+
+    def declare(self, b, n):
+        return [('state', f"static {self.sub.fn}_State ss_{n};")]
+
+    def wires(self, b, n):
+        return [f"Signal sig_{n} = 0.0;"] + \
+               [f"Signal sig_{n}_{k} = 0.0;" for k in range(2, len(self.sub.outports) + 1)]
+
+    def step(self, c):
+        ins  = [c.ins[k] if k < len(c.ins) else "0.0" for k in range(len(self.sub.inports))]
+        outs = [f"&{c.out}" if k == 1 else f"&{c.out}_{k}"
+                for k in range(1, len(self.sub.outports) + 1)]
+        return [f"{self.sub.fn}_step({', '.join([f'&ss_{c.bn}', 'dt'] + ins + outs)});"]
+
+    def init(self, b, n):
+        return [f"{self.sub.fn}_init(&ss_{n});"]
+
+
+def analyze(model):
+    # -> (definitions children-first, {SubSystem block id: SubsystemInstance
+    # emitter}); both empty for a flat model.
+    blocks   = model.blocks
+    children = {}
+    for b in blocks:
+        if b.parent is not None:
+            children.setdefault(b.parent, []).append(b.id)
+    if not children:
+        return [], {}
+
+    # Connections never cross a System boundary, so each edge belongs to
+    # the System of its destination.
+    edges = {}
+    for c in model.connections:
+        p = blocks[c.dst].parent
+        if p is not None:
+            edges.setdefault(p, []).append(c)
+
+    by_hash = {}
+    defs    = []
+    inst    = {}
+    hashes  = {}
+
+    def visit(sid):
+        members = children[sid]
+        for m in members:
+            if m in children:
+                visit(m)
+        h = _hash(blocks, members, edges.get(sid, ()), hashes)
+        hashes[sid] = h
+        sub = by_hash.get(h)
+        if sub is None:
+            sub = by_hash[h] = Subsystem(h, sid, members)
+            sub.emitter = SubsystemInstance(sub)
+            defs.append(sub)
+        sub.instances.append(sid)
+        inst[sid] = sub.emitter
+
+    for sid in children:
+        if blocks[sid].parent is None:
+            visit(sid)
+
+    used = set()
+    for sub in defs:
+        base = _sn(blocks[sub.rep].name)
+        fn, k = base, 1
+        while fn in used:
+            k += 1
+            fn = f'{base}_{k}'
+        used.add(fn)
+        sub.fn = fn
+        sub.inports  = _ports(blocks, sub.members, ('Inport', 'In'))
+        sub.outports = _ports(blocks, sub.members, ('Outport', 'Out'))
+    return defs, inst
+
+
+def parse_static(line):
+    # 'static <type> <ident>[dims] = ...;' -> (type, ident, dims) or None
+    m = _STATIC.match(line)
+    return m.groups() if m else None
+
+
+def rewriter(mapping):
+    # -> text -> text, replacing every identifier found in mapping. Member
+    # accesses (x.ident, x->ident) are left alone.
+    if not mapping:
+        return lambda text: text
+    sub = lambda m: mapping.get(m[0], m[0])
+    return lambda text: _IDENT.sub(sub, text)
+
+
+def _hash(blocks, members, edges, hashes):
+    entries = sorted(
+        (blocks[m].name, blocks[m].type,
+         sorted((k, v) for k, v in blocks[m].params.items() if k not in LAYOUT_PARAMS),
+         hashes.get(m, ''))
+        for m in members
+    )
+    wiring = sorted((blocks[c.src].name, c.src_port, blocks[c.dst].name, c.dst_port)
+                    for c in edges)
+    return hashlib.sha1(repr((entries, wiring)).encode()).hexdigest()
+
+
+def _ports(blocks, members, types):
+    # Port blocks ordered by their Port parameter, then by appearance
+    found = [blocks[m] for m in members if blocks[m].type in types]
+    def number(b):
+        p = str(b.params.get('Port', '')).strip().strip('"')
+        return int(p) if p.isdigit() else len(found) + 1
+    return sorted(found, key=number)
+
+
+def emit_definition(sub, model, order, fragment, inputs, update=None, note=None):
+    # -> (file-level declarations [[section, text]], state struct, function
+    # definitions, stubs).
+    # order is the model-wide schedule; fragment/inputs are the generator's
+    # _fragment and input-naming helpers, passed in to avoid an import cycle,
+    # update(b, n, srcs) gives a split block's state update ('' otherwise)
+    # and note(id) the warning for an algebraic loop starting at a block.
+    blocks  = model.blocks
+    members = [blocks[m] for m in sub.members]
+    local   = {}
+    used    = set()
+    for b in members:
+        n = f'{sub.fn}_{_sn(b.name)}'
+        if n in used:
+            n = f'{n}_{b.id}'
+        used.add(n)
+        local[b.id] = n
+
+    frags = {b.id: fragment(b, local[b.id], inputs(b.id, local)) for b in members}
+
+    decls, state, stubs = [], [], []
+    for b in members:
+        decl, _, _, _, stub = frags[b.id]
+        for key, text in decl:
+            if key in MEMBER_SECTIONS:
+                state += text.split('\n')
+            else:
+                decls.append([key, text])
+        if stub:
+            stubs.append(stub)
+
+    members_c, idents = [], []
+    for line in state:
+        var = parse_static(line)
+        if var:
+            ctype, ident, dims = var
+            members_c.append(f"    {ctype} {ident}{dims};")
+            idents.append(ident)
+        else:
+            members_c.append(f"    {line}")
+    through = rewriter({x: f's->{x}' for x in idents})
+
+    fn = sub.fn
+    params = [f"{fn}_State *s", "double dt"] + \
+             [f"Signal {local[b.id]}_in" for b in sub.inports] + \
+             [f"Signal *{local[b.id]}_out" for b in sub.outports]
+    # The struct is declared before the file-level state (root instances
+    # need it), the functions after every global they may reference.
+    types = [f"typedef struct {{  /* {_sc(blocks[sub.rep].name)} */"]
+    types += members_c or ["    char unused_;"]
+    types += [f"}} {fn}_State;", ""]
+
+    lines = [
+        "/* ================================================",
+        f"   Subsystem {_sc(blocks[sub.rep].name)} — {len(sub.instances)} instance(s)",
+        "   ================================================ */",
+    ]
+    lines.append(f"void {fn}_step({', '.join(params)}) {{")
+    lines.append("    (void)dt;")
+    lines += [frags[b.id][1] for b in members if frags[b.id][1]]
+    inside  = set(sub.members)
+    updates = []
+    for b in order:
+        if b.id in inside:
+            lines.append("")
+            if note and note(b.id):
+                lines.append(note(b.id))
+            lines.append(through(frags[b.id][2]))
+            text = update(b, local[b.id], inputs(b.id, local)) if update else ''
+            if text:
+                updates += ["", through(text)]
+    lines += updates
+    lines.append("")
+    for op in sub.outports:
+        srcs = inputs(op.id, local)
+        src  = f"sig_{srcs[0]}" if srcs else f"sig_{local[op.id]}"
+        lines.append(f"    *{local[op.id]}_out = {src};")
+    lines += ["}", ""]
+
+    lines.append(f"void {fn}_init({fn}_State *s) {{")
+    lines += [through(frags[b.id][3]) for b in members if frags[b.id][3]]
+    lines += ["    (void)s;", "}", ""]
+    return decls, '\n'.join(types), '\n'.join(lines), stubs
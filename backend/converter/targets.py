@@ -0,0 +1,425 @@
+import math
+import re
+
+from converter.emitters import (FALLBACK, DelayEmitter, Emitter, _NUMS, _LOGIC_OPS, _REL_OPS,
+                                _sc, _sf, emitter_for)
+
+# ================================================================
+# Numeric targets: generate_c_code(model, target=...).
+#
+#   'double'  the default
+#   'float'   single precision: Signal is float, math calls use the
+#             f-suffixed functions (sinf, fabsf, ...) and floating literals
+#             get an f suffix
+#   'qM.N'    fixed point, e.g. 'q16.16': Signal is an int32_t holding N
+#             fractional bits. Each coefficient (gains, PID gains, dt) is
+#             quantized with its own scaling, as many fractional bits as
+#             fit, and applied with a 64-bit multiply and shift.
+#
+# Fixed point has native code for the linear, stateful and logic blocks;
+# every other block runs its ordinary double code on converted copies of
+# its inputs and converts its outputs back, so the whole model still
+# works, just without the speed-up for those blocks.
+# ================================================================
+
+# The generator's sample time (model_step's dt)
+DT = 0.001
+
+
+class Target:
+    name = 'double'
+
+    def emitter(self, b, em):
+        # Emitter to use for block b, whose default is em
+        return em
+
+    def header(self, lines):
+        return lines
+
+    def literal(self, value):
+        # C expression for a double value as a Signal
+        return value
+
+    def to_double(self, expr):
+        return expr
+
+    def finish(self, text):
+        # Applied to every piece of generated text
+        return text
+
+DOUBLE = Target()
+
+
+# ---- Single precision ----
+
+_FLOAT_MATH = ('sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'sinh', 'cosh', 'tanh',
+               'exp', 'log', 'log10', 'sqrt', 'pow', 'fabs', 'fmod', 'floor', 'ceil', 'round',
+               'remainder', 'creal', 'cimag')
+
+# Strings and comments are matched first so they pass through untouched
+_FLOAT_TOKENS = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|/\*[\s\S]*?\*/|//[^\n]*'
+    r'|\b(?:' + '|'.join(_FLOAT_MATH) + r')(?=\s*\()'
+    r'|\bdouble\b'
+    r'|(?<![\w.])(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.])'
+    r'|(?<![\w.])\d+[eE][-+]?\d+(?![\w.])'
+)
+
+
+def _float_token(m):
+    t = m[0]
+    if t[0] in '"/':
+        return t
+    if t == 'double':
+        return 'float'
+    return t + 'f'
+
+
+class FloatTarget(Target):
+    name = 'float'
+
+    def finish(self, text):
+        return _FLOAT_TOKENS.sub(_float_token, text)
+
+FLOAT = FloatTarget()
+
+
+# ---- Fixed point ----
+
+_QNAME = re.compile(r'^q(\d+)\.(\d+)$')
+
+# Blocks whose code only moves, adds or compares signals and so runs
+# unchanged on integers
+AGNOSTIC_TYPES = frozenset((
+    'Inport', 'In', 'Outport', 'Out', 'Ground', 'Sum', 'Mux', 'Demux', 'Concatenate',
+    'Selector', 'Reshape', 'BusCreator', 'BusSelector', 'Goto', 'From', 'Merge',
+    'Terminator', 'EnablePort', 'DataTypeConversion', 'Reference', 'SubSystem', 'Subsystem',
+    'SFunction',                    # user code, written against Signal
+))
+
+_STATE_DOUBLE = re.compile(r'^static\s+Signal\b', re.M)
+_WIRE_NAME    = re.compile(r'\bSignal\s+(\w+)')
+
+
+class FixedTarget(Target):
+
+    def __init__(self, ints, frac):
+        self.name = f'q{ints}.{frac}'
+        self.ints = ints
+        self.frac = frac
+        # Integrator states carry DT_FRAC extra bits and must fit 64
+        self.dt_q, self.dt_frac = self.coef(DT, 63 - 32)
+        self.inv_dt_q, self.inv_dt_frac = self.coef(1.0 / DT)
+        self._native = {}
+        for em in (_QConstant(self), _QGain(self), _QProduct(self), _QAbs(self),
+                   _QIntegrator(self), _QDelay(self), _QSaturation(self), _QSwitch(self),
+                   _QRelational(self), _QLogic(self), _QPID(self)):
+            for t in em.types:
+                self._native[t] = em
+        self._wrapped = {}
+
+    def q(self, value):
+        # Signal-scaled integer for a value
+        v = round(float(value) * (1 << self.frac))
+        if not -(1 << 31) <= v < (1 << 31):
+            raise ValueError(f'{value} is out of range for the {self.name} target')
+        return v
+
+    def coef(self, value, max_bits=62):
+        # -> (integer, fractional bits) for a multiplicative coefficient,
+        # scaled to keep as many significant bits as fit in 32
+        value = float(value)
+        if value == 0:
+            return 0, 0
+        bits = math.floor(math.log2(((1 << 31) - 1) / abs(value)))
+        if bits < 0:
+            raise ValueError(f'Coefficient {value} does not fit the {self.name} target')
+        bits = min(bits, max_bits)
+        return round(value * (1 << bits)), bits
+
+    def emitter(self, b, em):
+        if em is not emitter_for(b.type):
+            return em                       # subsystem instance, batch sink
+        if b.type in self._native:
+            return self._native[b.type]
+        if em is FALLBACK or b.type in AGNOSTIC_TYPES:
+            return em
+        wrapped = self._wrapped.get(id(em))
+        if wrapped is None:
+            wrapped = self._wrapped[id(em)] = _DoubleFallback(em)
+        return wrapped
+
+    def header(self, lines):
+        out = []
+        for line in lines:
+            if line == "typedef double Signal;":
+                out += [
+                    "#include <stdint.h>",
+                    "",
+                    f"typedef int32_t Signal;     /* Q{self.ints}.{self.frac} fixed point */",
+                    "typedef int64_t SignalAcc;  /* Products and accumulators */",
+                    f"#define Q_FRAC {self.frac}",
+                    "#define Q_ONE  ((Signal)1 << Q_FRAC)",
+                    "#define Q_TO_DOUBLE(x)   ((double)(x) / Q_ONE)",
+                    "#define Q_FROM_DOUBLE(x) ((Signal)((x) * Q_ONE + ((x) < 0 ? -0.5 : 0.5)))",
+                    "/* a * b, where b has `frac` fractional bits */",
+                    "#define Q_MUL(a, b, frac) ((Signal)(((SignalAcc)(a) * (b)) >> (frac)))",
+                    f"#define DT_Q      {self.dt_q}  /* dt = {DT:g} */",
+                    f"#define DT_FRAC   {self.dt_frac}",
+                    f"#define INV_DT_Q    {self.inv_dt_q}  /* 1 / dt */",
+                    f"#define INV_DT_FRAC {self.inv_dt_frac}",
+                ]
+            else:
+                out.append(line)
+        return out
+
+    def literal(self, value):
+        return str(self.q(value))
+
+    def to_double(self, expr):
+        return f"Q_TO_DOUBLE({expr})"
+
+
+def target_for(name):
+    if name in (None, 'double'):
+        return DOUBLE
+    if name == 'float':
+        return FLOAT
+    m = _QNAME.match(str(name).lower())
+    if m:
+        ints, frac = int(m[1]), int(m[2])
+        if ints + frac == 32 and 1 <= frac <= 30:
+            return FixedTarget(ints, frac)
+    raise ValueError(f"Unknown target: {name} (use 'double', 'float' or 'qM.N' with M + N = 32)")
+
+
+class _DoubleFallback(Emitter):
+    # Runs a block's ordinary code in double precision: its state is
+    # declared double, and its step works on double copies of its inputs
+    # and wires inside a scope where Signal is double, then converts back.
+
+    def __init__(self, em):
+        self.em    = em
+        self.types = em.types
+
+    def declare(self, b, n):
+        return [(key, _STATE_DOUBLE.sub('static double', line) if key == 'state' else line)
+                for key, line in self.em.declare(b, n)]
+
+    def wires(self, b, n):
+        return self.em.wires(b, n)
+
+    def step(self, c):
+        wires = _WIRE_NAME.findall('\n'.join(self.em.wires(c.block, c.bn)))
+        ins   = [s for s in dict.fromkeys(c.ins) if s not in wires]
+        code  = ["{"]
+        code += [f"    const double q_in{k} = Q_TO_DOUBLE({s});" for k, s in enumerate(ins)]
+        code += [f"    double q_{w};" for w in wires]
+        code += ["    {", "        typedef double Signal;"]
+        code += [f"        const Signal {s} = q_in{k};" for k, s in enumerate(ins)]
+        code += [f"        Signal {w} = 0.0;" for w in wires]
+        code += [f"        {line}" for line in self.em.step(c)]
+        code += [f"        q_{w} = {w};" for w in wires]
+        code += ["    }"]
+        code += [f"    {w} = Q_FROM_DOUBLE(q_{w});" for w in wires]
+        return code + ["}"]
+
+    def init(self, b, n):
+        return self.em.init(b, n)
+
+    def stub(self, b, n):
+        return self.em.stub(b, n)
+
+
+# ---- Native fixed-point emitters ----
+
+class _QEmitter(Emitter):
+
+    def __init__(self, t):
+        self.t = t
+
+    def mul(self, expr, value):
+        # expr * value for a constant coefficient
+        q, bits = self.t.coef(value)
+        return f"Q_MUL({expr}, {q}, {bits})"
+
+
+class _QConstant(_QEmitter):
+    types = ('Constant',)
+
+    def declare(self, b, n):
+        v = _sf(b.params.get('Value', '1.0'), '1.0')
+        if '[' in v or ';' in v:
+            nums = _NUMS.findall(v)
+            if nums:
+                vals = ', '.join(str(self.t.q(x)) for x in nums)
+                return [('const', f"static const Signal CONST_{n.upper()}[{len(nums)}] = {{{vals}}};")]
+            return [('const', f"/* Constant {_sc(b.name)}: complex value = {v} */")]
+        return [('const', f"#define CONST_{n.upper()} ({self.t.q(v)})  /* {v} */")]
+
+    def step(self, c):
+        nums = _NUMS.findall(c.params.get('Value', '1.0'))
+        if nums and len(nums) == 1:
+            return [f"{c.out} = {self.t.q(nums[0])};  /* {nums[0]} */"]
+        elif nums:
+            return [f"{c.out} = {self.t.q(nums[0])};  /* vector constant — using first element */"]
+        return [f"{c.out} = Q_ONE;  /* TODO: set constant value */"]
+
+
+class _QGain(_QEmitter):
+    types = ('Gain',)
+
+    def _coefs(self, params):
+        v = _sf(params.get('Gain', '1.0'), '1.0')
+        nums = _NUMS.findall(v) if ('[' in v or ';' in v) else [v]
+        return v, nums or ['1.0']
+
+    def declare(self, b, n):
+        v, nums = self._coefs(b.params)
+        if len(nums) > 1:
+            bits = min(self.t.coef(x)[1] for x in nums if float(x)) if any(map(float, nums)) else 0
+            vals = ', '.join(str(round(float(x) * (1 << bits))) for x in nums)
+            return [('gain', f"static const Signal GAIN_{n.upper()}[{len(nums)}] = {{{vals}}};  /* {bits} fractional bits */")]
+        q, bits = self.t.coef(nums[0])
+        return [('gain', f"static const Signal GAIN_{n.upper()} = {q};  /* {v}, {bits} fractional bits */")]
+
+    def step(self, c):
+        _, nums = self._coefs(c.params)
+        if len(nums) > 1:
+            bits = min(self.t.coef(x)[1] for x in nums if float(x)) if any(map(float, nums)) else 0
+            return [f"{c.out} = Q_MUL({c.in0}, GAIN_{c.bn.upper()}[0], {bits});  /* TODO: check matrix gain */"]
+        _, bits = self.t.coef(nums[0])
+        return [f"{c.out} = Q_MUL({c.in0}, GAIN_{c.bn.upper()}, {bits});"]
+
+
+class _QProduct(_QEmitter):
+    types = ('Product', 'DotProduct')
+
+    def step(self, c):
+        ins, in0, out = c.ins, c.in0, c.out
+        op = c.params.get('Inputs', c.params.get('Multiplication', '**'))
+        if c.bt == 'Product' and '/' in op:
+            num, den = (ins[0], ins[1]) if len(ins) >= 2 else ('Q_ONE', in0)
+            return [f"{out} = ({den} != 0) ? (Signal)(((SignalAcc)({num}) << Q_FRAC) / {den}) : 0;"]
+        expr = ins[0] if len(ins) >= 2 else in0
+        for s in (ins[1:] if len(ins) >= 2 else [in0]):
+            expr = f"Q_MUL({expr}, {s}, Q_FRAC)"
+        return [f"{out} = {expr};"]
+
+
+class _QAbs(_QEmitter):
+    types = ('Abs',)
+
+    def step(self, c):
+        return [f"{c.out} = ({c.in0} < 0) ? -{c.in0} : {c.in0};"]
+
+
+class _QIntegrator(_QEmitter):
+    # The state keeps DT_FRAC extra fractional bits so small increments
+    # are not lost
+    types = ('Integrator',)
+
+    def declare(self, b, n):
+        return [('state', f"static SignalAcc state_{n} = 0;")]
+
+    def step(self, c):
+        method = _sc(c.params.get('IntegratorMethod', 'Forward Euler'))
+        return [
+            f"state_{c.bn} += (SignalAcc){c.in0} * DT_Q;  /* {method} integration */",
+            f"{c.out} = (Signal)(state_{c.bn} >> DT_FRAC);"
+        ]
+
+    def output(self, c):
+        return [f"{c.out} = (Signal)(state_{c.bn} >> DT_FRAC);"]
+
+    def update(self, c):
+        method = _sc(c.params.get('IntegratorMethod', 'Forward Euler'))
+        return [f"state_{c.bn} += (SignalAcc){c.in0} * DT_Q;  /* {method} integration */"]
+
+    def init(self, b, n):
+        ic = _sf(b.params.get('InitialCondition', '0.0'), '0.0')
+        return [f"state_{n} = (SignalAcc){self.t.q(ic)} << DT_FRAC;"]
+
+
+class _QDelay(DelayEmitter):
+
+    def __init__(self, t):
+        self.t = t
+
+    def init(self, b, n):
+        ic = _sf(b.params.get('InitialCondition', b.params.get('X0', '0.0')), '0.0')
+        return [f"delay_{n} = {self.t.q(ic)};"]
+
+
+class _QSaturation(_QEmitter):
+    types = ('Saturation',)
+
+    def step(self, c):
+        hi = self.t.q(_sf(c.params.get('UpperLimit', c.params.get('Upper', '1.0')),  '1.0'))
+        lo = self.t.q(_sf(c.params.get('LowerLimit', c.params.get('Lower', '-1.0')), '-1.0'))
+        return [
+            f"{c.out} = {c.in0};",
+            f"if ({c.out} > {hi}) {c.out} = {hi};",
+            f"if ({c.out} < {lo}) {c.out} = {lo};"
+        ]
+
+
+class _QSwitch(_QEmitter):
+    types = ('Switch',)
+
+    def step(self, c):
+        thr  = self.t.q(_sf(c.params.get('Threshold', '0.5'), '0.5'))
+        ctrl = c.ins[1] if len(c.ins) > 1 else c.in0
+        in2  = c.ins[2] if len(c.ins) > 2 else '0'
+        crit = c.params.get('Criteria', 'u2 >= Threshold')
+        op   = '>=' if '>=' in crit else ('>' if '>' in crit else '!=')
+        return [f"{c.out} = ({ctrl} {op} {thr}) ? {c.in0} : {in2};"]
+
+
+class _QRelational(_QEmitter):
+    types = ('RelationalOperator',)
+
+    def step(self, c):
+        cop = _REL_OPS.get(c.params.get('Operator', c.params.get('RelOp', '==')), '==')
+        in1 = c.ins[1] if len(c.ins) > 1 else '0'
+        if cop in ('isnan', 'isinf'):
+            return [f"{c.out} = 0;  /* {cop}: never true in fixed point */"]
+        return [f"{c.out} = ({c.in0} {cop} {in1}) ? Q_ONE : 0;"]
+
+
+class _QLogic(_QEmitter):
+    types = ('LogicOperator',)
+
+    def step(self, c):
+        op_str = c.params.get('Operator', 'AND').upper()
+        lop = _LOGIC_OPS.get(op_str, ' && ')
+        if op_str == 'NOT':
+            return [f"{c.out} = ({c.in0} == 0) ? Q_ONE : 0;"]
+        expr = lop.join(f"({s} != 0)" for s in c.ins) if c.ins else f"({c.in0} != 0)"
+        if op_str in ('NAND', 'NOR'):
+            expr = f"!({expr})"
+        return [f"{c.out} = ({expr}) ? Q_ONE : 0;"]
+
+
+class _QPID(_QEmitter):
+    types = ('PIDController',)
+
+    def declare(self, b, n):
+        return [('state', f"static SignalAcc pid_int_{n} = 0;"),
+                ('state', f"static Signal pid_prev_{n} = 0;")]
+
+    def step(self, c):
+        kp = _sf(c.params.get('P',  c.params.get('Kp', '1.0')),  '1.0')
+        ki = _sf(c.params.get('I',  c.params.get('Ki', '0.1')),  '0.1')
+        kd = _sf(c.params.get('D',  c.params.get('Kd', '0.01')), '0.01')
+        bn, in0 = c.bn, c.in0
+        return [
+            f"pid_int_{bn} += (SignalAcc){in0} * DT_Q;",
+            f"Signal pid_d_{bn} = Q_MUL({in0} - pid_prev_{bn}, INV_DT_Q, INV_DT_FRAC);",
+            f"{c.out} = {self.mul(in0, kp)} + {self.mul(f'(Signal)(pid_int_{bn} >> DT_FRAC)', ki)}"
+            f" + {self.mul(f'pid_d_{bn}', kd)};",
+            f"pid_prev_{bn} = {in0};"
+        ]
+
+    def init(self, b, n):
+        return [f"pid_int_{n} = 0;", f"pid_prev_{n} = 0;"]
@@ -0,0 +1,171 @@
+import sys
+from array import array
+
+# Enable/trigger/action ports sort after every numbered data port, so in0
+# is always the first data input.
+SPECIAL_PORT = 1000
+
+
+def port_number(value):
+    value = str(value or '').strip().strip('"')
+    if value.isdigit():
+        return int(value)
+    return SPECIAL_PORT if value else 1
+
+
+class Block:
+    # id is the block's index in Model.blocks; key is the identifier the
+    # source format used for it (SID, MDL counter...), kept for diagnostics.
+    # parent is the id of the SubSystem block whose System holds this block,
+    # None for the root System.
+    __slots__ = ('id', 'type', 'name', 'x', 'y', 'params', 'key', 'parent')
+
+    def __init__(self, id, type, name, x=0.0, y=0.0, params=None, key=None, parent=None):
+        self.id     = id
+        self.type   = type
+        self.name   = name
+        self.x      = x
+        self.y      = y
+        self.params = params if params is not None else {}
+        self.key    = key
+        self.parent = parent
+
+    def __repr__(self):
+        return f'Block({self.id}, {self.type!r}, {self.name!r})'
+
+
+class Connection:
+    # Ports are 1-based like Simulink's SrcPort/DstPort; stored inline as
+    # ints rather than as separate Port objects to keep edges small.
+    __slots__ = ('src', 'dst', 'src_port', 'dst_port')
+
+    def __init__(self, src, dst, src_port=1, dst_port=1):
+        self.src      = src
+        self.dst      = dst
+        self.src_port = src_port
+        self.dst_port = dst_port
+
+    def __repr__(self):
+        return f'Connection({self.src}:{self.src_port} -> {self.dst}:{self.dst_port})'
+
+
+class Model:
+    # Blocks plus CSR adjacency: the successors of block i are
+    # _out[_out_start[i]:_out_start[i+1]], predecessors likewise via _in
+    # (ordered by destination port, with the source port of each in
+    # _in_port). Built once, read by everything after.
+    __slots__ = ('blocks', 'connections', '_out_start', '_out',
+                 '_in_start', '_in', '_in_port', '_by_type')
+
+    def __init__(self, blocks, connections):
+        self.blocks      = blocks
+        self.connections = connections
+        n = len(blocks)
+
+        out_deg = [0] * (n + 1)
+        in_deg  = [0] * (n + 1)
+        for c in connections:
+            out_deg[c.src + 1] += 1
+            in_deg[c.dst + 1]  += 1
+        for i in range(n):
+            out_deg[i + 1] += out_deg[i]
+            in_deg[i + 1]  += in_deg[i]
+        self._out_start = array('i', out_deg)
+        self._in_start  = array('i', in_deg)
+
+        self._out = array('i', bytes(4 * len(connections)))
+        self._in  = array('i', bytes(4 * len(connections)))
+        self._in_port = array('i', bytes(4 * len(connections)))
+        fill_out = out_deg[:n]
+        fill_in  = in_deg[:n]
+        for c in sorted(connections, key=lambda c: (c.dst, c.dst_port)):
+            self._in[fill_in[c.dst]] = c.src
+            self._in_port[fill_in[c.dst]] = c.src_port
+            fill_in[c.dst] += 1
+        for c in connections:
+            self._out[fill_out[c.src]] = c.dst
+            fill_out[c.src] += 1
+
+        self._by_type = {}
+        for b in blocks:
+            self._by_type.setdefault(b.type, []).append(b)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def successors(self, i):
+        return self._out[self._out_start[i]:self._out_start[i + 1]]
+
+    def predecessors(self, i):
+        return self._in[self._in_start[i]:self._in_start[i + 1]]
+
+    def source_ports(self, i):
+        # Output port of each predecessor, aligned with predecessors(i)
+        return self._in_port[self._in_start[i]:self._in_start[i + 1]]
+
+    def of_type(self, *types):
+        if len(types) == 1:
+            return self._by_type.get(types[0], [])
+        found = [b for t in types for b in self._by_type.get(t, ())]
+        return sorted(found, key=lambda b: b.id)
+
+    def to_diagram(self):
+        return {
+            'blocks': [
+                {'id': str(b.id), 'type': b.type, 'name': b.name,
+                 'x': float(b.x), 'y': float(b.y),
+                 'parent': None if b.parent is None else str(b.parent)}
+                for b in self.blocks
+            ],
+            'connections': [
+                {'from': str(c.src), 'to': str(c.dst)}
+                for c in self.connections
+            ]
+        }
+
+    @classmethod
+    def from_dicts(cls, blocks, connections):
+        # Adapter for the legacy list-of-dicts form: {'id','type','name',...}
+        # blocks and {'from','to'} connections by id or by block name.
+        mb = ModelBuilder()
+        by_key = {}
+        by_name = {}
+        for b in blocks:
+            i = mb.add_block(b['type'], b['name'], b.get('x', 0.0), b.get('y', 0.0),
+                             b.get('params') or {}, key=str(b['id']))
+            by_key[str(b['id'])] = i
+            by_name.setdefault(b['name'], i)
+        for c in connections:
+            s = str(c.get('from', '')).strip()
+            d = str(c.get('to', '')).strip()
+            s = by_key[s] if s in by_key else by_name.get(s)
+            d = by_key[d] if d in by_key else by_name.get(d)
+            if s is not None and d is not None:
+                mb.connect(s, d)
+        return mb.build()
+
+
+class ModelBuilder:
+
+    def __init__(self):
+        self.blocks      = []
+        self.connections = []
+        self._seen       = set()
+
+    def add_block(self, type, name, x=0.0, y=0.0, params=None, key=None, parent=None):
+        i = len(self.blocks)
+        self.blocks.append(Block(i, sys.intern(type), name, float(x), float(y), params, key, parent))
+        return i
+
+    def connect(self, src, dst, src_port=1, dst_port=1):
+        # Self-loops and exact duplicates carry no information for codegen
+        if src == dst:
+            return
+        k = (src, dst, src_port, dst_port)
+        if k in self._seen:
+            return
+        self._seen.add(k)
+        self.connections.append(Connection(src, dst, src_port, dst_port))
+
+    def build(self):
+        return Model(self.blocks, self.connections)
@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from parsers.source import is_path
+from pipeline import convert_file
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# CPU-bound Python parsing goes to processes (sidesteps the GIL); image OCR
+# already runs tesseract out of process, so threads are enough there.
+DEFAULT_POOLS = {
+    'slx': 'process', 'mdl': 'process', 'pdf': 'process',
+    'png': 'thread', 'jpg': 'thread', 'jpeg': 'thread', 'bmp': 'thread',
+}
+
+
+class JobStore:
+    # One JSON status file (and one result file) per job in a directory, so
+    # any gunicorn worker can answer a poll and worker processes can report
+    # progress without shared memory or an external queue.
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def create(self, filename, ext):
+        job = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'type': ext,
+            'status': 'queued',
+            'stage': 'queued',
+            'progress': 0.0,
+            'error': None,
+            'created': time.time(),
+            'updated': time.time(),
+        }
+        self._write(self._path(job['id']), job)
+        return job
+
+    def get(self, job_id):
+        if not JOB_ID.match(job_id):
+            return None
+        return self._read(self._path(job_id))
+
+    def update(self, job_id, **fields):
+        job = self.get(job_id) or {'id': job_id}
+        job.update(fields)
+        job['updated'] = time.time()
+        self._write(self._path(job_id), job)
+        return job
+
+    def put_result(self, job_id, result):
+        self._write(self._path(job_id, 'result'), result)
+
+    def get_result(self, job_id):
+        if not JOB_ID.match(job_id):
+            return None
+        return self._read(self._path(job_id, 'result'))
+
+    def delete(self, job_id):
+        for kind in ('status', 'result'):
+            try:
+                os.remove(self._path(job_id, kind))
+            except OSError:
+                pass
+
+    def prune(self, max_age):
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ---- internals ----
+
+    def _path(self, job_id, kind='status'):
+        return os.path.join(self.root, f'{job_id}.{kind}.json')
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, obj):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(obj, f)
+        os.replace(tmp, path)
+
+
+def _run_job(store_root, job_id, filepath, ext):
+    # Module-level so it can be pickled into a process pool worker
+    store = JobStore(store_root)
+    store.update(job_id, status='running', stage='starting', progress=0.05)
+
+    def progress(stage, fraction):
+        store.update(job_id, stage=stage, progress=fraction)
+
+    try:
+        result = convert_file(filepath, ext, progress)
+        store.put_result(job_id, result)
+        store.update(job_id, status='done', stage='done', progress=1.0)
+        return result
+    except Exception as e:
+        store.update(job_id, status='failed', stage='failed', error=str(e))
+        return None
+    finally:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+
+class JobRunner:
+
+    def __init__(self, store, upload_dir, cache=None, pools=None,
+                 max_workers=2, max_pending=32, ttl=3600):
+        self.store       = store
+        self.upload_dir  = upload_dir
+        self.cache       = cache
+        self.pools       = dict(DEFAULT_POOLS, **(pools or {}))
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl         = ttl
+        self._executors = {}
+        self._pending   = 0
+        self._lock      = threading.Lock()
+
+    def submit(self, data, filename, ext):
+        # data: the upload's bytes, or the path of the temp file it was
+        # spilled to (moved into the job). Returns the job, or None when the
+        # queue is full
+        self.store.prune(self.ttl)
+
+        key = self.cache.key_for(data, ext) if self.cache else None
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            job = self.store.create(filename, ext)
+            self.store.put_result(job['id'], cached)
+            return self.store.update(job['id'], status='done', stage='done',
+                                     progress=1.0, cached=True)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+
+        job = self.store.create(filename, ext)
+        filepath = os.path.join(self.upload_dir, f"{job['id']}.{ext}")
+        try:
+            if is_path(data):
+                shutil.move(data, filepath)     # an upload already spilled to disk
+            else:
+                with open(filepath, 'wb') as f:
+                    f.write(data)
+            executor, future = self._submit(ext, job['id'], filepath)
+        except BaseException:
+            # Nothing will run the job: undo the slot, the status file and
+            # the upload (moved back, so the request still cleans it up)
+            with self._lock:
+                self._pending -= 1
+            self.store.delete(job['id'])
+            if os.path.exists(filepath):
+                if is_path(data):
+                    shutil.move(filepath, data)
+                else:
+                    os.remove(filepath)
+            raise
+
+        future.add_done_callback(
+            lambda fut: self._finished(fut, executor, key, job['id'], filepath))
+        return job
+
+    def _submit(self, ext, job_id, filepath):
+        # -> (executor, future)
+        executor = self._executor(ext)
+        try:
+            return executor, executor.submit(_run_job, self.store.root, job_id, filepath, ext)
+        except BrokenProcessPool:
+            # A worker died since the last job finished; start a new pool
+            self._discard(executor)
+            executor = self._executor(ext)
+            return executor, executor.submit(_run_job, self.store.root, job_id, filepath, ext)
+
+    def _finished(self, future, executor, key, job_id, filepath):
+        with self._lock:
+            self._pending -= 1
+        try:
+            result = future.result()
+        except Exception as e:
+            # Worker process died (OOM, SIGKILL) before the job could record
+            # it; a broken pool is replaced for the jobs that follow
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            self.store.update(job_id, status='failed', stage='failed',
+                              error=f'Conversion worker crashed: {e}')
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return
+        if result is not None and self.cache and key:
+            self.cache.put(key, result)
+
+    def _executor(self, ext):
+        kind = self.pools.get(ext, 'thread')
+        with self._lock:
+            if kind not in self._executors:
+                cls = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+                self._executors[kind] = cls(max_workers=self.max_workers)
+            return self._executors[kind]
+
+    def _discard(self, executor):
+        with self._lock:
+            for kind, current in list(self._executors.items()):
+                if current is executor:
+                    del self._executors[kind]
+        executor.shutdown(wait=False)
+
+
+def runner_from_env(upload_dir, cache=None):
+    # SIMTOC_JOB_POOLS="pdf=thread,png=process" overrides the per-type pool
+    pools = {}
+    for item in os.environ.get('SIMTOC_JOB_POOLS', '').split(','):
+        if '=' in item:
+            ext, kind = item.split('=', 1)
+            pools[ext.strip().lower()] = kind.strip().lower()
+
+    root = os.environ.get('SIMTOC_JOB_DIR') or os.path.join(upload_dir, 'jobs')
+    return JobRunner(
+        JobStore(root), upload_dir, cache=cache, pools=pools,
+        max_workers=int(os.environ.get('SIMTOC_JOB_WORKERS', 2)),
+        max_pending=int(os.environ.get('SIMTOC_JOB_QUEUE', 32)),
+        ttl=int(os.environ.get('SIMTOC_JOB_TTL', 3600)),
+    )
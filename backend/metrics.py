@@ -0,0 +1,162 @@
+import bisect
+import contextlib
+import os
+import threading
+from contextvars import ContextVar
+from time import perf_counter
+
+# ================================================================
+# Stage timers and Prometheus-format metrics.
+#
+# Code under measurement wraps its work in `with stage('parse'):`. Timings
+# are only collected inside a begin()/end() window opened by the request
+# handler; outside one (or with SIMTOC_METRICS=0) stage() hands back a
+# shared no-op context manager, so instrumented code costs one ContextVar
+# lookup per stage and nothing else.
+#
+# Histograms live in the process that serves the request — under gunicorn
+# each worker reports its own counts.
+# ================================================================
+
+ENABLED = os.environ.get('SIMTOC_METRICS', '1') != '0'
+
+_current = ContextVar('simtoc_stage_timings', default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ('name', 'timings', 't0')
+
+    def __init__(self, name, timings):
+        self.name    = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.append((self.name, perf_counter() - self.t0))
+        return False
+
+
+def stage(name):
+    timings = _current.get()
+    if timings is None:
+        return _NOOP
+    return _Stage(name, timings)
+
+
+def begin():
+    # -> (timings list, token) or (None, None) when metrics are disabled
+    if not ENABLED:
+        return None, None
+    timings = []
+    return timings, _current.set(timings)
+
+
+def end(token):
+    if token is not None:
+        _current.reset(token)
+
+
+def server_timing(timings):
+    # Repeated stages (e.g. per-page OCR) are summed into one entry
+    totals = {}
+    for name, secs in timings:
+        totals[name] = totals.get(name, 0.0) + secs
+    return ', '.join(f'{name};dur={secs * 1000:.1f}' for name, secs in totals.items())
+
+
+# ---- Registry ----
+
+class Histogram:
+
+    def __init__(self, name, help, labels, buckets):
+        self.name    = name
+        self.help    = help
+        self.labels  = labels
+        self.buckets = list(buckets)
+        self._series = {}      # label values -> [bucket counts..., sum, count]
+        self._lock   = threading.Lock()
+
+    def observe(self, values, x):
+        i = bisect.bisect_left(self.buckets, x)
+        with self._lock:
+            s = self._series.get(values)
+            if s is None:
+                s = self._series[values] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += x
+            s[-1] += 1
+
+    def render(self):
+        out = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for values, s in series:
+            lbl = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, values))
+            acc = 0
+            for b, n in zip(self.buckets, s):
+                acc += n
+                out.append(f'{self.name}_bucket{{{lbl},le="{b:g}"}} {acc}')
+            out.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {s[-1]}')
+            out.append(f'{self.name}_sum{{{lbl}}} {s[-2]:.6f}')
+            out.append(f'{self.name}_count{{{lbl}}} {s[-1]}')
+        return out
+
+
+class Counter:
+
+    def __init__(self, name, help, labels):
+        self.name   = name
+        self.help   = help
+        self.labels = labels
+        self._values = {}
+        self._lock   = threading.Lock()
+
+    def inc(self, values, n=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + n
+
+    def render(self):
+        out = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, n in items:
+            lbl = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, values))
+            out.append(f'{self.name}{{{lbl}}} {n}')
+        return out
+
+
+STAGE_SECONDS = Histogram(
+    'simtoc_stage_seconds', 'Time spent in each conversion stage.',
+    ('file_type', 'stage'),
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+BLOCK_COUNT = Histogram(
+    'simtoc_model_blocks', 'Blocks per converted model.',
+    ('file_type',),
+    (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000))
+CONVERSIONS = Counter(
+    'simtoc_conversions_total', 'Conversions by outcome.',
+    ('file_type', 'outcome'))
+
+
+def observe(ext, timings, outcome, block_count=None):
+    if not ENABLED:
+        return
+    CONVERSIONS.inc((ext, outcome))
+    if timings:
+        for name, secs in timings:
+            STAGE_SECONDS.observe((ext, name), secs)
+    if block_count is not None:
+        BLOCK_COUNT.observe((ext,), block_count)
+
+
+def render(extra=()):
+    lines = []
+    for metric in (STAGE_SECONDS, BLOCK_COUNT, CONVERSIONS):
+        lines += metric.render()
+    lines += list(extra)
+    return '\n'.join(lines) + '\n'
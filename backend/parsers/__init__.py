@@ -0,0 +1,3 @@
+# Bump whenever a parser change alters the blocks/connections it produces,
+# so cached conversions from older parsers are not served.
+PARSER_VERSION = '10'
@@ -2,104 +2,467 @@ import cv2
 import numpy as np
 import pytesseract
 from PIL import Image
+import math
 import os
 
+from ir import SPECIAL_PORT, ModelBuilder
+from metrics import stage
+from parsers.keywords import KeywordMatcher
+from parsers.source import is_path, read_bytes
+from parsers.spatial import GridIndex
+from parsers.wiring import wire_connections
+
 # Mac: tesseract is found automatically via Homebrew
 # No need to set path manually on Mac
 
+# Contours are found on a downscaled copy whose longest side is at most
+# this many pixels, unless that would thin the typical stroke below
+# MIN_STROKE pixels; rectangles are mapped back to full resolution for OCR
+DETECT_MAX_SIDE = int(os.environ.get('SIMTOC_IMAGE_DETECT_SIDE', 3000))
+MIN_STROKE      = 3.0
+
+# Rows and columns sampled to measure stroke width
+STROKE_SAMPLES = 256
+
+# Blur and edge detection run in tiles of this side past it, plus a halo
+# covering the filter windows, so their buffers stay tile-sized
+TILE = 2048
+HALO = 16
+
+# Block candidates: minimum size in full-resolution pixels, and the
+# longest side at most MAX_ASPECT times the shortest
+MIN_WIDTH  = 30
+MIN_HEIGHT = 20
+MAX_ASPECT = 8.0
+
+# Hierarchy: a contour that is not four-cornered still outlines a container
+# when its segments lying along its bounding box cover this much of the box
+# perimeter; wires drawn inside or across the container break the corners,
+# not the sides
+BOX_COVER = 0.9
+
+# Overlapping candidates keep the largest. With SIMTOC_IMAGE_HIERARCHY=1,
+# boxes nested inside another (subsystem contents) are kept as blocks too;
+# only near-duplicates, IoU above NMS_IOU, are dropped
+HIERARCHY = os.environ.get('SIMTOC_IMAGE_HIERARCHY', '0') == '1'
+NMS_IOU   = 0.5
+
+# Downscaled images are OCR'd as one sheet of full-resolution crops
+SHEET_WIDTH = 4096
+SHEET_PAD   = 32
+
 KNOWN_BLOCKS = [
     'gain', 'sum', 'integrator', 'derivative', 'scope', 'constant',
     'inport', 'outport', 'product', 'saturation', 'switch', 'mux',
     'demux', 'step', 'sine', 'pulse', 'transfer', 'pid', 'delay',
     'state', 'zero', 'clock', 'subsystem', 'lookup'
 ]
+_MATCHER = KeywordMatcher(KNOWN_BLOCKS)
 
-def parse_image(filepath):
-    img = cv2.imread(filepath)
-    if img is None:
+def parse_image(source, ocr='page', hierarchy=HIERARCHY):
+    # ocr='page' runs tesseract once over the whole image and assigns words
+    # to rectangles; ocr='roi' is the original one-call-per-rectangle path.
+    # hierarchy=True keeps boxes nested in others, the outer ones becoming
+    # SubSystem blocks.
+    # source is a path or the encoded image (parsers/source.py). Decoded
+    # straight to grayscale: one byte per pixel, the only full-resolution
+    # buffer kept
+    with stage('decode'):
+        if is_path(source):
+            gray = cv2.imread(source, cv2.IMREAD_GRAYSCALE)
+        else:
+            gray = cv2.imdecode(np.frombuffer(read_bytes(source), np.uint8),
+                                cv2.IMREAD_GRAYSCALE)
+    if gray is None:
         raise ValueError("Could not read image. Try PNG or JPG format.")
+    large = max(gray.shape) > DETECT_MAX_SIDE
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    rects = _detect_rectangles(gray)
+    with stage('detect'):
+        scale = _detect_scale(gray)
+        small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale,
+                                                     interpolation=cv2.INTER_AREA)
+        rects = _detect_rectangles(small, scale, gray.shape, hierarchy)
+        parents = _parents(rects) if hierarchy else {}
+        containers = set(parents.values())
 
-    blocks = []
-    connections = []
+    mb = ModelBuilder()
 
     if rects:
+        texts = None
+        with stage('ocr'):
+            if ocr == 'page':
+                try:
+                    texts = _ocr_sheet(gray, rects) if large else _ocr_page(gray, rects)
+                except Exception:
+                    texts = None
+            if texts is None:
+                texts = _ocr_rois(gray, rects)
+
         for i, (x, y, w, h) in enumerate(rects):
-            roi = img[y:y+h, x:x+w]
-            roi_pil = Image.fromarray(cv2.cvtColor(roi, cv2.COLOR_BGR2RGB))
-            try:
-                text = pytesseract.image_to_string(roi_pil).strip().lower()
-            except:
-                text = ''
-
-            btype = _classify(text) if text else 'SubSystem'
+            text = texts[i]
+            btype = _classify(text) if text and i not in containers else 'SubSystem'
             bname = text[:15].strip().replace('\n', ' ') if text else f'Block_{i+1}'
 
-            blocks.append({
-                'id': str(i + 1),
-                'type': btype,
-                'name': bname or f'{btype}_{i+1}',
-                'x': float(x),
-                'y': float(y),
-                'params': {}
-            })
+            mb.add_block(btype, bname or f'{btype}_{i+1}', x, y, parent=parents.get(i))
+
+        with stage('wires'):
+            links = _detect_connections(small, scale, rects, containers)
+            if parents:
+                _connect_nested(mb, links, rects, parents)
+            else:
+                for src, src_port, dst, dst_port in links:
+                    mb.connect(src, dst, src_port, dst_port)
     else:
         # Fallback: OCR full image
         try:
-            full_text = pytesseract.image_to_string(Image.open(filepath)).lower()
+            with stage('ocr'):
+                full_text = pytesseract.image_to_string(Image.fromarray(gray)).lower()
         except:
             full_text = ''
 
         spacing = 150
-        found = [kw for kw in KNOWN_BLOCKS if kw in full_text]
+        hits = _MATCHER.count([full_text], cap=1)
+        found = [kw for kw in KNOWN_BLOCKS if kw in hits]
         for i, kw in enumerate(found):
             btype = kw.title()
-            blocks.append({
-                'id': str(i + 1),
-                'type': btype,
-                'name': f'{btype}_{i+1}',
-                'x': float(50 + (i % 5) * spacing),
-                'y': float(100 + (i // 5) * spacing),
-                'params': {}
-            })
-
-    # Connect blocks left to right
-    sorted_b = sorted(blocks, key=lambda b: b['x'])
-    for i in range(len(sorted_b) - 1):
-        connections.append({'from': sorted_b[i]['id'], 'to': sorted_b[i+1]['id']})
-
-    if not blocks:
+            mb.add_block(btype, f'{btype}_{i+1}',
+                         50 + (i % 5) * spacing, 100 + (i // 5) * spacing)
+
+        # No geometry to go on: chain the keyword blocks left to right
+        for i in range(len(mb.blocks) - 1):
+            mb.connect(i, i + 1)
+
+    if not mb.blocks:
         raise ValueError("No blocks identified from image.")
 
-    return blocks, connections
+    return mb.build()
+
+
+def _ocr_rois(img, rects):
+    texts = []
+    for x, y, w, h in rects:
+        roi_pil = Image.fromarray(img[y:y+h, x:x+w])
+        try:
+            texts.append(pytesseract.image_to_string(roi_pil).strip().lower())
+        except:
+            texts.append('')
+    return texts
+
+
+def _ocr_page(img, rects):
+    # One tesseract process for the whole image, whatever the block count
+    pil = Image.fromarray(img)
+    data = pytesseract.image_to_data(pil, output_type=pytesseract.Output.DICT)
+
+    index = GridIndex.for_rects(rects)
+    for i, r in enumerate(rects):
+        index.insert(i, r)
+
+    words = [[] for _ in rects]
+    for j, word in enumerate(data['text']):
+        word = word.strip()
+        if not word or float(data['conf'][j]) < 0:
+            continue
+        cx = data['left'][j] + data['width'][j] / 2
+        cy = data['top'][j]  + data['height'][j] / 2
+        hits = index.at_point(cx, cy)
+        if not hits:
+            continue
+        # Innermost rectangle wins when boxes are nested
+        best = min(hits, key=lambda k: rects[k][2] * rects[k][3])
+        line = (data['block_num'][j], data['par_num'][j], data['line_num'][j])
+        words[best].append((line, word))
+
+    texts = []
+    for ws in words:
+        out, prev = [], None
+        for line, word in ws:
+            if prev is not None:
+                out.append('\n' if line != prev else ' ')
+            out.append(word)
+            prev = line
+        texts.append(''.join(out).strip().lower())
+    return texts
+
+
+def _ocr_sheet(gray, rects):
+    # The full-resolution crop of every rectangle, packed in rows on a white
+    # sheet and read in one tesseract call: its cost follows the block area,
+    # not the page size
+    width = max(SHEET_WIDTH, max(w for _, _, w, _ in rects) + 2 * SHEET_PAD)
+    placed = []
+    x = y = SHEET_PAD
+    row = 0
+    for _, _, w, h in rects:
+        if x + w + SHEET_PAD > width:
+            x, y, row = SHEET_PAD, y + row + SHEET_PAD, 0
+        placed.append((x, y, w, h))
+        x += w + SHEET_PAD
+        row = max(row, h)
+
+    sheet = np.full((y + row + SHEET_PAD, width), 255, dtype=np.uint8)
+    for (rx, ry, w, h), (sx, sy, _, _) in zip(rects, placed):
+        sheet[sy:sy+h, sx:sx+w] = gray[ry:ry+h, rx:rx+w]
+    return _ocr_page(sheet, placed)
+
+
+def _detect_rectangles(small, scale, shape, hierarchy=False):
+    # Rectangles in full-resolution pixels, found in small (the image
+    # downscaled by scale from shape); size limits apply at full resolution
+    height, width = shape
+    edged = _edges(small)
+    # Every contour, not just the outermost: a block whose outline is
+    # joined to its wires still has a clean inner edge
+    contours, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    del edged
+    if not contours:
+        return []
+
+    # ---- Size and aspect, over every candidate at once ----
+    # Bounding boxes from the points of all contours laid end to end
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    starts = np.cumsum([0] + [len(c) for c in contours[:-1]])
+    lo = np.minimum.reduceat(points, starts)
+    boxes = np.hstack([lo, np.maximum.reduceat(points, starts) - lo + 1])
+    del points
+    if scale < 1.0:
+        boxes[:, 0], boxes[:, 2] = _to_full(boxes[:, 0], boxes[:, 2], scale, width)
+        boxes[:, 1], boxes[:, 3] = _to_full(boxes[:, 1], boxes[:, 3], scale, height)
+    w, h = boxes[:, 2], boxes[:, 3]
+    sized = np.flatnonzero((w > MIN_WIDTH) & (h > MIN_HEIGHT) & (w < width * 0.8) &
+                           (w <= h * MAX_ASPECT) & (h <= w * MAX_ASPECT))
+
+    # ---- Four-cornered outlines ----
+    # Polygon fitting is the costly step, so only survivors get it
+    quads = [i for i in sized.tolist()
+             if len(cv2.approxPolyDP(contours[i], 0.02 * cv2.arcLength(contours[i], True), True)) == 4
+             or hierarchy and _box_cover(contours[i]) >= BOX_COVER]
+    if not quads:
+        return []
+    boxes = boxes[quads]
+
+    # ---- Non-max suppression ----
+    inset = 2 * _stroke_width(small) / scale + 2 if hierarchy else None
+    kept = boxes[_suppress(boxes, inset)]
+    return sorted(map(tuple, kept.tolist()), key=lambda r: r[0])
+
+
+def _box_cover(contour, tol=2):
+    # Fraction of the contour's bounding box perimeter traced by contour
+    # segments running along it (CHAIN_APPROX_SIMPLE keeps straight runs
+    # as single segments)
+    p = contour.reshape(-1, 2).astype(np.int64)
+    q = np.roll(p, -1, axis=0)
+    (x0, y0), (x1, y1) = p.min(axis=0), p.max(axis=0)
+    along = 0
+    for axis, edges in ((1, (y0, y1)), (0, (x0, x1))):
+        run = np.abs(q[:, 1 - axis] - p[:, 1 - axis])
+        for edge in edges:
+            on = (np.abs(p[:, axis] - edge) <= tol) & (np.abs(q[:, axis] - edge) <= tol)
+            along += run[on].sum()
+    perimeter = 2 * ((x1 - x0) + (y1 - y0))
+    return along / perimeter if perimeter else 0.0
+
+
+def _suppress(boxes, inset=None):
+    # Greedy non-max suppression over (x, y, w, h) rows, largest first ->
+    # indices kept. Flat (inset None): a box touching a kept one goes.
+    # Hierarchy: it goes when its IoU with a kept box passes NMS_IOU or it
+    # overlaps without nesting inside it by more than inset on every side
+    # (the inner edge of the same outline is not a nested block)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    area = (boxes[:, 2] + 1) * (boxes[:, 3] + 1)
+    order = np.argsort(-area, kind='stable')
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        # Inclusive pixel bounds, so boxes that only touch overlap
+        iw = np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]) + 1
+        ih = np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]) + 1
+        inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+        if inset is None:
+            drop = inter > 0
+        else:
+            iou = inter / (area[i] + area[rest] - inter)
+            nested = ((x1[rest] - x1[i] > inset) & (x2[i] - x2[rest] > inset) &
+                      (y1[rest] - y1[i] > inset) & (y2[i] - y2[rest] > inset))
+            drop = (iou > NMS_IOU) | ((inter > 0) & ~nested)
+        order = rest[~drop]
+    return keep
+
+
+def _detect_connections(small, scale, rects, containers=()):
+    # Wires between rects (full resolution, as returned by
+    # _detect_rectangles) found as Hough segments in the downscaled image,
+    # with the blocks blanked out -> [(src, src_port, dst, dst_port)].
+    # Ink is thickened so the Hough walk follows thin or aliased strokes
+    # without breaking up; containers (indices of rects holding others)
+    # lose only their outline, keeping the wires drawn inside
+    stroke = _stroke_width(small)
+    ink    = cv2.dilate((small < 128).astype(np.uint8), np.ones((3, 3), np.uint8))
+    margin = 2 * int(math.ceil(stroke)) + 1
+    boxes  = []
+    for i, (x, y, w, h) in enumerate(rects):
+        box = (x * scale, y * scale, w * scale, h * scale)
+        boxes.append(box)
+        x0, y0 = max(int(box[0]) - margin, 0), max(int(box[1]) - margin, 0)
+        x1, y1 = int(box[0] + box[2]) + margin + 1, int(box[1] + box[3]) + margin + 1
+        if i in containers:
+            band = 2 * margin + 1
+            ink[y0:y0 + band, x0:x1] = ink[y1 - band:y1, x0:x1] = 0
+            ink[y0:y1, x0:x0 + band] = ink[y0:y1, x1 - band:x1] = 0
+        else:
+            ink[y0:y1, x0:x1] = 0
+
+    length = max(4, int(2 * stroke))
+    lines  = cv2.HoughLinesP(ink, 1, np.pi / 180, threshold=length, minLineLength=length,
+                             maxLineGap=max(3, int(2 * stroke)))
+    if lines is None:
+        return []
+    segments = [tuple(l) for l in lines.reshape(-1, 4).astype(float).tolist()]
+
+    reach = int(3 * stroke) + 2
+    def head(x, y):
+        # Ink around a wire end: an arrowhead adds to the line itself
+        x, y = int(x), int(y)
+        return int(np.count_nonzero(ink[max(y - reach, 0):y + reach + 1,
+                                        max(x - reach, 0):x + reach + 1]))
+
+    return wire_connections(segments, boxes, 2 * margin, head, join=length)
+
+
+def _parents(rects):
+    # -> {i: the smallest rect holding rect i}, for nested rects only
+    index = GridIndex.for_rects(rects)
+    for i, r in enumerate(rects):
+        index.insert(i, r)
+    parents = {}
+    for i, r in enumerate(rects):
+        holders = [j for j in index.overlapping(r)
+                   if j != i and rects[j] != r and _inside(r, rects[j])]
+        if holders:
+            parents[i] = min(holders, key=lambda j: rects[j][2] * rects[j][3])
+    return parents
+
+
+def _connect_nested(mb, links, rects, parents):
+    # Connections never cross a System boundary (converter/subsystems.py),
+    # so wires are routed through port blocks: a wire from a container's
+    # inner edge to a block inside it starts at an Inport of that container
+    # (an Outport for the reverse), numbered top to bottom like the wires
+    # reaching the outer edge; a wire crossing container outlines is cut at
+    # each one, with a port block inside the container and new port numbers
+    # after those.
+    def systems(i):
+        # Containers holding i, innermost first, then the root (None)
+        chain = []
+        while i is not None:
+            i = parents.get(i)
+            chain.append(i)
+        return chain
+
+    edge_in, edge_out, direct = {}, {}, []
+    next_in, next_out = {}, {}
+    for s, sp, d, dp in links:
+        if s in systems(d):
+            edge_in.setdefault(s, []).append((s, d, dp))
+        elif d in systems(s):
+            edge_out.setdefault(d, []).append((s, sp, d))
+        else:
+            direct.append((s, sp, d, dp))
+            if parents.get(d) == parents.get(s):
+                next_in[d]  = max(next_in.get(d, 0), dp if dp < SPECIAL_PORT else 0)
+                next_out[s] = max(next_out.get(s, 0), sp)
+    for c, wires in edge_in.items():
+        next_in[c] = max(next_in.get(c, 0), len(wires))
+    for c, wires in edge_out.items():
+        next_out[c] = max(next_out.get(c, 0), len(wires))
+
+    def port(c, kind, k, y):
+        x, _, w, _ = rects[c]
+        name = f'In{k}' if kind == 'Inport' else f'Out{k}'
+        return mb.add_block(kind, name, x if kind == 'Inport' else x + w, y,
+                            params={'Port': str(k)}, parent=c)
+
+    def descend(src, src_port, system, d, dp):
+        # From a block in system down to d, entering each container between
+        path = systems(d)
+        for c in reversed(path[:path.index(system)]):
+            next_in[c] = k = next_in.get(c, 0) + 1
+            mb.connect(src, c, src_port, k)
+            src, src_port = port(c, 'Inport', k, rects[d][1]), 1
+        mb.connect(src, d, src_port, dp)
+
+    def ascend(s, sp, system):
+        # From s up to the block in system its signal leaves through
+        for c in systems(s)[:systems(s).index(system)]:
+            next_out[c] = k = next_out.get(c, 0) + 1
+            mb.connect(s, port(c, 'Outport', k, rects[s][1]), sp, 1)
+            s, sp = c, k
+        return s, sp
+
+    for c, wires in edge_in.items():
+        for k, (_, d, dp) in enumerate(sorted(wires, key=lambda w: rects[w[1]][1]), 1):
+            descend(port(c, 'Inport', k, rects[d][1]), 1, c, d, dp)
+    for c, wires in edge_out.items():
+        for k, (s, sp, _) in enumerate(sorted(wires, key=lambda w: rects[w[0]][1]), 1):
+            src, src_port = ascend(s, sp, c)
+            mb.connect(src, port(c, 'Outport', k, rects[s][1]), src_port, 1)
+    for s, sp, d, dp in direct:
+        common = next(c for c in systems(s) if c in systems(d))
+        src, src_port = ascend(s, sp, common)
+        descend(src, src_port, common, d, dp)
+
+
+def _inside(inner, outer):
+    return (outer[0] <= inner[0] and inner[0] + inner[2] <= outer[0] + outer[2] and
+            outer[1] <= inner[1] and inner[1] + inner[3] <= outer[1] + outer[3])
+
 
+def _detect_scale(gray):
+    scale = DETECT_MAX_SIDE / max(gray.shape)
+    if scale >= 1.0:
+        return 1.0
+    return min(1.0, max(scale, MIN_STROKE / _stroke_width(gray)))
 
-def _detect_rectangles(gray):
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    edged = cv2.Canny(blurred, 50, 150)
-    contours, _ = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-    rects = []
-    for c in contours:
-        approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
-        if len(approx) == 4:
-            x, y, w, h = cv2.boundingRect(approx)
-            if w > 30 and h > 20 and w < gray.shape[1] * 0.8:
-                rects.append((x, y, w, h))
+def _stroke_width(gray):
+    # 10th percentile of dark run lengths along sampled rows and columns:
+    # the width of the thin strokes (text, arrows), in pixels
+    runs = []
+    for lines in (gray[::max(gray.shape[0] // STROKE_SAMPLES, 1)],
+                  gray[:, ::max(gray.shape[1] // STROKE_SAMPLES, 1)].T):
+        dark  = np.pad(lines < 128, ((0, 0), (1, 1))).astype(np.int8)
+        steps = np.diff(dark, axis=1)
+        runs.append(np.nonzero(steps == -1)[1] - np.nonzero(steps == 1)[1])
+    runs = np.concatenate(runs)
+    return max(float(np.percentile(runs, 10)), 1.0) if runs.size else 1.0
 
-    filtered = []
-    for r in rects:
-        if not any(_overlaps(r, e) for e in filtered):
-            filtered.append(r)
 
-    return sorted(filtered, key=lambda r: r[0])
+def _to_full(start, size, scale, limit):
+    # Downscaled spans (arrays) as the full-resolution pixels they cover
+    lo = np.minimum(np.floor(start / scale), limit - 1).astype(np.int64)
+    hi = np.minimum(np.ceil((start + size) / scale), limit).astype(np.int64)
+    return lo, hi - lo
 
 
-def _overlaps(r1, r2):
-    return not (r1[0]+r1[2] < r2[0] or r2[0]+r2[2] < r1[0] or
-                r1[1]+r1[3] < r2[1] or r2[1]+r2[3] < r1[1])
+def _edges(gray):
+    # GaussianBlur + Canny; images past TILE pixels go tile by tile, each
+    # tile read with a HALO margin so seams see the same neighbourhood
+    height, width = gray.shape
+    if height <= TILE and width <= TILE:
+        return cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edged = np.empty_like(gray)
+    for y in range(0, height, TILE):
+        for x in range(0, width, TILE):
+            y0, x0 = max(y - HALO, 0), max(x - HALO, 0)
+            y1, x1 = min(y + TILE + HALO, height), min(x + TILE + HALO, width)
+            tile = cv2.Canny(cv2.GaussianBlur(gray[y0:y1, x0:x1], (5, 5), 0), 50, 150)
+            h, w = min(TILE, height - y), min(TILE, width - x)
+            edged[y:y+h, x:x+w] = tile[y-y0:y-y0+h, x-x0:x-x0+w]
+    return edged
 
 
 def _classify(text):
@@ -0,0 +1,78 @@
+# ================================================================
+# Multi-keyword counting: KeywordMatcher(words).count(chunks).
+#
+# Case-insensitive; every keyword is searched with str.count, so the
+# scanning runs in C, and a keyword found inside another ('mux' in
+# 'demux') is counted for both. Chunks (pages, text lines) are consumed
+# one at a time from any iterable and gathered into blocks of about
+# BLOCK_CHARS, each lowercased once and searched once per keyword, so
+# memory stays at one block whatever the document size; a keyword does
+# not span two chunks. Counting stops after the block in which the
+# result can no longer change or a budget is met, leaving the rest of a
+# lazy iterable unread.
+# ================================================================
+
+BLOCK_CHARS = 64 * 1024
+
+
+class KeywordMatcher:
+
+    def __init__(self, words):
+        self.words  = list(words)
+        self._lower = [w.lower() for w in self.words]
+
+    def count(self, chunks, cap=None, budget=None):
+        # -> {word: occurrences} over every chunk, each count capped at cap;
+        # stops once the capped counts add up to budget (the occurrences
+        # first in the text counting), or every word has reached cap
+        counts = [0] * len(self.words)
+        limit = cap if cap is not None else float('inf')
+        full = limit * len(self.words)
+        if budget is not None:
+            full = min(full, budget)
+        total = 0
+        active = list(range(len(self.words)))
+        for block in _blocks(chunks):
+            block = block.lower()
+            hits = {k: min(block.count(self._lower[k]), limit - counts[k]) for k in active}
+            if total + sum(hits.values()) >= full:
+                # The budget runs out in this block: keep the occurrences
+                # that come first in the text
+                for k in self._first(block, hits, full - total):
+                    counts[k] += 1
+                return self._result(counts)
+            for k, n in hits.items():
+                counts[k] += n
+                total += n
+            active = [k for k in active if counts[k] < limit]
+        return self._result(counts)
+
+    def _first(self, block, hits, n):
+        # -> indices of the first n keyword occurrences in block, in the
+        # order they end (the longer first where two end together)
+        found = []
+        for k, count in hits.items():
+            word = self._lower[k]
+            at = -len(word)
+            for _ in range(count):
+                at = block.find(word, at + len(word))
+                found.append((at + len(word), -len(word), k))
+        found.sort()
+        return [k for _, _, k in found[:n]]
+
+    def _result(self, counts):
+        return {w: n for w, n in zip(self.words, counts) if n}
+
+
+def _blocks(chunks):
+    # Chunks joined by newlines (which no keyword holds) into blocks of at
+    # least BLOCK_CHARS, the last one shorter
+    buf, size = [], 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= BLOCK_CHARS:
+            yield '\n'.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield '\n'.join(buf)
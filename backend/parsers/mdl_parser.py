@@ -1,125 +1,158 @@
 import re
 
-def parse_mdl(filepath):
-    blocks = []
-    connections = []
-    counter = [0]
-
-    def nid():
-        counter[0] += 1
-        return str(counter[0])
-
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        content = f.read()
-
-    content = content.replace('\r\n', '\n').replace('\r', '\n')
-
-    # ---- Parse ALL Block sections using brace matching ----
-    pos = 0
-    while pos < len(content):
-        m = re.search(r'\bBlock\s*\{', content[pos:])
-        if not m:
-            break
-        abs_start = pos + m.start()
-        brace_open = pos + m.end() - 1
-
-        # Find matching closing brace
-        depth = 0
-        bc = None
-        for i in range(brace_open, min(brace_open + 20000, len(content))):
-            if content[i] == '{': depth += 1
-            elif content[i] == '}':
-                depth -= 1
-                if depth == 0:
-                    bc = content[brace_open+1:i]
-                    break
-
-        if bc:
-            btype_m = re.search(r'^\s*BlockType\s+"?([^"\n]+)"?\s*$', bc, re.MULTILINE)
-            bname_m = re.search(r'^\s*Name\s+"?([^"\n]+)"?\s*$', bc, re.MULTILINE)
-            pos_m   = re.search(r'^\s*Position\s+\[([^\]]+)\]', bc, re.MULTILINE)
-
-            if btype_m:
-                btype = btype_m.group(1).strip().strip('"')
-                bname = bname_m.group(1).strip().strip('"').strip() if bname_m else ''
-
-                x, y = 0.0, 0.0
-                if pos_m:
-                    nums = re.findall(r'[-\d.]+', pos_m.group(1))
-                    if len(nums) >= 2:
-                        try: x, y = float(nums[0]), float(nums[1])
-                        except: pass
-
-                params = {}
-                for line in bc.split('\n'):
-                    line = line.strip()
-                    if not line or '{' in line or '}' in line: continue
-                    parts = line.split(None, 1)
-                    if len(parts) == 2:
-                        k = parts[0].strip()
-                        v = parts[1].strip().strip('"')
-                        params[k] = v
-
-                bid = nid()
-                bname = bname or f'Block_{bid}'
-                btype = _normalize(btype)
-
-                blocks.append({
-                    'id': bid, 'type': btype, 'name': bname,
-                    'x': x, 'y': y, 'params': params
-                })
-
-        pos = abs_start + 1
-
-    # ---- Build name->id map with all variants ----
-    name_to_id = {}
-    for b in blocks:
-        raw = b['name']
-        name_to_id[raw] = b['id']
-        name_to_id[raw.strip()] = b['id']
-        # Also store without newline escapes
-        clean = raw.replace('\\n', ' ').replace('\n', ' ').strip()
-        name_to_id[clean] = b['id']
-
-    def resolve(name):
-        if not name: return None
-        name = str(name).strip().strip('"')
-        if name in name_to_id: return name_to_id[name]
-        clean = name.replace('\\n', ' ').replace('\n', ' ').strip()
-        if clean in name_to_id: return name_to_id[clean]
-        # Try partial match
-        for k, v in name_to_id.items():
-            if k.strip() == name.strip(): return v
-        return None
-
-    # ---- Parse ALL Line connections ----
-    for lm in re.finditer(r'\bLine\s*\{(.*?)\n\s*\}', content, re.DOTALL):
-        lc = lm.group(1)
-        src = _val(lc, 'SrcBlock')
-        dst = _val(lc, 'DstBlock')
-        if src and dst:
-            sid = resolve(src)
-            did = resolve(dst)
-            if sid and did and sid != did:
-                connections.append({'from': sid, 'to': did})
-        # Branch connections
-        for bm in re.finditer(r'Branch\s*\{(.*?)\}', lc, re.DOTALL):
-            dst2 = _val(bm.group(1), 'DstBlock')
-            if src and dst2:
-                sid = resolve(src)
-                did = resolve(dst2)
-                if sid and did and sid != did:
-                    connections.append({'from': sid, 'to': did})
-
-    # Deduplicate
-    seen, unique = set(), []
-    for c in connections:
-        k = (c['from'], c['to'])
-        if k not in seen:
-            seen.add(k)
-            unique.append(c)
-
-    return blocks, unique
+from ir import ModelBuilder, port_number
+from metrics import stage
+from parsers.source import open_text
+
+
+class _Section:
+    __slots__ = ('kind', 'params', 'children')
+
+    def __init__(self, kind):
+        self.kind     = kind
+        self.params   = {}
+        self.children = []
+
+
+# ---- Tokenizer + parser ----
+# MDL is line oriented, so each physical line is exactly one token:
+#   'Key {'  opens a section      '}'  closes it
+#   'Key value'  is a parameter   '"..."'  continues the previous string value
+# Lines are read straight off the file object in a single pass and nothing is
+# re-scanned, so cost is linear in file size and sections have no size cap.
+
+def _parse_tree(lines):
+    root   = _Section('Root')
+    stack  = [root]
+    params = root.params
+    last   = None      # key of the previous parameter, for continuation lines
+    wrap   = None      # key of a matrix value still waiting for its ']'
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if wrap is not None:
+            # Unquoted matrix values may wrap: Value [1 2;\n 3 4]. A section
+            # line means the ']' never came; it is parsed as usual
+            if line == '}' or line.endswith(' {'):
+                wrap = None
+            else:
+                if line[0] == '"':
+                    line = line[1:-1] if len(line) > 1 and line[-1] == '"' else line[1:]
+                params[wrap] += ' ' + line
+                if ']' in line:
+                    wrap = None
+                continue
+        c = line[0]
+        if c == '}':
+            if len(stack) > 1:
+                stack.pop()
+                params = stack[-1].params
+            last = None
+        elif c == '"':
+            if last is not None:
+                params[last] += line[1:-1] if line[-1] == '"' else line[1:]
+        elif c != '#':
+            parts = line.split(None, 1)
+            key = parts[0]
+            if len(parts) == 1:
+                params[key] = ''
+                last = key
+                continue
+            value = parts[1]
+            if value == '{':
+                sec = _Section(key)
+                stack[-1].children.append(sec)
+                stack.append(sec)
+                params = sec.params
+                last = None
+                continue
+            if value[0] == '"':
+                # A quoted value continues on '"...' lines, never by wrapping
+                value = value[1:-1] if len(value) > 1 and value[-1] == '"' else value[1:]
+            elif value[0] == '[' and ']' not in value:
+                wrap = key
+            params[key] = value
+            last = key
+
+    return root
+
+
+def parse_mdl(source):
+    mb = ModelBuilder()
+
+    # Universal newlines handle \r\n and bare \r exports
+    with stage('tokenize'), open_text(source) as f:
+        root = _parse_tree(f)
+
+    # ---- Walk every System (root model and nested subsystems) ----
+    # Blocks are collected per System so Line names resolve in their own
+    # scope — two subsystems may both contain an "In1".
+    def walk(system, parent=None):
+        name_to_id = {}
+
+        for sec in system.children:
+            if sec.kind != 'Block':
+                continue
+            btype = sec.params.get('BlockType', '').strip().strip('"')
+            if not btype:
+                continue
+            bname = sec.params.get('Name', '').strip()
+
+            x, y = 0.0, 0.0
+            nums = re.findall(r'[-\d.]+', sec.params.get('Position', ''))
+            if len(nums) >= 2:
+                try: x, y = float(nums[0]), float(nums[1])
+                except: pass
+
+            bname = bname or f'Block_{len(mb.blocks) + 1}'
+            bid = mb.add_block(_normalize(btype), bname, x, y, dict(sec.params), parent=parent)
+            _remember(name_to_id, bname, bid)
+
+            for child in sec.children:
+                if child.kind == 'System':
+                    walk(child, bid)
+
+        def resolve(name):
+            if not name: return None
+            name = str(name).strip().strip('"')
+            if name in name_to_id: return name_to_id[name]
+            return name_to_id.get(_clean(name))
+
+        # ---- Line connections, including arbitrarily nested Branches ----
+        for sec in system.children:
+            if sec.kind != 'Line':
+                continue
+            sid = resolve(sec.params.get('SrcBlock'))
+            if sid is None:
+                continue
+            sport = port_number(sec.params.get('SrcPort'))
+            pending = [sec]
+            while pending:
+                node = pending.pop()
+                did = resolve(node.params.get('DstBlock'))
+                if did is not None:
+                    mb.connect(sid, did, sport, port_number(node.params.get('DstPort')))
+                pending += [c for c in reversed(node.children) if c.kind == 'Branch']
+
+    for top in root.children:
+        if top.kind == 'System':
+            walk(top)
+        for child in top.children:
+            if child.kind == 'System':
+                walk(child)
+
+    return mb.build()
+
+
+def _clean(name):
+    return name.replace('\\n', ' ').replace('\n', ' ').strip()
+
+
+def _remember(name_to_id, raw, bid):
+    for variant in (raw, raw.strip(), _clean(raw)):
+        name_to_id.setdefault(variant, bid)
 
 
 def _normalize(btype):
@@ -128,8 +161,3 @@ def _normalize(btype):
         'Math': 'MathFunction', 'Trigonometry': 'Trigonometry',
         'Logic': 'LogicOperator',
     }.get(btype, btype)
-
-
-def _val(content, key):
-    m = re.search(rf'^\s*{re.escape(key)}\s+"?([^"\n]+)"?\s*$', content, re.MULTILINE)
-    return m.group(1).strip().strip('"') if m else None
\ No newline at end of file
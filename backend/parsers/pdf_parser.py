@@ -1,5 +1,52 @@
-import fitz  # PyMuPDF
+import multiprocessing
+import os
 import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+from ir import ModelBuilder
+from metrics import stage
+from parsers.keywords import KeywordMatcher
+from parsers.source import is_path, read_bytes
+from parsers.spatial import GridIndex
+from parsers.wiring import wire_connections
+
+# ================================================================
+# PDF parser: parse_pdf(source).
+#
+# Simulink-exported PDFs are vector drawings. Blocks are closed shapes
+# (rectangles, rounded ports, sum circles), wires are open polylines
+# whose input ends carry a small filled arrowhead, and each block's name
+# is a line of text just below it. get_drawings() and get_text('dict')
+# give all three with exact coordinates, so blocks keep their drawn
+# position and wires are snapped to them (parsers/wiring.py). Each page
+# is its own diagram, stacked below the previous one; pages are read in
+# a process pool once there are enough of them to pay for it. The pool is
+# shared by every request of the process, and workers get the document as
+# a path (uploads held in memory are written to a temp file first), each
+# opening it once per run of pages.
+#
+# Documents with no drawn blocks (scans, text-only reports) fall back to
+# counting block keywords in the text, streamed line by line through one
+# Aho–Corasick pass (parsers/keywords.py).
+# ================================================================
+
+PDF_WORKERS    = int(os.environ.get('SIMTOC_PDF_WORKERS', os.cpu_count() or 1))
+PARALLEL_PAGES = 16        # fewer pages are read in-process
+CHUNKS_PER_WORKER = 4
+
+# In PDF points
+MIN_BLOCK = 8.0            # smallest block side
+WIRE_TOL  = 3.0            # wire end to block outline
+WIRE_JOIN = 1.0            # wire end to the segment it continues
+NAME_GAP  = 14.0           # block bottom to the top of its name
+PAGE_GAP  = 50.0           # between stacked pages
+
+DUPLICATE_IOU = 0.5        # fill + stroke, drop shadows
 
 KNOWN_BLOCKS = [
     'gain', 'sum', 'integrator', 'derivative', 'transfer function',
@@ -10,49 +57,311 @@ KNOWN_BLOCKS = [
     'discrete', 'zero order hold', 'from workspace', 'to workspace'
 ]
 
-def parse_pdf(filepath):
-    blocks = []
-    connections = []
-
-    doc = fitz.open(filepath)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text() + "\n"
-    doc.close()
-
-    found = _find_blocks(full_text)
-
-    counter = [0]
-    spacing = 150
-
-    for i, (btype, bname) in enumerate(found):
-        counter[0] += 1
-        blocks.append({
-            'id': str(counter[0]),
-            'type': btype,
-            'name': bname,
-            'x': float(50 + (i % 5) * spacing),
-            'y': float(100 + (i // 5) * spacing),
-            'params': {}
-        })
-
-    if len(blocks) > 1:
-        for i in range(len(blocks) - 1):
-            connections.append({'from': blocks[i]['id'], 'to': blocks[i+1]['id']})
-
-    if not blocks:
+# Block label -> Simulink type; first match wins, so longer names that
+# contain shorter ones come first
+LABEL_TYPES = [
+    ('discrete transfer fcn', 'DiscreteTransferFcn'),
+    ('transfer fcn', 'TransferFcn'), ('transfer function', 'TransferFcn'),
+    ('pid controller', 'PIDController'), ('pid', 'PIDController'),
+    ('zero-order hold', 'ZeroOrderHold'), ('zero order hold', 'ZeroOrderHold'),
+    ('unit delay', 'UnitDelay'), ('memory', 'Memory'),
+    ('integrator', 'Integrator'), ('derivative', 'Derivative'),
+    ('pulse generator', 'DiscretePulseGenerator'), ('sine wave', 'SineWave'),
+    ('step', 'Step'), ('constant', 'Constant'), ('gain', 'Gain'),
+    ('subsystem', 'SubSystem'), ('sum', 'Sum'), ('add', 'Sum'),
+    ('product', 'Product'), ('saturation', 'Saturation'), ('switch', 'Switch'),
+    ('demux', 'Demux'), ('mux', 'Mux'), ('scope', 'Scope'), ('display', 'Display'),
+    ('to workspace', 'ToWorkspace'), ('terminator', 'Terminator'),
+]
+
+# Glyphs Simulink draws inside unnamed blocks
+GLYPH_TYPES = [('1/s', 'Integrator'), ('du/dt', 'Derivative'), ('1/z', 'UnitDelay')]
+
+# Block type names, as printed inside blocks that show their type
+TYPE_NAMES = {t.lower(): t for t in [btype for _, btype in LABEL_TYPES] +
+              ['Inport', 'Outport', 'Trigonometry', 'MathFunction', 'Goto', 'From', 'Abs']}
+
+_PORT_NAME = re.compile(r'(in|out)(port)?\s*\d*$')
+
+# Text fallback: at most this many blocks per keyword
+KEYWORD_CAP = 3
+_MATCHER = KeywordMatcher(KNOWN_BLOCKS)
+
+
+def parse_pdf(source, pages=None, budget=None):
+    # source: a path or the document's bytes / binary file
+    # (parsers/source.py); pages: (start, stop) 0-based page indices to
+    # read, stop exclusive; budget: most blocks the text fallback may produce
+    if not is_path(source):
+        source = read_bytes(source)
+
+    # Pages are read and turned into blocks one at a time, never all held;
+    # the repeated stages are summed
+    mb = ModelBuilder()
+    records = _extract(source, pages)
+    top = 0.0
+    while True:
+        with stage('extract'):
+            page = next(records, None)
+        if page is None:
+            break
+        with stage('geometry'):
+            _add_page(mb, page, top)
+        top += page['height'] + PAGE_GAP
+
+    if not mb.blocks:
+        # No drawn blocks: count block keywords in the text, read page by
+        # page only until the budget is met
+        with stage('extract'):
+            found = _find_blocks(_page_text(source, pages), budget)
+
+        spacing = 150
+
+        for i, (btype, bname) in enumerate(found):
+            mb.add_block(btype, bname, 50 + (i % 5) * spacing, 100 + (i // 5) * spacing)
+
+        for i in range(len(mb.blocks) - 1):
+            mb.connect(i, i + 1)
+
+    if not mb.blocks:
         raise ValueError("No recognizable Simulink blocks found in this PDF.")
 
-    return blocks, connections
+    return mb.build()
+
+
+# ---- Extraction ----
+
+def _extract(source, pages=None):
+    # Yields one record per page, in page order
+    doc = _open(source)
+    try:
+        first, stop = _page_range(doc, pages)
+        count = stop - first
+        # Inside a pool worker (batch, jobs) the cores are already taken
+        if count < PARALLEL_PAGES or PDF_WORKERS < 2 or multiprocessing.parent_process():
+            for i in range(first, stop):
+                yield _read_page(doc[i])
+            return
+    finally:
+        doc.close()
+
+    step = -(-count // (PDF_WORKERS * CHUNKS_PER_WORKER))
+    starts = range(first, stop, step)
+    path, spilled = source, not is_path(source)
+    if spilled:
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(source)
+    pool = _pool()
+    try:
+        chunks = pool.map(_read_pages, [path] * len(starts), starts,
+                          [min(start + step, stop) for start in starts])
+        for chunk in chunks:
+            yield from chunk
+    except BrokenProcessPool:
+        _discard(pool)      # a worker died; the next document gets a new pool
+        raise
+    finally:
+        if spilled:
+            os.remove(path)
+
+
+def _page_text(source, pages=None):
+    # Yields each page's plain text, in page order, reading a page only
+    # when the next one is asked for
+    with _open(source) as doc:
+        first, stop = _page_range(doc, pages)
+        for i in range(first, stop):
+            yield doc[i].get_text()
+
+
+def _page_range(doc, pages):
+    first, stop = pages or (0, doc.page_count)
+    return max(first, 0), min(stop, doc.page_count)
+
+
+def _open(source):
+    if is_path(source):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype='pdf')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    # One pool per process, created on first use
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _executor
+
+
+def _discard(pool):
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+    pool.shutdown(wait=False)
+
+
+def _read_pages(path, start, stop):
+    # Runs in a pool process
+    with fitz.open(path) as doc:
+        return [_read_page(doc[i]) for i in range(start, stop)]
+
+
+def _read_page(page):
+    # -> {'width', 'height', 'blocks', 'segments', 'heads', 'lines'}: plain
+    # tuples, so records pickle cheaply back from pool processes
+    width, height = page.rect.width, page.rect.height
+    shapes, segments, heads = [], [], []
+    for path in page.get_drawings():
+        edges = []
+        for item in path['items']:
+            if item[0] == 're':
+                shapes.append(_box(item[1]))
+            elif item[0] == 'qu':
+                shapes.append(_box(item[1].rect))
+            elif item[0] == 'l':
+                edges.append((item[1], item[2]))
+            elif item[0] == 'c':
+                edges.append((item[1], item[4]))    # the chord of a curve
+        if not edges:
+            continue
+        closed = path.get('closePath') or edges[0][0] == edges[-1][1]
+        if closed:
+            box = _box(path['rect'])
+            if max(box[2], box[3]) >= MIN_BLOCK:
+                shapes.append(box)
+                continue
+            # Too small for a block: an arrowhead, part of its wire as well
+            heads.append(box)
+        segments.extend((p.x, p.y, q.x, q.y) for p, q in edges)
+
+    blocks = [r for r in shapes
+              if r[2] >= MIN_BLOCK and r[3] >= MIN_BLOCK and r[2] < width * 0.8]
+
+    # Labels only matter next to blocks; a page without any is left to the
+    # text fallback, which reads its text itself
+    lines = []
+    for block in page.get_text('dict')['blocks'] if blocks else ():
+        for line in block.get('lines', ()):
+            text = ''.join(span['text'] for span in line['spans']).strip()
+            if text:
+                lines.append((*line['bbox'], text))
+
+    return {'width': width, 'height': height, 'blocks': _dedupe(blocks),
+            'segments': segments, 'heads': heads, 'lines': lines}
+
+
+# ---- Geometry to blocks and wires ----
+
+def _add_page(mb, page, top):
+    rects = page['blocks']
+    if not rects:
+        return
+    names, inside = _labels(rects, page['lines'])
+
+    first = len(mb.blocks)
+    for i, (x, y, w, h) in enumerate(rects):
+        btype = _classify(names[i], inside[i])
+        mb.add_block(btype, names[i] or f'{btype}_{first + i + 1}', x, y + top)
+
+    heads = GridIndex.for_rects(page['heads'])
+    for k, (x, y, w, h) in enumerate(page['heads']):
+        heads.insert(k, (x - WIRE_TOL, y - WIRE_TOL, w + 2 * WIRE_TOL, h + 2 * WIRE_TOL))
+
+    def head(x, y):
+        return len(heads.at_point(x, y))
+
+    for src, src_port, dst, dst_port in wire_connections(page['segments'], rects, WIRE_TOL,
+                                                         head, join=WIRE_JOIN):
+        mb.connect(first + src, first + dst, src_port, dst_port)
+
+
+def _labels(rects, lines):
+    # -> (name, text inside) per rect. Text inside goes to the innermost
+    # rect holding its centre; a name is the nearest line starting within
+    # NAME_GAP below a rect and centred over it
+    index = GridIndex.for_rects(rects)
+    for i, (x, y, w, h) in enumerate(rects):
+        index.insert(i, (x, y, w, h + NAME_GAP))
+
+    inside = [[] for _ in rects]
+    below  = {}
+    for x0, y0, x1, y1, text in lines:
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        hits = index.at_point(cx, cy)
+        holders = [k for k in hits if cy <= rects[k][1] + rects[k][3]]
+        if holders:
+            inside[min(holders, key=lambda k: rects[k][2] * rects[k][3])].append(text)
+            continue
+        for k in index.at_point(cx, y0):
+            gap = y0 - rects[k][1] - rects[k][3]
+            if 0 <= gap and (k not in below or gap < below[k][0]):
+                below[k] = (gap, text)
+
+    names = [below[k][1] if k in below else '' for k in range(len(rects))]
+    return names, [' '.join(t) for t in inside]
+
+
+def _classify(name, inside):
+    label = name.lower()
+    if _PORT_NAME.match(label):
+        return 'Inport' if label.startswith('in') else 'Outport'
+    for key, btype in LABEL_TYPES:
+        if key in label:
+            return btype
+    text = inside.lower().replace(' ', '')
+    if text in TYPE_NAMES:
+        return TYPE_NAMES[text]
+    for glyph, btype in GLYPH_TYPES:
+        if glyph in text:
+            return btype
+    for key, btype in LABEL_TYPES:
+        if key.replace(' ', '') in text:
+            return btype
+    return 'SubSystem'
+
+
+# ---- Helpers ----
+
+def _box(rect):
+    return (rect.x0, rect.y0, rect.width, rect.height)
+
+
+def _dedupe(rects):
+    # Largest first; a rect mostly covering a kept one (the same block
+    # drawn as fill and stroke, or its drop shadow) is dropped, nested
+    # blocks are not
+    index = GridIndex.for_rects(rects)
+    kept = []
+    for r in sorted(rects, key=lambda r: -r[2] * r[3]):
+        if not any(_iou(r, kept[k]) > DUPLICATE_IOU for k in index.overlapping(r)):
+            index.insert(len(kept), r)
+            kept.append(r)
+    return sorted(kept, key=lambda r: (r[1], r[0]))
+
+
+def _iou(a, b):
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
 
 
-def _find_blocks(text):
+def _find_blocks(chunks, budget=None):
+    # chunks: any iterable of text, read only until the budget is met; the
+    # matcher never counts past it
+    counts = _MATCHER.count(chunks, cap=KEYWORD_CAP, budget=budget)
     found = []
-    tl = text.lower()
     for name in KNOWN_BLOCKS:
-        if name in tl:
-            btype = name.title().replace(' ', '')
-            count = min(tl.count(name), 3)
-            for i in range(count):
-                found.append((btype, f'{btype}_{i+1}'))
-    return found
\ No newline at end of file
+        btype = name.title().replace(' ', '')
+        for i in range(counts.get(name, 0)):
+            found.append((btype, f'{btype}_{i+1}'))
+    return found
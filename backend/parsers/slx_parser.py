@@ -1,7 +1,160 @@
 import zipfile
 import xml.etree.ElementTree as ET
 
-def parse_slx(filepath):
+from ir import Model, ModelBuilder, port_number
+from metrics import stage
+from parsers.source import as_binary
+
+# Archive parts that actually describe the model; everything else
+# (configSet, metadata, coreProperties, graphical interface...) is skipped.
+MODEL_PARTS = ('simulink/blockdiagram.xml',)
+SYSTEM_PREFIX = 'simulink/systems/'
+
+
+def parse_slx(source, stream=True):
+    # source: a path or the archive's bytes / binary file (parsers/source.py)
+    source = as_binary(source)
+    if stream:
+        try:
+            with zipfile.ZipFile(source, 'r') as z:
+                parts = [f for f in z.namelist()
+                         if f in MODEL_PARTS or
+                         (f.startswith(SYSTEM_PREFIX) and f.endswith('.xml'))]
+                if parts:
+                    with stage('xml'):
+                        model = _parse_streaming(z, parts)
+                    if model.blocks:
+                        return model
+        except zipfile.BadZipFile:
+            raise ValueError("Invalid .slx file — file may be corrupted.")
+
+    return _parse_full(source)
+
+
+def _parse_streaming(z, parts):
+    mb = ModelBuilder()
+    sid_to_id = {}
+    lines = []          # (src endpoint, [dst endpoints]) — resolved once every part is read
+    refs  = {}          # systems/<ref>.xml -> id of the SubSystem block that owns it
+    tops  = {}          # part -> ids of blocks directly in that part's System
+
+    for part in parts:
+        top = tops[part] = []
+        with z.open(part) as f:
+            try:
+                _stream_part(f, mb, sid_to_id, lines, refs, top)
+            except ET.ParseError:
+                continue
+
+    # R2019b+ keeps each subsystem's contents in its own part
+    for part, ids in tops.items():
+        owner = refs.get(part.rsplit('/', 1)[-1][:-len('.xml')])
+        if owner is not None:
+            for i in ids:
+                mb.blocks[i].parent = owner
+
+    for (src, sport), dsts in lines:
+        sid = sid_to_id.get(src)
+        if sid is None:
+            continue
+        for dst, dport in dsts:
+            did = sid_to_id.get(dst)
+            if did is not None:
+                mb.connect(sid, did, sport, dport)
+
+    return mb.build()
+
+
+def _stream_part(f, mb, sid_to_id, lines, refs, top):
+    # iterparse keeps only the open path from the root to the current
+    # element; each Block/Line is read at its end event and then everything
+    # but pending P/Branch children is detached from its parent, so memory
+    # stays flat however large the System gets.
+    stack  = []
+    owners = []     # per open Block: [ids of blocks in its nested System, System refs]
+    for event, elem in ET.iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            if stack and _local(elem.tag) == 'Block' and _local(stack[-1].tag) == 'System':
+                owners.append([[], []])
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        tag = _local(elem.tag)
+
+        # Block defaults live under BlockParameterDefaults, not a System
+        in_system = parent is not None and _local(parent.tag) == 'System'
+
+        if tag == 'Block' and in_system:
+            kids, sub_refs = owners.pop()
+            if elem.get('BlockType'):
+                bid = _add_block(elem, mb, sid_to_id)
+                for k in kids:
+                    mb.blocks[k].parent = bid
+                for ref in sub_refs:
+                    refs[ref] = bid
+                (owners[-1][0] if owners else top).append(bid)
+
+        elif tag == 'System' and elem.get('Ref') and owners:
+            owners[-1][1].append(elem.get('Ref'))
+
+        elif tag == 'Line' and in_system:
+            src = _line_endpoint(elem, 'Src')
+            dsts = [_line_endpoint(b, 'Dst') for b in elem.iter()
+                    if _local(b.tag) in ('Line', 'Branch')]
+            dsts = [d for d in dsts if d]
+            if src and dsts:
+                lines.append((src, dsts))
+
+        elif tag in ('P', 'Branch'):
+            # Still needed by the enclosing Block or Line
+            continue
+
+        if parent is not None:
+            parent.remove(elem)
+        elem.clear()
+
+
+def _add_block(elem, mb, sid_to_id):
+    params = {}
+    for p in elem:
+        if _local(p.tag) == 'P' and p.get('Name') and p.text:
+            params[p.get('Name')] = p.text.strip()
+
+    x, y = 0.0, 0.0
+    coords = params.get('Position', '').strip('[]').split(',')
+    if len(coords) >= 2:
+        try: x, y = float(coords[0]), float(coords[1])
+        except ValueError: pass
+
+    name = elem.get('Name') or f'Block_{len(mb.blocks) + 1}'
+    sid = elem.get('SID')
+    bid = mb.add_block(elem.get('BlockType'), name, x, y, params, key=sid)
+    if sid:
+        sid_to_id[sid] = bid
+    return bid
+
+
+def _line_endpoint(elem, name):
+    # <P Name="Src">12#out:1</P> -> ('12', 1); older files use an attribute
+    value = elem.get(name)
+    if not value:
+        for p in elem:
+            if _local(p.tag) == 'P' and p.get('Name') == name:
+                value = p.text
+                break
+    if not value:
+        return None
+    sid, _, port = value.strip().partition('#')
+    return sid, port_number(port.rpartition(':')[2])
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1] if '}' in tag else tag
+
+
+def _parse_full(source):
     blocks = []
     connections = []
     counter = [0]
@@ -11,7 +164,7 @@ def parse_slx(filepath):
         return str(counter[0])
 
     try:
-        with zipfile.ZipFile(filepath, 'r') as z:
+        with zipfile.ZipFile(source, 'r') as z:
             xml_files = [f for f in z.namelist() if f.endswith('.xml')]
 
             for xml_file in xml_files:
@@ -68,7 +221,7 @@ def parse_slx(filepath):
         blocks = _sample_blocks()
         connections = _sample_connections()
 
-    return blocks, connections
+    return Model.from_dicts(blocks, connections)
 
 
 def _sample_blocks():
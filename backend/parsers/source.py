@@ -0,0 +1,78 @@
+import io
+import os
+import re
+import zipfile
+
+# ================================================================
+# Parser inputs. Every parser takes a source that is either a path or
+# the upload itself: bytes, bytearray, memoryview or a binary file
+# object, so an upload held in memory is parsed without a round trip
+# through the disk. sniff(source) names the format from its contents.
+# ================================================================
+
+MAGIC = [
+    (b'%PDF-', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'PK\x03\x04', 'slx'),         # zip container, if it holds a model
+    (b'BM', 'bmp'),
+]
+
+# MDL is plain text: a Model or Library section, after any comments
+_MDL = re.compile(rb'\s*(?:#[^\n]*\n\s*)*(?:Model|Library)\s*\{')
+SNIFF_BYTES = 4096
+
+
+def sniff(source):
+    # -> parser extension for the contents of source (a path or bytes),
+    # None if unknown. Given only the leading bytes of a zip container it
+    # cannot tell a model from any other zip (.docx, .zip) and says None
+    if is_path(source):
+        with open(source, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    else:
+        head = bytes(source[:SNIFF_BYTES])
+    for magic, ext in MAGIC:
+        if head.startswith(magic):
+            return ext if ext != 'slx' or _is_slx(source) else None
+    if _MDL.match(head.lstrip(b'\xef\xbb\xbf')):
+        return 'mdl'
+    return None
+
+
+def _is_slx(source):
+    # An SLX is an OPC package ([Content_Types].xml and parts) holding the
+    # model under simulink/; other packages (.docx) keep theirs elsewhere
+    try:
+        with zipfile.ZipFile(as_binary(source)) as z:
+            return any(n.startswith('simulink/') for n in z.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def read_bytes(source):
+    # The whole source as a bytes-like object
+    if is_path(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'read'):
+        return source.read()
+    return bytes(source) if isinstance(source, memoryview) else source
+
+
+def as_binary(source):
+    # A path or a seekable binary file, for APIs that take either (zipfile)
+    if is_path(source) or hasattr(source, 'read'):
+        return source
+    return io.BytesIO(source)
+
+
+def open_text(source):
+    # Text stream with universal newlines; undecodable bytes are dropped
+    if is_path(source):
+        return open(source, 'r', encoding='utf-8', errors='ignore')
+    return io.TextIOWrapper(as_binary(source), encoding='utf-8', errors='ignore')
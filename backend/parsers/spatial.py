@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+
+class GridIndex:
+    # Uniform-grid spatial hash over axis-aligned (x, y, w, h) rectangles.
+    # Point and rectangle queries only look at the cells they touch, so they
+    # cost O(items per cell) instead of O(all items).
+
+    def __init__(self, cell_size):
+        self.cell  = max(int(cell_size), 1)
+        self.cells = defaultdict(list)
+        self.rects = {}
+
+    @classmethod
+    def for_rects(cls, rects):
+        # Cell about the size of a typical rectangle keeps buckets small
+        if not rects:
+            return cls(64)
+        sides = sorted(max(r[2], r[3]) for r in rects)
+        return cls(sides[len(sides) // 2])
+
+    def _span(self, x, y, w, h):
+        c = self.cell
+        return range(int(x) // c, int(x + w) // c + 1), range(int(y) // c, int(y + h) // c + 1)
+
+    def insert(self, key, rect):
+        self.rects[key] = rect
+        xs, ys = self._span(*rect)
+        for cx in xs:
+            for cy in ys:
+                self.cells[(cx, cy)].append(key)
+
+    def at_point(self, px, py):
+        c = self.cell
+        hits = []
+        for key in self.cells.get((int(px) // c, int(py) // c), ()):
+            x, y, w, h = self.rects[key]
+            if x <= px <= x + w and y <= py <= y + h:
+                hits.append(key)
+        return hits
+
+    def overlapping(self, rect):
+        x, y, w, h = rect
+        xs, ys = self._span(x, y, w, h)
+        seen, hits = set(), []
+        for cx in xs:
+            for cy in ys:
+                for key in self.cells.get((cx, cy), ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    rx, ry, rw, rh = self.rects[key]
+                    if not (x + w < rx or rx + rw < x or y + h < ry or ry + rh < y):
+                        hits.append(key)
+        return hits
@@ -0,0 +1,159 @@
+import math
+from bisect import bisect_right
+
+from ir import SPECIAL_PORT
+from parsers.spatial import GridIndex
+
+# ================================================================
+# Wiring from geometry: wire_connections(segments, rects, tol, head).
+#
+# Line segments (from a Hough transform over an image, or the strokes of
+# a vector drawing) are joined into wires wherever the end of one lies on
+# another: continuations, bends and T-junction branches join, plain
+# crossings do not. The ends of a wire are then snapped to the block
+# rectangles they land on. Simulink draws inputs on a block's left side
+# and outputs on its right, so the side gives the direction; for a wire
+# with neither, head(x, y) — how much arrowhead there is at an end —
+# tells which end points at its destination. Input ports are numbered
+# top to bottom along the left side; wires landing on the top or bottom
+# (enable/trigger) get SPECIAL_PORT. A wire reaching a container's outline
+# from inside reads the other way round: the left side feeds the blocks
+# inside, the right side collects from them; those ends are numbered apart
+# from the ones outside.
+#
+# Joining and snapping both go through GridIndex, so the cost grows with
+# the number of segments, not with its square.
+# ================================================================
+
+
+def wire_connections(segments, rects, tol, head=None, join=None):
+    # segments [(x1, y1, x2, y2)] and rects [(x, y, w, h)] in the same
+    # units; tol is how far an end may be from the block it lands on, join
+    # (default tol) how far from the segment it continues.
+    # -> sorted [(src rect, src port, dst rect, dst port)]
+    if not segments or not rects:
+        return []
+    n = len(segments)
+    join = tol if join is None else join
+
+    # ---- Join segments into wires ----
+    boxes = [(min(x1, x2) - join, min(y1, y2) - join, abs(x2 - x1) + 2 * join, abs(y2 - y1) + 2 * join)
+             for x1, y1, x2, y2 in segments]
+    index = GridIndex.for_rects(boxes)
+    for i, box in enumerate(boxes):
+        index.insert(i, box)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, (x1, y1, x2, y2) in enumerate(segments):
+        for px, py in ((x1, y1), (x2, y2)):
+            for j in index.at_point(px, py):
+                if j != i and _distance(px, py, segments[j]) <= join:
+                    a, b = find(i), find(j)
+                    if a != b:
+                        parent[a] = b
+
+    # ---- Snap segment ends to blocks ----
+    blocks = GridIndex.for_rects(rects)
+    for k, (x, y, w, h) in enumerate(rects):
+        blocks.insert(k, (x - tol, y - tol, w + 2 * tol, h + 2 * tol))
+    touches = {}            # wire -> {rect: (gap, side, x, y, inner)}
+    mx = lambda i: (segments[i][0] + segments[i][2]) / 2
+    my = lambda i: (segments[i][1] + segments[i][3]) / 2
+    for i, (x1, y1, x2, y2) in enumerate(segments):
+        for px, py in ((x1, y1), (x2, y2)):
+            # Inside a block (a subsystem holding others) counts only near
+            # its outline
+            near = [_side(px, py, rects[k]) + (k,) for k in blocks.at_point(px, py)]
+            near = [t for t in near if t[0] <= tol]
+            if not near:
+                continue
+            gap, side, k = min(near)
+            # Reaching the outline from inside: the segment lies in the rect
+            inner = _contains(rects[k], mx(i), my(i))
+            if inner:
+                side = _FLIP.get(side, side)
+            wire = touches.setdefault(find(i), {})
+            if k not in wire or gap < wire[k][0]:
+                wire[k] = (gap, side, px, py, inner)
+
+    # ---- Direction of each wire ----
+    edges = []
+    for wire in touches.values():
+        if len(wire) < 2:
+            continue
+        srcs  = [k for k, t in wire.items() if t[1] == 'right']
+        dsts  = [k for k, t in wire.items() if t[1] == 'left']
+        other = [k for k, t in wire.items() if t[1] not in ('left', 'right')]
+        if srcs:
+            dsts += other
+        elif dsts:
+            srcs = other
+        elif head is not None and len(other) == 2:
+            a, b = other
+            ha, hb = head(*wire[a][2:4]), head(*wire[b][2:4])
+            if ha != hb:
+                srcs, dsts = ([a], [b]) if hb > ha else ([b], [a])
+        for s in srcs:
+            for d in dsts:
+                if s != d:
+                    edges.append((s, wire[s], d, wire[d]))
+
+    # ---- Port numbers from the order along each side ----
+    outs, ins = {}, {}
+    for s, (_, side, _, sy, sin), d, (_, dside, _, dy, din) in edges:
+        if side == 'right':
+            outs.setdefault((s, sin), []).append(sy)
+        if dside == 'left':
+            ins.setdefault((d, din), []).append(dy)
+    outs = {k: _ranks(ys, tol) for k, ys in outs.items()}
+    ins  = {k: _ranks(ys, tol) for k, ys in ins.items()}
+
+    found = set()
+    for s, (_, side, _, sy, sin), d, (_, dside, _, dy, din) in edges:
+        sp = outs[s, sin](sy) if side == 'right' else 1
+        dp = ins[d, din](dy) if dside == 'left' else SPECIAL_PORT
+        found.add((s, sp, d, dp))
+    return sorted(found)
+
+
+# ---- Helpers ----
+
+def _distance(px, py, seg):
+    # Point to segment distance
+    x1, y1, x2, y2 = seg
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def _side(px, py, rect):
+    # -> (distance to the nearest side, that side)
+    x, y, w, h = rect
+    return min((abs(px - x), 'left'), (abs(px - x - w), 'right'),
+               (abs(py - y), 'top'), (abs(py - y - h), 'bottom'))
+
+
+_FLIP = {'left': 'right', 'right': 'left'}
+
+
+def _contains(rect, px, py):
+    x, y, w, h = rect
+    return x < px < x + w and y < py < y + h
+
+
+def _ranks(values, tol):
+    # -> value -> 1-based rank, values closer than tol sharing a rank
+    starts = []
+    prev = None
+    for v in sorted(values):
+        if prev is None or v - prev > tol:
+            starts.append(v)
+        prev = v
+    return lambda v: bisect_right(starts, v + 1e-9) or 1
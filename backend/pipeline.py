@@ -0,0 +1,94 @@
+from parsers import PARSER_VERSION
+from parsers.slx_parser import parse_slx
+from parsers.mdl_parser import parse_mdl
+from parsers.pdf_parser import parse_pdf
+from parsers.image_parser import parse_image
+from converter import GENERATOR_VERSION
+from converter.c_code_generator import generate_c_code
+from converter.incremental import generate_incremental, diff_snapshots
+from converter.optimize import optimize_model, report_comment
+from converter.schedule import schedule
+from metrics import stage
+
+PARSERS = {
+    'slx':  parse_slx,
+    'mdl':  parse_mdl,
+    'pdf':  parse_pdf,
+    'png':  parse_image,
+    'jpg':  parse_image,
+    'jpeg': parse_image,
+    'bmp':  parse_image,
+}
+
+# Part of every cache key — a parser or generator bump invalidates old results
+VERSION = f'p{PARSER_VERSION}-g{GENERATOR_VERSION}'
+
+
+def parse_model(source, ext):
+    # source: a path, or the file's contents as bytes or a binary file
+    # object (parsers/source.py)
+    with stage('parse'):
+        return PARSERS[ext](source)
+
+
+def convert_file(source, ext, progress=None, options=None):
+    # progress(stage, fraction) is called as each stage starts; options are
+    # generate_c_code() keyword arguments
+    report = progress or (lambda stage, fraction: None)
+
+    options = dict(options or {})
+    optimize = options.pop('optimize', False)
+
+    report('parsing', 0.1)
+    model = parse_model(source, ext)
+    emitted = model
+    if optimize:
+        report('optimizing', 0.5)
+        with stage('optimize'):
+            emitted, removed = optimize_model(model)
+    report('generating', 0.6)
+    with stage('generate'):
+        c_code = generate_c_code(emitted, **options)
+    report('serializing', 0.9)
+    # The diagram always shows the model as drawn
+    if not optimize:
+        return _result(model, c_code)
+    result = _result(model, report_comment(removed) + c_code)
+    result['optimization'] = removed
+    return result
+
+
+def convert_incremental(source, ext, previous=None):
+    # -> (result, snapshot). With a previous snapshot only the changed part
+    # of the model is re-emitted and result['diff'] describes the change.
+    model = parse_model(source, ext)
+    with stage('generate'):
+        c_code, snapshot = generate_incremental(model, previous)
+    result = _result(model, c_code)
+    if previous is not None:
+        with stage('diff'):
+            result['diff'] = diff_snapshots(previous, snapshot)
+    return result, snapshot
+
+
+def schedule_summary(model):
+    # Evaluation order as the generator schedules it, by diagram block id
+    with stage('topo'):
+        return schedule(model).to_dict()
+
+
+def diagram_summary(model):
+    # The light half of a result: everything except the C source
+    with stage('diagram'):
+        diagram = model.to_diagram()
+    return {
+        'diagram': diagram,
+        'block_count': len(model.blocks),
+        'connection_count': len(model.connections)
+    }
+
+
+def _result(model, c_code):
+    result = {'success': True, 'c_code': c_code}
+    result.update(diagram_summary(model))
+    return result
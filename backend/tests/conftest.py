@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Backend modules import each other top-level (from ir import ...), as when
+# app.py is run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
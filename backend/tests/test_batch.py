@@ -0,0 +1,46 @@
+import io
+import os
+import zipfile
+
+import batch
+from batch import iter_batch
+
+MDL = b'''Model {
+  System {
+    Block {
+      BlockType Gain
+      Name "G"
+    }
+  }
+}
+'''
+_convert = batch._convert_member
+
+
+def _crash_on_marker(filepath, ext):
+    with open(filepath, 'rb') as f:
+        if b'CRASH' in f.read():
+            os._exit(1)     # a worker killed mid-conversion (OOM, SIGKILL)
+    return _convert(filepath, ext)
+
+
+def _archive(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_crashing_member_fails_alone(monkeypatch):
+    monkeypatch.setattr(batch, '_convert_member', _crash_on_marker)
+    members = [(f'm{i}.mdl', MDL) for i in range(6)]
+    members.insert(2, ('bad.mdl', MDL.replace(b'"G"', b'"CRASH"')))
+    lines = list(iter_batch(_archive(members), workers=2))
+
+    summary = lines.pop()
+    assert summary == {'done': True, 'total': 7, 'succeeded': 6, 'failed': 1}
+    by_name = {line['file']: line for line in lines}
+    assert not by_name['bad.mdl']['success']
+    assert 'crashed' in by_name['bad.mdl']['error']
+    assert all(by_name[f'm{i}.mdl']['block_count'] == 1 for i in range(6))
@@ -0,0 +1,13 @@
+import pytest
+
+from bench import _timing
+
+
+def test_timing_is_the_last_stderr_line():
+    assert _timing('model chatter\n12.500\n') == 12.5
+
+
+@pytest.mark.parametrize('stderr', ['', '\n', 'closed\n', 'nan\n', '-1.0\n'])
+def test_missing_timing_is_a_runtime_error(stderr):
+    with pytest.raises(RuntimeError, match='no timing'):
+        _timing(stderr)
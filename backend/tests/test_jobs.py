@@ -0,0 +1,70 @@
+import os
+import time
+
+import pytest
+
+import jobs
+from jobs import JobRunner, JobStore
+
+MDL = b'''Model {
+  System {
+    Block {
+      BlockType Gain
+      Name "G"
+    }
+  }
+}
+'''
+
+
+def _crash(store_root, job_id, filepath, ext):
+    os._exit(1)     # a worker killed mid-job (OOM, SIGKILL)
+
+
+def _wait(store, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job still {job["status"]}')
+
+
+def _runner(tmp_path):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    return JobRunner(JobStore(str(tmp_path / 'jobs')), str(uploads), max_workers=1)
+
+
+def test_job_on_crashed_worker_fails_and_pool_recovers(tmp_path, monkeypatch):
+    runner = _runner(tmp_path)
+    monkeypatch.setattr(jobs, '_run_job', _crash)
+    job = runner.submit(MDL, 'm.mdl', 'mdl')
+    failed = _wait(runner.store, job['id'])
+    assert failed['status'] == 'failed'
+    assert 'crashed' in failed['error']
+    assert os.listdir(runner.upload_dir) == []
+
+    monkeypatch.undo()
+    job = runner.submit(MDL, 'm.mdl', 'mdl')
+    assert _wait(runner.store, job['id'])['status'] == 'done'
+    assert runner.store.get_result(job['id'])['block_count'] == 1
+    assert runner._pending == 0
+
+
+def test_failed_submit_is_rolled_back(tmp_path, monkeypatch):
+    runner = _runner(tmp_path)
+
+    def refuse(*args):
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+    monkeypatch.setattr(runner, '_submit', refuse)
+    spilled = tmp_path / 'upload.mdl'
+    spilled.write_bytes(MDL)
+    with pytest.raises(RuntimeError):
+        runner.submit(str(spilled), 'm.mdl', 'mdl')
+    assert runner._pending == 0
+    assert os.listdir(runner.store.root) == []
+    assert os.listdir(runner.upload_dir) == []
+    assert spilled.read_bytes() == MDL
@@ -0,0 +1,25 @@
+from parsers.keywords import BLOCK_CHARS, KeywordMatcher
+
+WORDS = ['gain', 'mux', 'demux', 'sum']
+
+
+def test_counts_match_str_count_case_insensitively():
+    lines = ['Gain -> DeMux', 'sum of gains', 'MUX mux', 'nothing here']
+    text = '\n'.join(lines).lower()
+    expected = {w: text.count(w) for w in WORDS if w in text}
+    assert KeywordMatcher(WORDS).count(lines) == expected
+    assert KeywordMatcher(WORDS).count(lines, cap=1) == {w: 1 for w in expected}
+
+
+def test_budget_keeps_first_occurrences_and_stops_reading():
+    read = []
+
+    def chunks():
+        yield 'sum gain demux'
+        for i in range(100):
+            read.append(i)
+            yield 'x' * BLOCK_CHARS + ' gain'
+
+    # 'mux' ends with 'demux'; the longer keyword is counted first
+    assert KeywordMatcher(WORDS).count(chunks(), cap=3, budget=3) == {'sum': 1, 'gain': 1, 'demux': 1}
+    assert len(read) == 1
@@ -0,0 +1,48 @@
+from parsers.mdl_parser import _parse_tree, parse_mdl
+
+
+def test_unclosed_bracket_in_quoted_value_does_not_swallow_sections():
+    mdl = b'''Model {
+  System {
+    Block {
+      BlockType Gain
+      Name "G"
+      MaskDescription "[see manual"
+    }
+    Block {
+      BlockType Terminator
+      Name "T"
+    }
+    Line {
+      SrcBlock "G"
+      SrcPort 1
+      DstBlock "T"
+      DstPort 1
+    }
+  }
+}
+'''
+    model = parse_mdl(mdl)
+    assert [b.name for b in model.blocks] == ['G', 'T']
+    assert len(model.connections) == 1
+    assert model.blocks[0].params['MaskDescription'] == '[see manual'
+
+
+def test_wrapped_matrix_joins_quoted_continuation_lines():
+    root = _parse_tree('''Block {
+  Value [0.1 0.2 0.3
+  "0.4 0.5]"
+  Name "x"
+}'''.splitlines())
+    assert root.children[0].params == {'Value': '[0.1 0.2 0.3 0.4 0.5]', 'Name': 'x'}
+
+
+def test_unclosed_matrix_stops_at_section_end():
+    root = _parse_tree('''Block {
+  Value [1 2
+}
+Block {
+  Name "y"
+}'''.splitlines())
+    assert root.children[0].params == {'Value': '[1 2'}
+    assert root.children[1].params == {'Name': 'y'}